@@ -1,11 +1,12 @@
 # add_user.py
-import os
 import psycopg2  # MUDANÇA: Importa a biblioteca para PostgreSQL
 from psycopg2 import errors # MUDANÇA: Para tratar erros específicos do PG
 from flask_bcrypt import Bcrypt
 from dotenv import load_dotenv
 import getpass
 
+import db
+
 # Carrega as variáveis de ambiente do ficheiro .env
 load_dotenv()
 
@@ -13,28 +14,6 @@ load_dotenv()
 bcrypt = Bcrypt()
 
 
-def get_db_connection():
-    """Cria uma conexão com o banco de dados PostgreSQL."""
-    try:
-        # Prioriza a conexão via DATABASE_URL, comum em serviços de hospedagem
-        conn_str = os.environ.get('DATABASE_URL')
-        if conn_str:
-            conn = psycopg2.connect(conn_str)
-        else:
-            # MUDANÇA: Usa psycopg2.connect e nomes de variáveis de ambiente padrão
-            conn = psycopg2.connect(
-                host=os.environ.get('DB_HOST'),
-                dbname=os.environ.get('DB_NAME'),
-                user=os.environ.get('DB_USER'),
-                password=os.environ.get('DB_PASSWORD'),
-                port=os.environ.get('DB_PORT', 5432)
-            )
-        return conn
-    except psycopg2.Error as e:
-        print(f"Erro fatal ao conectar ao banco de dados: {e}")
-        exit()
-
-
 def add_new_user():
     """Função principal para adicionar um novo usuário."""
     print("--- Adicionar Novo Usuário ---")
@@ -50,9 +29,16 @@ def add_new_user():
 
     password_hash = bcrypt.generate_password_hash(password).decode('utf-8')
 
+    try:
+        pool = db.get_pool()
+    except psycopg2.Error as e:
+        print(f"Erro fatal ao conectar ao banco de dados: {e}")
+        exit()
+
     conn = None
+    cursor = None
     try:
-        conn = get_db_connection()
+        conn = pool.getconn()
         cursor = conn.cursor()
 
         sql_insert_query = """
@@ -79,10 +65,11 @@ def add_new_user():
             conn.rollback()
 
     finally:
-        # MUDANÇA: A verificação conn.is_connected() não é necessária
-        if conn:
+        # MUDANÇA: A conexão volta para o pool compartilhado (db.py)
+        if cursor:
             cursor.close()
-            conn.close()
+        if conn:
+            pool.putconn(conn)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,450 @@
+# ai_json.py
+"""Extração tolerante do JSON contido nas respostas do modelo.
+
+O modelo nem sempre responde com JSON puro: às vezes vem texto antes ou
+depois, cercas de código (```json), vírgulas sobrando ou faltando, aspas
+simples, literais do Python (True/None) ou a resposta é cortada no meio (limite de
+tokens). Em vez de falhar — e o usuário tentar de novo, dobrando a carga no
+modelo — repair() localiza o primeiro objeto/array aproveitável (pulando chaves
+que fazem parte do texto, como "{sobre frações}") e corrige esses
+defeitos; numa resposta truncada, descarta o último valor incompleto (ex.: a
+opção que estava sendo escrita) e fecha o que ficou aberto.
+
+Funciona também de forma incremental, sobre os trechos de llm.stream():
+- Extractor.feed(trecho) entrega cada item de um array de primeiro nível
+  assim que ele fecha (geração em lote);
+- first_value(trechos) para de ler o modelo assim que o primeiro valor JSON
+  completo aparece (geração de uma questão).
+
+As métricas (stats()) contam as extrações, os reparos por tipo e quantos
+reparos evitaram uma nova chamada ao modelo (record_outcome, chamado depois
+da validação do esquema).
+"""
+import re
+import json
+import threading
+
+_LITERALS = {'true': 'true', 'false': 'false', 'null': 'null',
+             'True': 'true', 'False': 'false', 'None': 'null'}
+_BARE = re.compile(r'[A-Za-z0-9_+\-.]')
+_CLOSERS = {'{': '}', '[': ']'}
+_START = re.compile(r'[{\[]')
+
+
+class _Repairer:
+    """Reescreve um trecho (a partir do primeiro '{' ou '[') como JSON válido."""
+
+    def __init__(self, text, start):
+        self.text = text
+        self.i = start
+        self.out = []
+        self.stack = []        # [abertura, esperado, início em out] por contêiner
+        self.repairs = set()
+        self.safe = None       # (len(out), pilha) após o último valor completo
+        self.end = None        # posição logo após o valor raiz
+        self.stopped_at = None # onde a leitura parou, se o valor ficou incompleto
+
+    def cut_mid_text(self):
+        """O valor ficou incompleto antes do fim do texto: não é uma resposta cortada,
+        e sim um trecho que não é JSON (ex.: "a questão {sobre frações}: {...}")."""
+        return self.stopped_at is not None and self.text[self.stopped_at:].strip() != ''
+
+    def _mark_safe(self):
+        self.safe = (len(self.out), [list(frame) for frame in self.stack])
+
+    def _value_done(self):
+        if not self.stack:
+            self.end = self.i
+            return
+        self.stack[-1][1] = 'comma'
+        self._mark_safe()
+
+    def _read_string(self, quote):
+        """Lê uma string (aspas duplas ou simples); retorna o literal JSON ou None se truncada."""
+        text = self.text
+        i = self.i + 1
+        chars = []
+        while i < len(text):
+            ch = text[i]
+            if ch == '\\' and i + 1 < len(text):
+                nxt = text[i + 1]
+                if quote == "'" and nxt == "'":
+                    chars.append("'")
+                else:
+                    chars.append(ch + nxt)
+                i += 2
+                continue
+            if ch == quote:
+                self.i = i + 1
+                if quote == "'":
+                    self.repairs.add('aspas_simples')
+                return '"' + ''.join(chars) + '"'
+            if ch == '"':
+                chars.append('\\"')
+            elif ch == '\n':
+                chars.append('\\n')
+                self.repairs.add('quebra_de_linha')
+            elif ch == '\t':
+                chars.append('\\t')
+            else:
+                chars.append(ch)
+            i += 1
+        self.i = len(text)
+        return None
+
+    def run(self):
+        text = self.text
+        while self.i < len(text) and self.end is None:
+            ch = text[self.i]
+            frame = self.stack[-1] if self.stack else None
+            expect = frame[1] if frame else 'value'
+
+            if ch.isspace():
+                self.out.append(ch)
+                self.i += 1
+            elif ch in '{[':
+                if expect == 'comma' and frame[0] == '[':
+                    expect = self._missing_comma(frame)
+                if expect != 'value' and frame:
+                    return self._finish_truncated()
+                self.stack.append([ch, 'key' if ch == '{' else 'value', len(self.out)])
+                self.out.append(ch)
+                self.i += 1
+                self._mark_safe()
+            elif ch in '}]':
+                if not self.stack:
+                    self.i += 1
+                    continue
+                if self.stack[-1][0] != ('{' if ch == '}' else '['):
+                    # fechamento trocado ("[{...]"): fecha o contêiner interno primeiro
+                    self.repairs.add('fechamento')
+                    self.out.append(_CLOSERS[self.stack.pop()[0]])
+                    continue
+                if self.stack[-1][1] in ('colon', 'value') and self.stack[-1][0] == '{':
+                    # chave sem valor antes do fechamento
+                    return self._finish_truncated()
+                self._strip_trailing_comma()
+                self.out.append(ch)
+                self.stack.pop()
+                self.i += 1
+                self._value_done()
+            elif ch == ',':
+                self.i += 1
+                rest = text[self.i:].lstrip()
+                if rest[:1] in ('}', ']'):
+                    self.repairs.add('virgula_final')
+                    continue
+                if expect != 'comma':
+                    self.repairs.add('virgula_extra')
+                    continue
+                self.out.append(',')
+                frame[1] = 'key' if frame[0] == '{' else 'value'
+            elif ch == ':':
+                self.out.append(':')
+                self.i += 1
+                if frame:
+                    frame[1] = 'value'
+            elif ch in '"\'':
+                literal = self._read_string(ch)
+                if literal is None:
+                    return self._finish_truncated()
+                if expect == 'comma':
+                    expect = self._missing_comma(frame)
+                self.out.append(literal)
+                if expect == 'key':
+                    frame[1] = 'colon'
+                else:
+                    self._value_done()
+            elif _BARE.match(ch):
+                j = self.i
+                while j < len(text) and _BARE.match(text[j]):
+                    j += 1
+                word = text[self.i:j]
+                if j == len(text) and self.stack:
+                    # pode ser um número/literal cortado
+                    self.i = j
+                    return self._finish_truncated()
+                self.i = j
+                if expect == 'comma':
+                    expect = self._missing_comma(frame)
+                if expect == 'key':
+                    self.out.append(json.dumps(word))
+                    self.repairs.add('chave_sem_aspas')
+                    frame[1] = 'colon'
+                elif word in _LITERALS:
+                    if word != _LITERALS[word]:
+                        self.repairs.add('literal_python')
+                    self.out.append(_LITERALS[word])
+                    self._value_done()
+                else:
+                    try:
+                        float(word)
+                        self.out.append(word)
+                    except ValueError:
+                        self.out.append(json.dumps(word))
+                        self.repairs.add('texto_sem_aspas')
+                    self._value_done()
+            else:
+                # caractere estranho fora de string: ignorado
+                self.repairs.add('caractere_invalido')
+                self.i += 1
+        if self.stack:
+            return self._finish_truncated()
+        return ''.join(self.out)
+
+    def _missing_comma(self, frame):
+        """Um valor (ou chave) logo depois de outro valor completo — "[1 2]",
+        '{"a": "b" "c": "d"}', "} {": insere a vírgula. Retorna o novo estado esperado."""
+        self.out.append(',')
+        self.repairs.add('virgula_ausente')
+        frame[1] = 'key' if frame[0] == '{' else 'value'
+        return frame[1]
+
+    def _strip_trailing_comma(self):
+        while self.out and self.out[-1].isspace():
+            self.out.pop()
+        if self.out and self.out[-1] == ',':
+            self.out.pop()
+            self.repairs.add('virgula_final')
+
+    def _finish_truncated(self):
+        """Resposta cortada: volta ao último valor completo e fecha os contêineres abertos."""
+        self.repairs.add('truncado')
+        self.stopped_at = self.i
+        if self.safe is None:
+            return None
+        length, stack = self.safe
+        del self.out[length:]
+        # objeto incompleto dentro de uma lista (ex.: a opção que estava sendo escrita) é descartado inteiro
+        while len(stack) >= 2 and stack[-1][0] == '{' and stack[-2][0] == '[':
+            del self.out[stack.pop()[2]:]
+        self._strip_trailing_comma()
+        self.repairs.discard('virgula_final')
+        for opening, _, _ in reversed(stack):
+            self.out.append(_CLOSERS[opening])
+        self.end = len(self.text)
+        return ''.join(self.out)
+
+
+def strip_fences(text):
+    return (text or '').strip().replace('```json', '').replace('```', '').strip()
+
+
+def repair(text):
+    """(json_texto, reparos) do primeiro objeto/array em `text`; json_texto é None se não houver.
+
+    `reparos` é um conjunto com os nomes das correções aplicadas (vazio se o JSON já era válido).
+    Um candidato que não fecha antes do fim do texto (chaves no meio da prosa) é
+    pulado e a busca continua depois dele; se nenhum outro servir, vale o primeiro.
+    """
+    text = text or ''
+    pos = 0
+    first = None
+    while True:
+        match = _START.search(text, pos)
+        if not match:
+            break
+        repairer = _Repairer(text, match.start())
+        result = repairer.run()
+        if result is not None and not repairer.cut_mid_text() and _is_json(result):
+            return result, _with_extra_text(text, match.start(), repairer)
+        if first is None:
+            first = (result, match.start(), repairer)
+        pos = max(repairer.stopped_at or 0, match.start() + 1)
+    if first is None:
+        return None, set()
+    result, start, repairer = first
+    return result, _with_extra_text(text, start, repairer)
+
+
+def _is_json(result):
+    try:
+        json.loads(result)
+        return True
+    except json.JSONDecodeError:
+        return False
+
+
+def _with_extra_text(text, start, repairer):
+    repairs = repairer.repairs
+    before = strip_fences(text[:start])
+    after = strip_fences(text[repairer.end:]) if repairer.end is not None else ''
+    if before or after:
+        repairs.add('texto_extra')
+    return repairs
+
+
+def _decode(text):
+    result, repairs = repair(text)
+    if result is None:
+        return None, repairs
+    try:
+        return json.loads(result), repairs
+    except json.JSONDecodeError:
+        return None, repairs
+
+
+def extract(text):
+    """(valor, reparos): o primeiro valor JSON de `text`, corrigido se preciso; valor None se não houver."""
+    value, repairs = _decode(text)
+    record(repairs, ok=value is not None)
+    return value, repairs
+
+
+def parse(text):
+    """JSON decodificado de uma resposta do modelo, ou None se não der para aproveitar."""
+    if not text:
+        return None
+    value, repairs = extract(text)
+    if value is None:
+        print(f"Erro ao decodificar JSON da IA ({', '.join(sorted(repairs)) or 'sem JSON'}).")
+        print(f"Texto recebido: {strip_fences(text)[:500]}")
+    return value
+
+
+# --- EXTRAÇÃO INCREMENTAL ---
+
+class Extractor:
+    """Acompanha a resposta em streaming e separa os valores de primeiro nível.
+
+    Dentro de um array raiz, cada objeto é entregue por feed() assim que fecha;
+    fora de um array, o próprio objeto raiz é entregue quando fecha. finish()
+    tenta aproveitar o que ficou aberto quando a resposta termina (truncada).
+    Um objeto raiz que não é JSON ou um array sem objetos (chaves no meio da
+    prosa: "a questão {sobre frações}: {...}") é ignorado e a busca continua.
+    """
+
+    def __init__(self):
+        self.buffer = []          # texto recebido (para finish)
+        self.done = False
+        self._restart()
+
+    def _restart(self):
+        self.depth = 0
+        self.root = None          # '[' ou '{'
+        self.quote = None
+        self.escaped = False
+        self.current = []
+        self.items = 0            # objetos entregues do array raiz atual
+
+    def feed(self, chunk):
+        """Lista de (valor, reparos) dos itens completados por este trecho."""
+        items = []
+        self.buffer.append(chunk)
+        for ch in chunk:
+            if self.done:
+                break
+            if self.current or (ch in '{[' and self._starts_item(ch)):
+                self.current.append(ch)
+            if self.quote:
+                if self.escaped:
+                    self.escaped = False
+                elif ch == '\\':
+                    self.escaped = True
+                elif ch == self.quote:
+                    self.quote = None
+                continue
+            if ch in '"\'' and self.depth:
+                self.quote = ch
+            elif ch in '{[':
+                if self.root is None:
+                    self.root = ch
+                self.depth += 1
+            elif ch in '}]' and self.depth:
+                self.depth -= 1
+                if self.root == '{' and self.depth == 0:
+                    value, repairs = _decode(''.join(self.current))
+                    if value is None:
+                        self._restart()
+                        continue
+                    record(repairs, ok=True)
+                    items.append((value, repairs))
+                    self.current = []
+                elif self.root == '[' and self.depth == 1 and self.current:
+                    items.append(extract(''.join(self.current)))
+                    self.items += 1
+                    self.current = []
+                if self.depth == 0:
+                    if self.root == '[' and not self.items:
+                        self._restart()
+                    else:
+                        self.done = True
+        return items
+
+    def _starts_item(self, ch):
+        # item = objeto dentro do array raiz, ou o próprio valor raiz quando não é array
+        if self.root is None:
+            return ch == '{'
+        return self.root == '[' and self.depth == 1
+
+    def finish(self):
+        """(valor, reparos) do item deixado aberto por uma resposta cortada, ou None."""
+        if self.done or not self.current:
+            return None
+        value, repairs = extract(''.join(self.current))
+        self.current = []
+        return (value, repairs) if value is not None else None
+
+
+def iter_array_items(chunks):
+    """Gera (valor, reparos) para cada objeto do array à medida que os trechos chegam;
+    valor None quando o item não pôde ser aproveitado.
+    """
+    extractor = Extractor()
+    for chunk in chunks:
+        yield from extractor.feed(chunk)
+        if extractor.done:
+            return
+    last = extractor.finish()
+    if last:
+        yield last
+
+
+def first_value(chunks):
+    """(valor, reparos) do primeiro objeto JSON da resposta, parando de ler assim que ele fecha."""
+    extractor = Extractor()
+    texto = []
+    for chunk in chunks:
+        texto.append(chunk)
+        items = extractor.feed(chunk)
+        if items:
+            return items[0]
+    return extract(''.join(texto))
+
+
+# --- MÉTRICAS ---
+
+_lock = threading.Lock()
+_metrics = {'extracoes': 0, 'sem_reparo': 0, 'reparadas': 0, 'falhas': 0,
+            'retries_evitados': 0, 'reparadas_invalidas': 0, 'por_reparo': {}}
+
+
+def record(repairs, ok):
+    with _lock:
+        _metrics['extracoes'] += 1
+        if not ok:
+            _metrics['falhas'] += 1
+        elif repairs:
+            _metrics['reparadas'] += 1
+        else:
+            _metrics['sem_reparo'] += 1
+        for name in repairs:
+            _metrics['por_reparo'][name] = _metrics['por_reparo'].get(name, 0) + 1
+
+
+def record_outcome(repairs, valid):
+    """Depois da validação do esquema: um JSON reparado e válido é uma nova chamada ao modelo a menos."""
+    if not repairs:
+        return
+    with _lock:
+        if valid:
+            _metrics['retries_evitados'] += 1
+        else:
+            _metrics['reparadas_invalidas'] += 1
+
+
+def stats():
+    with _lock:
+        data = {k: (dict(v) if isinstance(v, dict) else v) for k, v in _metrics.items()}
+    data['taxa_reparo'] = data['reparadas'] / data['extracoes'] if data['extracoes'] else 0.0
+    return data
@@ -1,57 +1,90 @@
 # app.py
 import os
-import io
+import time
+import threading
 import json
 import base64
+import hashlib
 from datetime import datetime
 import psycopg2
 from psycopg2.extras import DictCursor
 from flask import (Flask, render_template, request, redirect, url_for,
-                   flash, session, jsonify, Response, send_file, send_from_directory)
+                   flash, session, jsonify, Response, send_file, g)
 from flask_bcrypt import Bcrypt
 from dotenv import load_dotenv
 from functools import wraps
+from collections import OrderedDict
 import magic
-import uuid
-import requests
 from email.message import EmailMessage
 import smtplib
 
 # --- IMPORTAÇÃO PARA A API DO GOOGLE ---
 from googleapiclient.discovery import build
-
-import google.generativeai as genai
-
-from fpdf import FPDF
-from docx import Document
-from docx.shared import Pt, Inches
+import httplib2
+
+import db
+import media_store
+import image_pipeline
+import image_fetch
+import llm
+import intent_classifier
+import generation_cache
+import ai_json
+import question_batch
+import question_search
+import question_loader
+import question_options
+import import_questoes
+import exporters
+import export_jobs
+import export_cache
+import session_store
+import conversations
 
 load_dotenv()
 
 app = Flask(__name__)
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024
 app.secret_key = os.environ.get('SECRET_KEY', 'uma-chave-secreta-forte-para-desenvolvimento')
-
-UPLOAD_FOLDER = os.path.join(app.root_path, 'static', 'uploads')
-if not os.path.exists(UPLOAD_FOLDER):
-    os.makedirs(UPLOAD_FOLDER)
-app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+# Sessão guardada no servidor; o cookie leva só um id opaco (ver session_store.py)
+session_store.init_app(app)
 
 bcrypt = Bcrypt(app)
 
+# Colunas do schema lidas na inicialização (db.schema); se o banco ainda não responder,
+# a leitura fica para o primeiro uso
+try:
+    db.schema.refresh()
+except Exception as e:
+    print(f"Aviso: schema não carregado na inicialização ({e}); será lido no primeiro uso.")
+
+# Imagens de questões/opções ficam no media store, endereçadas pelo SHA-256 (ver media_store.py)
+media = media_store.get_store()
+export_cache_store = export_cache.get_cache()
+# Questões geradas pela IA, por parâmetros do pedido (ver generation_cache.py)
+question_generation_cache = generation_cache.get_cache()
+
 # --- CONFIGURAÇÃO DAS APIs ---
-genai.configure(api_key=os.environ.get("GEMINI_API_KEY"))
+# O modelo (Gemini ou o backend falso de testes) é configurado em llm.py
 GOOGLE_API_KEY = os.environ.get("GOOGLE_SEARCH_API_KEY")
 SEARCH_ENGINE_ID = os.environ.get("SEARCH_ENGINE_ID")
 
-generation_config = {
-    "temperature": 0.7,
-    "top_p": 1,
-    "top_k": 1,
-    "max_output_tokens": 8192,
-}
-# --- CORREÇÃO DO NOME DO MODELO APLICADA AQUI ---
-model = genai.GenerativeModel(model_name="gemini-1.5-flash", generation_config=generation_config)
+# Cliente da Custom Search montado uma única vez (documento de descoberta embutido na biblioteca).
+# O transporte httplib2 não é thread-safe, então cada thread usa o seu (_search_http).
+IMAGE_SEARCH_TIMEOUT = float(os.environ.get('IMAGE_SEARCH_TIMEOUT', 5))
+_search_service = None
+_search_service_lock = threading.Lock()
+_search_http = threading.local()
+
+
+def get_search_service():
+    global _search_service
+    if _search_service is None:
+        with _search_service_lock:
+            if _search_service is None:
+                _search_service = build("customsearch", "v1", developerKey=GOOGLE_API_KEY,
+                                        cache_discovery=False)
+    return _search_service
 
 
 def custom_search_images(query):
@@ -60,13 +93,14 @@ def custom_search_images(query):
         print("AVISO: Chave da API do Google ou ID do Motor de Busca não configurados.")
         return []
     try:
-        service = build("customsearch", "v1", developerKey=GOOGLE_API_KEY)
-        res = service.cse().list(
+        if not hasattr(_search_http, 'http'):
+            _search_http.http = httplib2.Http(timeout=IMAGE_SEARCH_TIMEOUT)
+        res = get_search_service().cse().list(
             q=query,
             cx=SEARCH_ENGINE_ID,
             searchType='image',
             num=5
-        ).execute()
+        ).execute(http=_search_http.http)
         return res.get('items', [])
     except Exception as e:
         print(f"Erro ao chamar a Custom Search API: {e}")
@@ -74,129 +108,246 @@ def custom_search_images(query):
 
 
 def get_db_connection():
-    """Estabelece uma conexão com o banco de dados PostgreSQL."""
-    try:
-        conn_str = os.environ.get('DATABASE_URL')
-        if conn_str:
-            conn = psycopg2.connect(conn_str)
-        else:
-            conn = psycopg2.connect(
-                host=os.environ.get('DB_HOST'),
-                dbname=os.environ.get('DB_NAME'),
-                user=os.environ.get('DB_USER'),
-                password=os.environ.get('DB_PASSWORD'),
-                port=os.environ.get('DB_PORT', 5432)
-            )
-        return conn
-    except psycopg2.Error as e:
-        print(f"Erro ao conectar ao banco de dados PostgreSQL: {e}")
-        raise e
+    """Retorna a conexão PostgreSQL do request atual.
+    A conexão é retirada do pool (db.py) no primeiro uso e devolvida em teardown_appcontext,
+    então as rotas não devem fechá-la.
+    """
+    if 'db_conn' not in g:
+        try:
+            g.db_conn = db.get_pool().getconn()
+        except psycopg2.Error as e:
+            print(f"Erro ao conectar ao banco de dados PostgreSQL: {e}")
+            raise e
+    return g.db_conn
+
+
+@app.teardown_appcontext
+def release_db_connection(exception):
+    """Devolve ao pool a conexão usada no request (faz rollback do que não foi confirmado)."""
+    conn = g.pop('db_conn', None)
+    if conn is not None:
+        db.get_pool().putconn(conn)
 
 
 def clean_and_parse_json(response_text):
     """Limpa e tenta decodificar uma string JSON da resposta da IA."""
-    if not response_text:
-        return None
-    clean_text = response_text.strip().replace('```json', '').replace('```', '').strip()
-    try:
-        return json.loads(clean_text)
-    except json.JSONDecodeError as e:
-        print(f"Erro ao decodificar JSON da IA: {e}")
-        print(f"Texto recebido: {clean_text}")
-        return None
+    return ai_json.parse(response_text)
 
 
-@app.route('/uploads/<filename>')
-def uploaded_file(filename):
-    return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+def generate_question_json(prompt, defaults=None):
+    """Gera uma questão com o modelo e retorna o JSON validado; levanta ValueError se vier inválido.
+
+    A resposta é lida em streaming e a leitura para assim que o objeto da questão
+    fecha (ai_json.first_value); JSON com defeitos é reparado antes da validação.
+    """
+    chunks = llm.stream(prompt)
+    try:
+        question_json, repairs = ai_json.first_value(chunks)
+    finally:
+        chunks.close()
+    try:
+        return question_batch.parse_question(question_json, repairs, defaults)
+    except ValueError as e:
+        raise ValueError(f"A IA não retornou um JSON de questão válido: {e}")
 
 
 def search_questions_in_db(query_term):
-    """Busca questões no banco de dados pelo termo fornecido."""
-    conn = get_db_connection()
-    cursor = conn.cursor(cursor_factory=DictCursor)
-    like_term = f"%{query_term}%"
-    cursor.execute("SELECT id, enunciado FROM questoes WHERE is_active = TRUE AND enunciado ILIKE %s LIMIT 10",
-                   (like_term,))
-    results = cursor.fetchall()
-    cursor.close()
-    conn.close()
-    return results
+    """Busca questões no banco de dados pelo termo fornecido (busca textual ranqueada)."""
+    cursor = get_db_connection().cursor(cursor_factory=DictCursor)
+    try:
+        return question_search.search(cursor, query_term, limit=10, columns=('id', 'enunciado'))
+    finally:
+        cursor.close()
 
 
 def insert_question_in_db(question_data):
-    """Insere uma nova questão e suas opções no banco de dados."""
+    """Insere uma nova questão e suas opções no banco de dados.
+    A questão passa pelas mesmas regras de validação/correção da geração em lote (question_batch.py).
+    """
     conn = get_db_connection()
     cursor = conn.cursor()
     try:
-        dificuldade_map = {'FACIL': 'Fácil', 'MEDIO': 'Médio', 'DIFICIL': 'Difícil', 'MUITO_DIFICIL': 'Muito Difícil'}
-        nivel_dificuldade_ia = question_data.get('nivel_dificuldade', 'MEDIO').upper()
-        nivel_dificuldade_db = dificuldade_map.get(nivel_dificuldade_ia, 'Médio')
-
-        tipo_questao_ia = question_data.get('tipo_questao', 'ESCOLHA_UNICA').upper()
-        valid_types = ['ESCOLHA_UNICA', 'MULTIPLA_ESCOLHA', 'DISCURSIVA']
-        tipo_questao_db = tipo_questao_ia if tipo_questao_ia in valid_types else 'ESCOLHA_UNICA'
-
-        imagem_dados = None
-        imagem_path = question_data.get('imagem_path')
-        if imagem_path and os.path.exists(imagem_path):
-            with open(imagem_path, 'rb') as f:
-                imagem_dados = f.read()
+        questao = question_batch.normalize_question(question_data)
 
-        sql_questao = """
-                      INSERT INTO questoes (enunciado, tipo_questao, autor_id, nivel_dificuldade, grau_ensino,
-                                            area_conhecimento, imagem_url)
-                      VALUES (%s, %s, %s, %s, %s, %s, %s) RETURNING id
-                      """
-        cursor.execute(sql_questao, (
-            question_data.get('enunciado'),
-            tipo_questao_db,
-            session['user_id'],
-            nivel_dificuldade_db,
-            question_data.get('grau_ensino'),
-            question_data.get('area_conhecimento'),
-            imagem_dados
-        ))
-        questao_id = cursor.fetchone()[0]
-
-        if 'opcoes' in question_data and questao_id:
-            for opcao in question_data['opcoes']:
-                sql_opcao = "INSERT INTO opcoes (questao_id, texto_opcao, is_correta) VALUES (%s, %s, %s)"
-                cursor.execute(sql_opcao, (questao_id, opcao.get('texto_opcao'), bool(opcao.get('is_correta'))))
+        # A imagem sugerida pela IA já foi gravada no media store durante o fluxo do chat
+        if questao.get('imagem_hash') and not media.exists(questao['imagem_hash']):
+            questao.pop('imagem_hash')
+            questao.pop('imagem_mime', None)
 
+        questao_id = question_batch.bulk_insert(cursor, [questao], session['user_id'])[0]
         conn.commit()
         return questao_id
-    except psycopg2.Error as e:
+    except (psycopg2.Error, ValueError) as e:
         print(f"Erro ao inserir questão via IA: {e}")
         conn.rollback()
         return None
     finally:
         if cursor: cursor.close()
-        if conn: conn.close()
 
 
-def get_user_data():
-    """Busca os dados do usuário, mas NUNCA guarda a foto na sessão."""
-    if 'user_id' not in session:
+# --- IMAGENS ---
+def store_image(dados):
+    """Normaliza uma imagem (image_pipeline.py) e grava-a no media store (endereçado por conteúdo).
+    Retorna (mime, hash) — (None, None) se não houver dados — e levanta ValueError se não for uma imagem.
+    As variantes (miniatura, exportacao) são geradas em segundo plano.
+    """
+    if not dados:
         return None, None
-    nome_completo = f"{session.get('user_nome', '')} {session.get('user_sobrenome', '')}".strip()
-    foto_perfil_url = None
-    conn = None
+    return store_normalized_image(image_pipeline.run(image_pipeline.normalize, dados))
+
+
+def store_normalized_image(imagem):
+    """Grava uma imagem já normalizada (image_pipeline.NormalizedImage); retorna (mime, hash)."""
+    imagem_hash = media.put(imagem.data)
+    image_pipeline.submit(_save_variants, imagem_hash, imagem.data)
+    return imagem.mime, imagem_hash
+
+
+def _save_variants(imagem_hash, dados):
+    """Tarefa do pool de imagens: gera as variantes fora do request, com conexão própria."""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor(cursor_factory=DictCursor)
-        cursor.execute('SELECT foto_perfil FROM usuarios WHERE id = %s', (session['user_id'],))
-        user = cursor.fetchone()
-        if user and user.get('foto_perfil'):
-            data = user['foto_perfil']
-            foto_perfil_url = data.decode('utf-8') if isinstance(data, (bytes, bytearray)) else data
-    except psycopg2.Error as e:
-        print(f"Erro ao buscar dados do usuário: {e}")
+        with db.get_pool().connection() as conn:
+            media_store.save_variants(conn, media, imagem_hash, dados)
+    except Exception as e:
+        print(f"Erro ao gerar variantes da imagem {imagem_hash}: {e}")
+
+
+def load_image_bytes(imagem_hash, legacy_bytes=None):
+    """Bytes de uma imagem: do BYTEA legado (linhas não migradas) ou do media store."""
+    if legacy_bytes is not None:
+        return bytes(legacy_bytes)
+    return media.get(imagem_hash)
+
+
+def media_url(kind, row_id, imagem_hash, variante=None):
+    """URL versionada (imutável) de uma imagem servida por /media/<kind>/<id>.
+    `variante` escolhe uma das versões reduzidas de image_pipeline.VARIANTS.
+    """
+    if not imagem_hash:
+        return None
+    params = {f'{kind}_id': row_id, 'v': imagem_hash[:16]}
+    if variante:
+        params['variante'] = variante
+    return url_for('media_' + kind, **params)
+
+
+def send_image(etag, mimetype, load_bytes, versioned=False, last_modified=None):
+    """Resposta cacheável para uma imagem: ETag, Last-Modified e Range.
+    Quando o If-None-Match do cliente confere, responde 304 sem chamar load_bytes().
+    """
+    if request.if_none_match.contains(etag):
+        rv = Response(status=304)
+        data = None
+    else:
+        data = load_bytes()
+        rv = Response(data, mimetype=mimetype or 'application/octet-stream')
+        rv.last_modified = last_modified
+    rv.set_etag(etag)
+    rv.headers['Cache-Control'] = 'private, max-age=31536000, immutable' if versioned else 'private, no-cache'
+    if data is not None:
+        rv = rv.make_conditional(request, accept_ranges=True, complete_length=len(data))
+    return rv
+
+
+# --- FOTO DE PERFIL ---
+def parse_data_url(data_url):
+    """Decodifica uma data URL base64 ("data:<mime>;base64,<dados>") em (bytes, mime)."""
+    if not data_url or not data_url.startswith('data:') or ';base64,' not in data_url:
+        raise ValueError('Formato de imagem inválido.')
+    header, payload = data_url.split(',', 1)
+    mime_type = header[len('data:'):].split(';', 1)[0]
+    return base64.b64decode(payload, validate=True), mime_type
+
+
+def profile_photo_url(user):
+    """Retorna a URL da foto do usuário: /avatar/<id>?v=<hash> ou, sem a migração 001, a data URL legada."""
+    if user.get('foto_hash'):
+        return url_for('avatar', user_id=user['id'], v=user['foto_hash'][:16])
+    data = user.get('foto_perfil')
+    if isinstance(data, memoryview):
+        data = bytes(data)
+    if isinstance(data, (bytes, bytearray)):
+        data = data.decode('utf-8')
+    return data or None
+
+
+# --- USUÁRIO ATUAL ---
+# O usuário logado é carregado no máximo uma vez por request (flask.g) e fica num cache curto
+# por processo; update_profile, upload_foto e change_password invalidam a entrada.
+USER_CACHE_TTL = float(os.environ.get('USER_CACHE_TTL', 30))
+USER_CACHE_MAX = 1024
+_user_cache = OrderedDict()  # user_id -> (expira_em, usuário), do uso mais antigo ao mais recente
+_user_cache_lock = threading.Lock()
+
+
+def _load_user(user_id):
+    """Lê numa única consulta todas as colunas de usuarios usadas pelas páginas."""
+    existing_cols = columns_in_usuarios()
+    select_cols = ['id', 'nome', 'sobrenome', 'email']
+    # Com a migração 001 a foto é servida por /avatar/<id>; só o hash é lido aqui.
+    select_cols.append('foto_hash' if 'foto_hash' in existing_cols else 'foto_perfil')
+    select_cols += [c for c in ('is_admin', 'can_create_users', 'must_change_password') if c in existing_cols]
+    cursor = get_db_connection().cursor(cursor_factory=DictCursor)
+    try:
+        cursor.execute(f"SELECT {', '.join(select_cols)} FROM usuarios WHERE id = %s", (user_id,))
+        row = cursor.fetchone()
     finally:
-        if conn:
-            cursor.close()
-            conn.close()
-    return nome_completo, foto_perfil_url
+        cursor.close()
+    if not row:
+        return None
+    user = dict(row)
+    user['foto_perfil_url'] = profile_photo_url(user)
+    return user
+
+
+def get_current_user():
+    """Retorna o usuário logado como dict (ou None), consultando o banco no máximo uma vez por request."""
+    if 'user_id' not in session:
+        return None
+    if 'current_user' in g:
+        return g.current_user
+    user_id = session['user_id']
+    now = time.monotonic()
+    with _user_cache_lock:
+        cached = _user_cache.get(user_id)
+        if cached:
+            _user_cache.move_to_end(user_id)
+    if cached and cached[0] > now:
+        user = cached[1]
+    else:
+        try:
+            user = _load_user(user_id)
+        except psycopg2.Error as e:
+            print(f"Erro ao buscar dados do usuário: {e}")
+            get_db_connection().rollback()
+            user = None
+        if user is not None and USER_CACHE_TTL > 0:
+            with _user_cache_lock:
+                _user_cache[user_id] = (now + USER_CACHE_TTL, user)
+                _user_cache.move_to_end(user_id)
+                while len(_user_cache) > USER_CACHE_MAX:
+                    _user_cache.popitem(last=False)
+    g.current_user = user
+    return user
+
+
+def invalidate_user_cache(user_id):
+    """Descarta o usuário dos caches (processo e request) após alterações no seu registro."""
+    with _user_cache_lock:
+        _user_cache.pop(user_id, None)
+    g.pop('current_user', None)
+
+
+def get_user_data():
+    """Retorna (nome_completo, foto_perfil_url) do usuário logado, a partir de get_current_user()."""
+    if 'user_id' not in session:
+        return None, None
+    user = get_current_user()
+    if not user:
+        nome_completo = f"{session.get('user_nome', '')} {session.get('user_sobrenome', '')}".strip()
+        return nome_completo, None
+    nome_completo = f"{user.get('nome') or ''} {user.get('sobrenome') or ''}".strip()
+    return nome_completo, user.get('foto_perfil_url')
 
 
 def login_required(f):
@@ -210,21 +361,15 @@ def login_required(f):
 
 
 def columns_in_usuarios():
-    """Retorna um set com os nomes de colunas existentes na tabela usuarios."""
-    conn = None
+    """Retorna um set com os nomes de colunas existentes na tabela usuarios.
+    Usa o cache de schema do processo (db.schema): o information_schema só é consultado no
+    primeiro uso (ou após db.schema.refresh()/expirar SCHEMA_CACHE_TTL).
+    """
     try:
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=DictCursor)
-        cur.execute("SELECT column_name FROM information_schema.columns WHERE table_name = 'usuarios'")
-        cols = {r['column_name'] for r in cur.fetchall()}
-        return cols
+        return db.schema.columns('usuarios')
     except Exception as e:
         print(f"Erro ao verificar colunas da tabela usuarios: {e}")
         return set()
-    finally:
-        if conn:
-            cur.close()
-            conn.close()
 
 
 def create_is_admin_column_if_missing():
@@ -241,87 +386,82 @@ def create_is_admin_column_if_missing():
 
 def user_can_manage_users():
     """Verifica se o usuário atual tem permissão para criar/gerenciar usuários.
-    Evita selecionar colunas que possam não existir na tabela. Busca o email primeiro,
-    consulta information_schema para detectar se as colunas de permissão existem e,
-    se existirem, recupera seus valores para decisão.
+    Usa o registro já carregado por get_current_user(): as colunas de permissão (is_admin,
+    can_create_users) só estão presentes se existirem na tabela, e a variável de ambiente
+    USER_CREATORS (lista de ids ou emails) serve de fallback.
     """
     if 'user_id' not in session:
         return False
-    conn = None
-    cursor = None
+    user = get_current_user() or {}
+    if user.get('is_admin') or user.get('can_create_users'):
+        return True
+
+    allowed = os.environ.get('USER_CREATORS', '')
+    if allowed:
+        allowed_set = {s.strip().lower() for s in allowed.split(',') if s.strip()}
+        user_email = user.get('email') or session.get('user_email', '') or ''
+        if user_email and user_email.lower() in allowed_set:
+            return True
+        if str(session['user_id']) in allowed_set:
+            return True
+    return False
+
+
+def current_conversation(cursor, conversa_id=None):
+    """Conversa do chat do usuário logado: a pedida (se for dele), a da sessão ou uma nova."""
+    usuario_id = session['user_id']
+    for candidata in (conversa_id, session.get('conversa_id')):
+        try:
+            candidata = int(candidata)
+        except (TypeError, ValueError):
+            continue
+        conversa = conversations.get(cursor, candidata, usuario_id)
+        if conversa:
+            break
+    else:
+        conversa = conversations.get(cursor, conversations.create(cursor, usuario_id), usuario_id)
+    if session.get('conversa_id') != conversa['id']:
+        # só grava quando muda: cada escrita na sessão é uma ida ao session store
+        session['conversa_id'] = conversa['id']
+    return conversa
+
+
+def open_chat_conversation(conversa_id):
+    """Conversa do turno atual; None se o banco falhar (o chat continua funcionando, só sem histórico).
+    A mensagem do usuário é gravada depois de chat_turn, para não entrar duas vezes no prompt."""
+    conn = get_db_connection()
     try:
-        conn = get_db_connection()
         cursor = conn.cursor(cursor_factory=DictCursor)
-        # Buscar email primeiro (sempre presente)
-        cursor.execute("SELECT email FROM usuarios WHERE id = %s", (session['user_id'],))
-        user = cursor.fetchone()
-        if not user:
-            return False
-
-        user_email = user.get('email') or ''
-
-        # Verificar colunas existentes
-        existing_cols = columns_in_usuarios()
-
-        # Se existirem colunas de permissão, buscar seus valores
-        cols_to_check = []
-        if 'is_admin' in existing_cols:
-            cols_to_check.append('is_admin')
-        if 'can_create_users' in existing_cols:
-            cols_to_check.append('can_create_users')
+        conversa = current_conversation(cursor, conversa_id)
+        conn.commit()
+        return conversa
+    except psycopg2.Error as e:
+        print(f"Erro ao abrir a conversa do chat: {e}")
+        conn.rollback()
+        return None
 
-        if cols_to_check:
-            cols_to_select = ', '.join(cols_to_check + ['email'])
-            cursor.execute(f"SELECT {cols_to_select} FROM usuarios WHERE id = %s", (session['user_id'],))
-            user = cursor.fetchone()
-            if 'is_admin' in cols_to_check and user.get('is_admin'):
-                return True
-            if 'can_create_users' in cols_to_check and user.get('can_create_users'):
-                return True
-
-        # Fallback para variável de ambiente USER_CREATORS (lista de ids ou emails)
-        allowed = os.environ.get('USER_CREATORS', '')
-        if allowed:
-            allowed_set = {s.strip().lower() for s in allowed.split(',') if s.strip()}
-            if user_email and user_email.lower() in allowed_set:
-                return True
-            if str(session['user_id']) in allowed_set:
-                return True
 
-        return False
-    except Exception as e:
-        print(f"Erro ao verificar permissões do usuário: {e}")
-        # fallback apenas para env var
-        allowed = os.environ.get('USER_CREATORS', '')
-        if allowed:
-            allowed_set = {s.strip().lower() for s in allowed.split(',') if s.strip()}
-            user_email = session.get('user_email', '') or ''
-            if user_email and user_email.lower() in allowed_set:
-                return True
-            if str(session.get('user_id')) in allowed_set:
-                return True
-        return False
-    finally:
-        if cursor:
-            cursor.close()
-        if conn:
-            conn.close()
+def save_chat_message(conn, conversa, papel, conteudo):
+    if not conversa or not conteudo:
+        return
+    try:
+        with conn.cursor() as cursor:
+            conversations.add_message(cursor, conversa['id'], papel, conteudo)
+        conn.commit()
+    except psycopg2.Error as e:
+        print(f"Erro ao gravar mensagem da conversa {conversa['id']}: {e}")
+        conn.rollback()
 
 
-@app.route('/api/chat', methods=['POST'])
-@login_required
-def chat_ia():
-    import re
+def chat_turn(user_message, conversa=None):
+    """Processa uma mensagem do chat e retorna (mensagem, status, prompt).
 
-    def _is_affirmative(text):
-        if not text:
-            return False
-        words = re.findall(r"\w+", text.lower(), flags=re.UNICODE)
-        affirmatives = {"sim", "s", "yes", "y", "claro", "pode", "ok", "porfavor", "por favor"}
-        return any(w in affirmatives for w in words)
-
-    data = request.get_json()
-    user_message = data.get('message')
+    Respostas prontas (busca, criação, cadastro) vêm em `mensagem`; quando a
+    intenção é conversa livre, `mensagem` é None e `prompt` é o texto a ser
+    enviado ao modelo — de uma vez em /api/chat, em streaming em /api/chat/stream.
+    Com `conversa`, esse prompt leva o resumo e as últimas mensagens dela (conversations.py).
+    Todas as alterações da sessão acontecem aqui, antes de a resposta começar a ser enviada.
+    """
     user_nome = session.get('user_nome', 'usuário')
 
     # Etapa 2: Checa se o usuário está respondendo sobre a imagem
@@ -332,7 +472,7 @@ def chat_ia():
         session.pop('creation_topic', None)
 
         # Decide se busca ou não a imagem com base na resposta (mais robusto)
-        add_image = _is_affirmative(user_message)
+        add_image = intent_classifier.is_affirmative(user_message)
 
         try:
             # Gera a questão (sem depender da resposta sobre imagem)
@@ -343,39 +483,27 @@ def chat_ia():
             A chave "opcoes" deve ser uma lista de 4 objetos, cada um com "texto_opcao" e "is_correta". Apenas uma opção deve ser correta.
             Responda APENAS com o JSON.
             """
-            response = model.generate_content(create_prompt)
-            question_json = clean_and_parse_json(response.text)
-            if not question_json:
-                raise ValueError("A IA não retornou um JSON de questão válido.")
+            # pedidos repetidos do mesmo tópico saem do pool de variantes já geradas (generation_cache.py)
+            question_json = question_generation_cache.get(generation_cache.make_key('chat', topic),
+                                                          lambda: generate_question_json(create_prompt))
 
-            imagem_path_servidor = None
+            imagem_hash = None
             if add_image:
-                # Busca e anexa a imagem
+                # Busca e anexa a imagem (gravada direto no media store)
                 search_results = custom_search_images(f"ilustração didática {topic}")
                 if search_results:
-                    for item in search_results:
-                        image_url = item.get('link') or item.get('image', {}).get('contextLink')
-                        if not image_url:
-                            continue
-                        try:
-                            headers = {'User-Agent': 'Mozilla/5.0'}
-                            img_response = requests.get(image_url, stream=True, timeout=10, headers=headers)
-                            img_response.raise_for_status()
-                            extensao = os.path.splitext(image_url)[1].split('?')[0] or '.jpg'
-                            if extensao.lower() not in ['.jpg', '.jpeg', '.png', '.gif']:
-                                extensao = '.jpg'
-                            nome_ficheiro = f"{uuid.uuid4()}{extensao}"
-                            imagem_path_servidor = os.path.join(app.config['UPLOAD_FOLDER'], nome_ficheiro)
-                            with open(imagem_path_servidor, 'wb') as f:
-                                for chunk in img_response.iter_content(chunk_size=8192):
-                                    f.write(chunk)
-                            # ligar o caminho da imagem ao JSON para inserção posterior
-                            question_json['imagem_path'] = imagem_path_servidor
-                            break
-                        except requests.exceptions.RequestException as e:
-                            print(f"Falha ao descarregar {image_url}: {e}")
-                            imagem_path_servidor = None
-                            continue
+                    # Todos os candidatos são baixados ao mesmo tempo; vale o primeiro que o pipeline aceitar
+                    candidatos = [item.get('link') or item.get('image', {}).get('contextLink')
+                                  for item in search_results]
+                    baixada = image_fetch.fetch_first(
+                        candidatos, accept=lambda dados: image_pipeline.run(image_pipeline.normalize, dados))
+                    if baixada:
+                        imagem_mime, imagem_hash = store_normalized_image(baixada.result)
+                        # ligar a referência da imagem ao JSON para inserção posterior
+                        question_json['imagem_hash'] = imagem_hash
+                        question_json['imagem_mime'] = imagem_mime
+                    else:
+                        print(f"Nenhuma imagem válida entre os resultados para '{topic}'.")
                 else:
                     print("Nenhum resultado de imagem encontrado para o tópico.")
 
@@ -386,27 +514,28 @@ def chat_ia():
             for i, opt in enumerate(question_json.get('opcoes', [])):
                 message += f"{i + 1}. {opt.get('texto_opcao', 'N/A')}\n"
 
-            if imagem_path_servidor:
-                try:
-                    with open(imagem_path_servidor, 'rb') as f:
-                        imagem_bytes = f.read()
-                    mime_type = magic.from_buffer(imagem_bytes, mime=True)
-                    base64_string = base64.b64encode(imagem_bytes).decode('utf-8')
-                    data_url = f"data:{mime_type};base64,{base64_string}"
-                    message += f"\n<div class='image-preview-ia'><img src='{data_url}' alt='Imagem sugerida'></div>\n"
-                except Exception as e:
-                    print(f"Erro ao embutir a imagem: {e}")
+            if imagem_hash:
+                imagem_src = url_for('media_blob', imagem_hash=imagem_hash)
+                message += f"\n<div class='image-preview-ia'><img src='{imagem_src}' alt='Imagem sugerida'></div>\n"
 
             message += "\nVocê gostaria de cadastrá-la no banco de dados?"
-            return jsonify({'type': 'chat', 'message': message})
+            return message, 200, None
 
+        except llm.LLMBusy as e:
+            return str(e), 503, None
         except Exception as e:
             print(f"Erro no fluxo de criação: {e}")
-            return jsonify({'type': 'chat', 'message': 'Desculpe, ocorreu um erro ao criar a questão. Vamos tentar de novo?'}), 500
+            return 'Desculpe, ocorreu um erro ao criar a questão. Vamos tentar de novo?', 500, None
 
-    # Etapa 1: Análise de intenção
+    # Etapa 1: Análise de intenção — regras locais primeiro (intent_classifier.py); o modelo só
+    # é consultado quando a confiança delas não basta
     pending_action = "Sim" if 'pending_question' in session else "Não"
-    intent_prompt = f"""
+    try:
+        local = intent_classifier.resolve(user_message, pending='pending_question' in session)
+        if local:
+            intent, topic = local.intent, local.topic
+        else:
+            intent_prompt = f"""
     Analise a mensagem do usuário chamado '{user_nome}' para determinar a intenção. As intenções possíveis são: SEARCH, CREATE, INSERT, CHAT.
     - Se o usuário quer procurar, pesquisar ou buscar, a intenção é SEARCH.
     - Se o usuário quer criar ou gerar uma questão, a intenção é CREATE.
@@ -418,27 +547,25 @@ def chat_ia():
     pending_action: {pending_action}
     Mensagem do usuário: "{user_message}"
     """
-    try:
-        response = model.generate_content(intent_prompt)
-        intent_data = clean_and_parse_json(response.text)
-        if not intent_data:
-            raise ValueError("A IA não retornou um JSON de intenção válido.")
-        intent = intent_data.get("intent")
-        topic = intent_data.get("topic")
+            intent_data = clean_and_parse_json(llm.generate(intent_prompt))
+            if not intent_data:
+                raise ValueError("A IA não retornou um JSON de intenção válido.")
+            intent = intent_data.get("intent")
+            topic = intent_data.get("topic")
 
         if intent == "CREATE":
             # Pergunta se o usuário quer uma imagem (fluxo de pergunta/decisão)
             session['creation_flow'] = 'awaiting_image_decision'
             session['creation_topic'] = topic
             message = f"Entendido. Você gostaria que eu adicione uma imagem à questão sobre '{topic}'?"
-            return jsonify({'type': 'chat', 'message': message})
+            return message, 200, None
 
         elif intent == "SEARCH":
             results = search_questions_in_db(topic)
             message = (f"Encontrei {len(results)} questões sobre '{topic}', {user_nome}:\n" +
                        "".join([f"- #{res['id']}: {res['enunciado'][:80]}...\n" for res in results])
                        if results else f"Não encontrei nenhuma questão sobre '{topic}'. Gostaria que eu criasse uma para você?")
-            return jsonify({'type': 'chat', 'message': message})
+            return message, 200, None
 
         elif intent == "INSERT":
             pending_question = session.get('pending_question')
@@ -449,19 +576,109 @@ def chat_ia():
                 session.pop('pending_question', None)
             else:
                 message = "Não encontrei nenhuma questão pendente para cadastrar."
-            return jsonify({'type': 'chat', 'message': message})
+            return message, 200, None
 
         else:  # CHAT
-            chat_prompt = f"Você é um assistente de IA amigável. O nome do usuário é {user_nome}. Responda à seguinte mensagem: \"{user_message}\""
-            response = model.generate_content(chat_prompt)
-            return jsonify({'type': 'chat', 'message': response.text})
-
+            chat_prompt = f"Você é um assistente de IA amigável. O nome do usuário é {user_nome}. "
+            if conversa:
+                contexto, resumir_ate = conversations.build_context(
+                    get_db_connection().cursor(cursor_factory=DictCursor), conversa,
+                    reserve_tokens=conversations.estimate_tokens(chat_prompt + user_message) + 20)
+                if resumir_ate:
+                    conversations.schedule_summary(conversa['id'], resumir_ate)
+                if contexto:
+                    chat_prompt += f"\n\n{contexto}\n\n"
+            chat_prompt += f"Responda à seguinte mensagem: \"{user_message}\""
+            return None, 200, chat_prompt
+
+    except llm.LLMBusy as e:
+        return str(e), 503, None
     except Exception as e:
         print(f"Erro na API do Gemini ou no processamento do chat: {e}")
         session.pop('pending_question', None)
         session.pop('creation_flow', None)
         session.pop('creation_topic', None)
-        return jsonify({'type': 'chat', 'message': 'Desculpe, ocorreu um erro. Poderia reformular seu pedido?'}), 500
+        return 'Desculpe, ocorreu um erro. Poderia reformular seu pedido?', 500, None
+
+
+@app.route('/api/chat', methods=['POST'])
+@login_required
+def chat_ia():
+    data = request.get_json()
+    user_message = data.get('message')
+    conversa = open_chat_conversation(data.get('conversa_id'))
+    message, status, prompt = chat_turn(user_message, conversa)
+    save_chat_message(get_db_connection(), conversa, 'usuario', user_message)
+    if prompt:
+        try:
+            message = llm.generate(prompt)
+        except llm.LLMBusy as e:
+            message, status = str(e), 503
+        except Exception as e:
+            print(f"Erro na API do Gemini ou no processamento do chat: {e}")
+            message, status = 'Desculpe, ocorreu um erro. Poderia reformular seu pedido?', 500
+    if status == 200:
+        save_chat_message(get_db_connection(), conversa, 'assistente', message)
+    return jsonify({'type': 'chat', 'message': message,
+                    'conversa_id': conversa['id'] if conversa else None}), status
+
+
+def sse_event(event, data):
+    """Um evento Server-Sent Events com `data` em JSON."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+SSE_HEADERS = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+
+
+@app.route('/api/chat/stream', methods=['POST'])
+@login_required
+def chat_stream():
+    """Mesmo chat de /api/chat, respondido como text/event-stream.
+
+    Eventos: 'token' ({"text"}) com cada trecho da resposta do modelo, 'message'
+    ({"message"}) com uma resposta pronta, 'error' ({"message"}) e 'done'
+    ({"conversa_id"}) no fim. O texto do modelo é gerado no pool de llm.py; este
+    request só repassa os trechos e, no fim, grava a resposta completa na conversa.
+    """
+    data = request.get_json(silent=True) or {}
+    user_message = data.get('message')
+    conversa = open_chat_conversation(data.get('conversa_id'))
+    done = sse_event('done', {'conversa_id': conversa['id'] if conversa else None})
+    message, status, prompt = chat_turn(user_message, conversa)
+    save_chat_message(get_db_connection(), conversa, 'usuario', user_message)
+    if not prompt:
+        if status == 200:
+            save_chat_message(get_db_connection(), conversa, 'assistente', message)
+        return Response([sse_event('message', {'message': message}), done],
+                        status=status, mimetype='text/event-stream', headers=SSE_HEADERS)
+    try:
+        chunks = llm.stream(prompt)
+    except llm.LLMBusy as e:
+        return jsonify({'type': 'chat', 'message': str(e)}), 503
+
+    def events():
+        resposta = []
+        try:
+            for text in chunks:
+                resposta.append(text)
+                yield sse_event('token', {'text': text})
+            if conversa:
+                # fora do contexto do request: conexão própria do pool
+                with db.get_pool().connection() as conn:
+                    save_chat_message(conn, conversa, 'assistente', ''.join(resposta))
+            yield done
+        except llm.LLMError as e:
+            print(f"Erro na API do Gemini durante o streaming do chat: {e}")
+            yield sse_event('error', {'message': 'Desculpe, ocorreu um erro. Poderia reformular seu pedido?'})
+        finally:
+            chunks.close()
+
+    response = Response(events(), mimetype='text/event-stream', headers=SSE_HEADERS)
+    # cliente que desconecta antes do primeiro trecho: libera a vaga do pool mesmo assim
+    response.call_on_close(chunks.close)
+    return response
+
 
 @app.route('/')
 def index():
@@ -484,7 +701,8 @@ def login():
 
             # Detectar se a coluna must_change_password existe e incluir na seleção
             existing_cols = columns_in_usuarios()
-            select_cols = ['id', 'nome', 'sobrenome', 'senha_hash', 'foto_perfil']
+            select_cols = ['id', 'nome', 'sobrenome', 'senha_hash']
+            select_cols.append('foto_hash' if 'foto_hash' in existing_cols else 'foto_perfil')
             if 'must_change_password' in existing_cols:
                 select_cols.append('must_change_password')
             cols_sql = ', '.join(select_cols)
@@ -496,10 +714,7 @@ def login():
                 session['user_nome'] = user['nome']
                 session['user_sobrenome'] = user['sobrenome']
 
-                foto_perfil_data = user.get('foto_perfil')
-                foto_perfil_url = None
-                if foto_perfil_data:
-                    foto_perfil_url = foto_perfil_data.decode('utf-8') if isinstance(foto_perfil_data, (bytes, bytearray)) else foto_perfil_data
+                foto_perfil_url = profile_photo_url(user)
 
                 # Se precisar forçar troca de senha, direcionar para rota específica
                 if 'must_change_password' in user and user.get('must_change_password'):
@@ -529,7 +744,6 @@ def login():
         finally:
             if conn:
                 cursor.close()
-                conn.close()
     return render_template('login.html')
 
 
@@ -550,16 +764,8 @@ def search_questoes():
     try:
         conn = get_db_connection()
         cursor = conn.cursor(cursor_factory=DictCursor)
-        sql_search = """
-                     SELECT id, enunciado, tipo_questao, nivel_dificuldade, grau_ensino, area_conhecimento
-                     FROM questoes
-                     WHERE is_active = TRUE
-                       AND (enunciado ILIKE %s OR nivel_dificuldade::text ILIKE %s OR grau_ensino ILIKE %s OR area_conhecimento ILIKE %s)
-                     ORDER BY id DESC LIMIT 10
-                     """
-        like_term = f"%{query}%"
-        cursor.execute(sql_search, (like_term, like_term, like_term, like_term))
-        results = [dict(row) for row in cursor.fetchall()]
+        # enunciado, nível, grau e área fazem parte do mesmo vetor de busca (questoes.busca)
+        results = [dict(row) for row in question_search.search(cursor, query, limit=10)]
         return jsonify(results)
     except psycopg2.Error as e:
         print(f"Erro na busca de questões: {e}")
@@ -567,55 +773,89 @@ def search_questoes():
     finally:
         if conn:
             cursor.close()
-            conn.close()
+
+
+def questoes_list_filters(view):
+    """Filtros da listagem (banco_questoes ou lixeira) lidos da query string."""
+    if view == 'lixeira':
+        return {'active': False}
+    return {
+        'active': True,
+        'term': request.args.get('q', ''),
+        'nivel': request.args.get('nivel', ''),
+        'grau': request.args.get('grau', ''),
+        'area': request.args.get('area', ''),
+    }
+
+
+def load_questoes_page(cursor, view, after_id=None, page_size=None):
+    """Carrega uma página da listagem e o total aproximado; retorna um dict."""
+    where_sql, params = question_search.filter_clause(**questoes_list_filters(view))
+    columns = question_search.TRASH_COLUMNS if view == 'lixeira' else question_search.LIST_COLUMNS
+    rows, next_cursor = question_search.page(cursor, where_sql, params, after_id=after_id,
+                                             page_size=page_size or question_search.PAGE_SIZE,
+                                             columns=columns)
+    total = None
+    if after_id is None:
+        # a estimativa só é necessária na primeira página
+        total = len(rows) if next_cursor is None else question_search.estimate_count(cursor, where_sql, params)
+    return {'items': [dict(row) for row in rows], 'next_cursor': next_cursor, 'total_aprox': total}
 
 
 @app.route('/banco_questoes')
 @login_required
 def banco_questoes():
     nome_completo, foto_perfil_url = get_user_data()
-    search_query = request.args.get('q', '')
-    nivel_dificuldade = request.args.get('nivel', '')
-    grau_ensino = request.args.get('grau', '')
-    area_conhecimento = request.args.get('area', '')
-    lista_questoes = []
+    filters = questoes_list_filters('banco_questoes')
+    pagina = {'items': [], 'next_cursor': None, 'total_aprox': 0}
     conn = None
     try:
         conn = get_db_connection()
         cursor = conn.cursor(cursor_factory=DictCursor)
-        sql_query = "SELECT id, enunciado, tipo_questao, nivel_dificuldade, grau_ensino, area_conhecimento FROM questoes WHERE is_active = TRUE"
-        params = []
-        if search_query:
-            sql_query += " AND enunciado ILIKE %s"
-            params.append(f"%{search_query}%")
-        if nivel_dificuldade:
-            sql_query += " AND nivel_dificuldade = %s"
-            params.append(nivel_dificuldade)
-        if grau_ensino:
-            sql_query += " AND grau_ensino = %s"
-            params.append(grau_ensino)
-        if area_conhecimento:
-            sql_query += " AND area_conhecimento ILIKE %s"
-            params.append(f"%{area_conhecimento}%")
-        sql_query += " ORDER BY id DESC"
-        cursor.execute(sql_query, tuple(params))
-        lista_questoes = cursor.fetchall()
+        pagina = load_questoes_page(cursor, 'banco_questoes')
     except psycopg2.Error as e:
         flash("Erro ao carregar as questões.", "error")
         print(f"Erro em /banco_questoes: {e}")
     finally:
         if conn:
             cursor.close()
-            conn.close()
     return render_template('painel.html',
                            nome_completo=nome_completo,
                            foto_perfil_url=foto_perfil_url,
                            view='banco_questoes',
-                           questoes=lista_questoes,
-                           search_query=search_query,
-                           nivel_dificuldade=nivel_dificuldade,
-                           grau_ensino=grau_ensino,
-                           area_conhecimento=area_conhecimento)
+                           questoes=pagina['items'],
+                           next_cursor=pagina['next_cursor'],
+                           total_aprox=pagina['total_aprox'],
+                           search_query=filters['term'],
+                           nivel_dificuldade=filters['nivel'],
+                           grau_ensino=filters['grau'],
+                           area_conhecimento=filters['area'])
+
+
+@app.route('/api/questoes')
+@login_required
+def api_questoes():
+    """Página seguinte da listagem (JSON), usada pela rolagem infinita do painel.
+
+    Parâmetros: cursor (id da última questão recebida), limit, view
+    ('banco_questoes' ou 'lixeira') e os mesmos filtros q/nivel/grau/area.
+    """
+    view = request.args.get('view', 'banco_questoes')
+    if view not in ('banco_questoes', 'lixeira'):
+        return jsonify({'error': 'Listagem inválida.'}), 400
+    after_id = request.args.get('cursor', type=int)
+    page_size = request.args.get('limit', type=int)
+    conn = None
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor(cursor_factory=DictCursor)
+        return jsonify(load_questoes_page(cursor, view, after_id=after_id, page_size=page_size))
+    except psycopg2.Error as e:
+        print(f"Erro em /api/questoes: {e}")
+        return jsonify({'error': 'Erro no servidor'}), 500
+    finally:
+        if conn:
+            cursor.close()
 
 
 @app.route('/cadastrar_questoes')
@@ -635,7 +875,63 @@ def chat_page():
                            nome_completo=nome_completo,
                            foto_perfil_url=foto_perfil_url,
                            view='chat_ia',
-                           user_nome=user_nome)
+                           user_nome=user_nome,
+                           conversa_id=session.get('conversa_id'))
+
+
+def conversation_message_json(row):
+    return {'id': row['id'], 'papel': row['papel'], 'conteudo': row['conteudo'],
+            'criado_em': row['criado_em'].isoformat()}
+
+
+@app.route('/api/conversas', methods=['GET', 'POST'])
+@login_required
+def api_conversas():
+    """GET: conversas do usuário, paginadas (?cursor=&limit=). POST: começa uma conversa nova."""
+    conn = get_db_connection()
+    cursor = conn.cursor(cursor_factory=DictCursor)
+    try:
+        if request.method == 'POST':
+            conversa_id = conversations.create(cursor, session['user_id'])
+            conn.commit()
+            session['conversa_id'] = conversa_id
+            return jsonify({'id': conversa_id}), 201
+        rows, next_cursor = conversations.list_conversations(
+            cursor, session['user_id'], after_id=request.args.get('cursor', type=int),
+            page_size=request.args.get('limit', type=int) or conversations.PAGE_SIZE)
+        items = [{'id': row['id'], 'titulo': row['titulo'], 'atual': row['id'] == session.get('conversa_id'),
+                  'atualizado_em': row['atualizado_em'].isoformat()} for row in rows]
+        return jsonify({'items': items, 'next_cursor': next_cursor})
+    except psycopg2.Error as e:
+        conn.rollback()
+        print(f"Erro em /api/conversas: {e}")
+        return jsonify({'error': 'Erro no servidor'}), 500
+    finally:
+        cursor.close()
+
+
+@app.route('/api/conversas/<int:conversa_id>/mensagens')
+@login_required
+def api_conversa_mensagens(conversa_id):
+    """Mensagens da conversa, das mais recentes para as mais antigas (?cursor=&limit=).
+    Abrir uma conversa a torna a atual: as próximas mensagens do chat vão para ela."""
+    conn = get_db_connection()
+    cursor = conn.cursor(cursor_factory=DictCursor)
+    try:
+        if not conversations.get(cursor, conversa_id, session['user_id']):
+            return jsonify({'error': 'Conversa não encontrada.'}), 404
+        after_id = request.args.get('cursor', type=int)
+        rows, next_cursor = conversations.list_messages(
+            cursor, conversa_id, after_id=after_id,
+            page_size=request.args.get('limit', type=int) or conversations.PAGE_SIZE)
+        if after_id is None:
+            session['conversa_id'] = conversa_id
+        return jsonify({'items': [conversation_message_json(row) for row in rows], 'next_cursor': next_cursor})
+    except psycopg2.Error as e:
+        print(f"Erro em /api/conversas/{conversa_id}/mensagens: {e}")
+        return jsonify({'error': 'Erro no servidor'}), 500
+    finally:
+        cursor.close()
 
 
 @app.route('/generate_questao', methods=['POST'])
@@ -655,56 +951,106 @@ def generate_questao():
               "A chave 'opcoes' deve ser uma lista de objetos, cada um com as chaves 'texto_opcao' e 'is_correta' (booleano). "
               "Responda APENAS com o JSON.")
     try:
-        response = model.generate_content(prompt)
-        questao_gerada = clean_and_parse_json(response.text)
-        if not questao_gerada:
-            raise ValueError("A IA não retornou um JSON de questão válido.")
+        questao_gerada = question_generation_cache.get(generation_cache.make_key('form', tipo, nivel, grau, area),
+                                                       lambda: generate_question_json(prompt, {
+                                                           'tipo_questao': tipo, 'nivel_dificuldade': nivel,
+                                                           'grau_ensino': grau, 'area_conhecimento': area}))
         return jsonify(questao_gerada)
+    except llm.LLMBusy as e:
+        return jsonify({'error': str(e)}), 503
     except Exception as e:
         print(f"Erro ao gerar questão com Gemini: {e}")
         return jsonify({'error': 'Falha ao gerar questão com a IA.'}), 500
 
 
+@app.route('/generate_questoes_lote', methods=['POST'])
+@login_required
+def generate_questoes_lote():
+    """Gera várias questões com poucas chamadas ao modelo (question_batch.py).
+
+    Espera JSON { "quantidade": 30, "mix": [{"tipo", "nivel", "grau", "area", "quantidade"?}, ...],
+    "salvar": false }. Responde em text/event-stream: um evento 'questao' ({indice, questao})
+    ou 'invalida' ({indice, erro}) por item assim que ele é validado; com "salvar", as
+    válidas são gravadas numa única transação no fim ('salvas', {ids}); por último, 'done'.
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        quantidade = int(data.get('quantidade') or data.get('count') or 0)
+    except (TypeError, ValueError):
+        quantidade = 0
+    if not 1 <= quantidade <= question_batch.MAX_COUNT:
+        return jsonify({'error': f'A quantidade deve estar entre 1 e {question_batch.MAX_COUNT}.'}), 400
+    mix = data.get('mix')
+    if mix is None:
+        mix = [{k: data.get(k) for k in ('tipo', 'nivel', 'grau', 'area')}]
+    if not isinstance(mix, list):
+        return jsonify({'error': "'mix' deve ser uma lista."}), 400
+    specs = question_batch.expand_mix(quantidade, mix)
+    salvar = bool(data.get('salvar'))
+    autor_id = session['user_id']
+
+    def events():
+        validas = []
+        try:
+            for indice, questao, erro in question_batch.generate(specs):
+                if questao:
+                    validas.append(questao)
+                    yield sse_event('questao', {'indice': indice, 'questao': questao})
+                else:
+                    yield sse_event('invalida', {'indice': indice, 'erro': erro})
+        except llm.LLMBusy as e:
+            yield sse_event('error', {'message': str(e)})
+        except llm.LLMError as e:
+            print(f"Erro na geração em lote: {e}")
+            yield sse_event('error', {'message': 'Falha ao gerar questões com a IA.'})
+
+        if salvar and validas:
+            # fora do contexto do request: conexão própria do pool, uma transação para o lote inteiro
+            try:
+                with db.get_pool().connection() as conn:
+                    with conn.cursor() as cursor:
+                        ids = question_batch.bulk_insert(cursor, validas, autor_id)
+                    conn.commit()
+                yield sse_event('salvas', {'ids': ids})
+            except psycopg2.Error as e:
+                print(f"Erro ao salvar questões geradas em lote: {e}")
+                yield sse_event('error', {'message': 'Erro ao salvar as questões geradas.'})
+        yield sse_event('done', {'total': len(specs), 'validas': len(validas)})
+
+    return Response(events(), mimetype='text/event-stream', headers=SSE_HEADERS)
+
+
 @app.route('/lixeira')
 @login_required
 def lixeira():
     nome_completo, foto_perfil_url = get_user_data()
-    lista_questoes_excluidas = []
+    pagina = {'items': [], 'next_cursor': None, 'total_aprox': 0}
     conn = None
     try:
         conn = get_db_connection()
         cursor = conn.cursor(cursor_factory=DictCursor)
-        cursor.execute("SELECT id, enunciado, tipo_questao FROM questoes WHERE is_active = FALSE ORDER BY id DESC")
-        lista_questoes_excluidas = cursor.fetchall()
+        pagina = load_questoes_page(cursor, 'lixeira')
     except psycopg2.Error as e:
         flash("Erro ao carregar a lixeira.", "error")
         print(f"Erro em /lixeira: {e}")
     finally:
         if conn:
             cursor.close()
-            conn.close()
     return render_template('painel.html', nome_completo=nome_completo, foto_perfil_url=foto_perfil_url, view='lixeira',
-                           questoes=lista_questoes_excluidas)
+                           questoes=pagina['items'], next_cursor=pagina['next_cursor'],
+                           total_aprox=pagina['total_aprox'])
 
 
 @app.route('/configuracoes')
 @login_required
 def configuracoes():
     nome_completo, foto_perfil_url = get_user_data()
+    user = get_current_user()
     user_data = {}
-    conn = None
-    try:
-        conn = get_db_connection()
-        cursor = conn.cursor(cursor_factory=DictCursor)
-        cursor.execute('SELECT nome, sobrenome, email FROM usuarios WHERE id = %s', (session['user_id'],))
-        user_data = cursor.fetchone()
-    except psycopg2.Error as e:
+    if user:
+        user_data = {'nome': user.get('nome'), 'sobrenome': user.get('sobrenome'), 'email': user.get('email')}
+    else:
         flash("Não foi possível carregar os seus dados.", "error")
-        print(f"Erro em /configuracoes: {e}")
-    finally:
-        if conn:
-            cursor.close()
-            conn.close()
 
     can_create_users = user_can_manage_users()
 
@@ -782,7 +1128,6 @@ def add_user():
     finally:
         if conn:
             cursor.close()
-            conn.close()
     return redirect(url_for('configuracoes'))
 
 
@@ -849,6 +1194,7 @@ def first_change_password():
             cursor.execute("UPDATE usuarios SET senha_hash = %s, must_change_password = FALSE WHERE id = %s",
                            (nova_hash, session['user_id']))
             conn.commit()
+            invalidate_user_cache(session['user_id'])
             session.pop('must_change_password', None)
             flash('Senha alterada com sucesso!', 'success')
             return redirect(url_for('painel'))
@@ -860,7 +1206,6 @@ def first_change_password():
         finally:
             if conn:
                 cursor.close()
-                conn.close()
 
     # GET -> render a view within painel.html (view='first_change_password')
     nome_completo, foto_perfil_url = get_user_data()
@@ -874,47 +1219,23 @@ def get_questao(questao_id):
     try:
         conn = get_db_connection()
         cursor = conn.cursor(cursor_factory=DictCursor)
-        cursor.execute(
-            "SELECT id, enunciado, tipo_questao, autor_id, nivel_dificuldade, grau_ensino, area_conhecimento, imagem_url FROM questoes WHERE id = %s",
-            (questao_id,))
-        questao = cursor.fetchone()
-        if not questao:
+        questao_dict = question_loader.load_question(cursor, questao_id)
+        if not questao_dict:
             return jsonify({'error': 'Questão não encontrada'}), 404
 
-        questao_dict = dict(questao)
-        imagem_bytes = questao.get('imagem_url')
-
-        if imagem_bytes:
-            if isinstance(imagem_bytes, memoryview):
-                imagem_bytes = bytes(imagem_bytes)
-            try:
-                mime_type = magic.from_buffer(imagem_bytes, mime=True)
-                questao_dict['imagem_url'] = f"data:{mime_type};base64,{base64.b64encode(imagem_bytes).decode('utf-8')}"
-            except Exception as e:
-                print(f"Não foi possível processar a imagem da questão #{questao_id}: {e}")
-                questao_dict['imagem_url'] = None
-        else:
-            questao_dict['imagem_url'] = None
+        # As imagens não são embutidas: o cliente as busca em /media/... (cacheáveis, com Range)
+        imagem_hash = questao_dict.pop('imagem_hash')
+        questao_dict['imagem_url'] = media_url('questao', questao_id, imagem_hash)
+        questao_dict['miniatura_url'] = media_url('questao', questao_id, imagem_hash, 'miniatura')
 
-        if questao['tipo_questao'] != 'DISCURSIVA':
-            cursor.execute("SELECT texto_opcao, is_correta, imagem_url FROM opcoes WHERE questao_id = %s ORDER BY id",
-                           (questao_id,))
-            opcoes_raw = cursor.fetchall()
+        opcoes = questao_dict.pop('opcoes')
+        if questao_dict['tipo_questao'] != 'DISCURSIVA':
             opcoes_list = []
-            for op in opcoes_raw:
-                op_dict = dict(op)
-                op_imagem_bytes = op.get('imagem_url')
-                if op_imagem_bytes:
-                    if isinstance(op_imagem_bytes, memoryview):
-                        op_imagem_bytes = bytes(op_imagem_bytes)
-                    try:
-                        mime_type = magic.from_buffer(op_imagem_bytes, mime=True)
-                        op_dict[
-                            'imagem_url'] = f"data:{mime_type};base64,{base64.b64encode(op_imagem_bytes).decode('utf-8')}"
-                    except Exception:
-                        op_dict['imagem_url'] = None
-                else:
-                    op_dict['imagem_url'] = None
+            for op_dict in opcoes:
+                op_dict.pop('questao_id')
+                imagem_hash = op_dict.pop('imagem_hash')
+                op_dict['imagem_url'] = media_url('opcao', op_dict['id'], imagem_hash)
+                op_dict['miniatura_url'] = media_url('opcao', op_dict['id'], imagem_hash, 'miniatura')
                 opcoes_list.append(op_dict)
             questao_dict['opcoes'] = opcoes_list
 
@@ -925,7 +1246,6 @@ def get_questao(questao_id):
     finally:
         if conn:
             cursor.close()
-            conn.close()
 
 
 @app.route('/delete_questao/<int:questao_id>', methods=['POST'])
@@ -949,7 +1269,6 @@ def delete_questao(questao_id):
     finally:
         if conn:
             cursor.close()
-            conn.close()
 
 
 @app.route('/restore_questao/<int:questao_id>', methods=['POST'])
@@ -973,7 +1292,6 @@ def restore_questao(questao_id):
     finally:
         if conn:
             cursor.close()
-            conn.close()
 
 
 @app.route('/delete_permanently/<int:questao_id>', methods=['POST'])
@@ -996,7 +1314,6 @@ def delete_permanently(questao_id):
     finally:
         if conn:
             cursor.close()
-            conn.close()
 
 
 @app.route('/edit_questao/<int:questao_id>', methods=['POST'])
@@ -1023,30 +1340,25 @@ def edit_questao(questao_id):
             flash("Você não tem permissão para editar esta questão.", "error")
             return redirect(url_for('banco_questoes'))
         tipo_questao = result['tipo_questao']
+        imagem_mime, imagem_hash = store_image(imagem_questao_dados)
         sql_update = """
                      UPDATE questoes \
                      SET enunciado         = %s, \
                          nivel_dificuldade = %s, \
                          grau_ensino       = %s, \
                          area_conhecimento = %s, \
-                         imagem_url        = COALESCE(%s, imagem_url)
+                         imagem_url        = CASE WHEN %s::text IS NULL THEN imagem_url END, \
+                         imagem_mime       = COALESCE(%s, imagem_mime), \
+                         imagem_hash       = COALESCE(%s, imagem_hash)
                      WHERE id = %s
                      """
         cursor.execute(sql_update,
-                       (enunciado, nivel_dificuldade_db, grau_ensino, area_conhecimento, imagem_questao_dados,
-                        questao_id))
-        cursor.execute("DELETE FROM opcoes WHERE questao_id = %s", (questao_id,))
-        if tipo_questao in ['ESCOLHA_UNICA', 'MULTIPLA_ESCOLHA']:
-            opcoes_texto = request.form.getlist('opcoes_texto[]')
-            opcoes_imagens = request.files.getlist('opcoes_imagem[]')
-            respostas_corretas_indices = request.form.getlist('respostas_corretas[]')
-            for i, texto_opcao in enumerate(opcoes_texto):
-                imagem_opcao_dados = opcoes_imagens[i].read() if i < len(opcoes_imagens) and opcoes_imagens[
-                    i].filename else None
-                if not texto_opcao and not imagem_opcao_dados: continue
-                is_correta = str(i) in respostas_corretas_indices
-                sql_opcao = "INSERT INTO opcoes (questao_id, texto_opcao, is_correta, imagem_url) VALUES (%s, %s, %s, %s)"
-                cursor.execute(sql_opcao, (questao_id, texto_opcao, is_correta, imagem_opcao_dados))
+                       (enunciado, nivel_dificuldade_db, grau_ensino, area_conhecimento, imagem_hash,
+                        imagem_mime, imagem_hash, questao_id))
+        # só o que mudou nas opções é gravado; imagens não reenviadas são mantidas (question_options.py)
+        opcoes = (question_options.form_options(request.form, request.files)
+                  if tipo_questao in ['ESCOLHA_UNICA', 'MULTIPLA_ESCOLHA'] else [])
+        question_options.sync_options(cursor, questao_id, opcoes, store_image)
         conn.commit()
         flash("Questão atualizada com sucesso!", "success")
     except (psycopg2.Error, ValueError) as e:
@@ -1056,7 +1368,6 @@ def edit_questao(questao_id):
     finally:
         if conn:
             cursor.close()
-            conn.close()
     return redirect(url_for('banco_questoes'))
 
 
@@ -1079,13 +1390,14 @@ def add_questao():
     try:
         conn = get_db_connection()
         cursor = conn.cursor()
+        imagem_mime, imagem_hash = store_image(imagem_questao_dados)
         sql_questao = """
                       INSERT INTO questoes (enunciado, tipo_questao, autor_id, nivel_dificuldade, grau_ensino,
-                                            area_conhecimento, imagem_url)
-                      VALUES (%s, %s, %s, %s, %s, %s, %s) RETURNING id
+                                            area_conhecimento, imagem_mime, imagem_hash)
+                      VALUES (%s, %s, %s, %s, %s, %s, %s, %s) RETURNING id
                       """
         cursor.execute(sql_questao, (enunciado, tipo_questao, session['user_id'], nivel_dificuldade_db, grau_ensino,
-                                     area_conhecimento, imagem_questao_dados))
+                                     area_conhecimento, imagem_mime, imagem_hash))
         questao_id = cursor.fetchone()[0]
         if tipo_questao in ['ESCOLHA_UNICA', 'MULTIPLA_ESCOLHA']:
             opcoes_texto = request.form.getlist('opcoes_texto[]')
@@ -1098,8 +1410,10 @@ def add_questao():
                     i].filename else None
                 if not texto_opcao and not imagem_opcao_dados: continue
                 is_correta = str(i) in respostas_corretas_indices
-                sql_opcao = "INSERT INTO opcoes (questao_id, texto_opcao, is_correta, imagem_url) VALUES (%s, %s, %s, %s)"
-                cursor.execute(sql_opcao, (questao_id, texto_opcao, is_correta, imagem_opcao_dados))
+                imagem_opcao_mime, imagem_opcao_hash = store_image(imagem_opcao_dados)
+                sql_opcao = """INSERT INTO opcoes (questao_id, texto_opcao, is_correta, imagem_mime, imagem_hash)
+                               VALUES (%s, %s, %s, %s, %s)"""
+                cursor.execute(sql_opcao, (questao_id, texto_opcao, is_correta, imagem_opcao_mime, imagem_opcao_hash))
         conn.commit()
         flash("Questão cadastrada com sucesso!", "success")
     except (psycopg2.Error, ValueError) as e:
@@ -1110,23 +1424,69 @@ def add_questao():
     finally:
         if conn:
             cursor.close()
-            conn.close()
     return redirect(url_for('banco_questoes'))
 
 
+@app.route('/importar_questoes', methods=['POST'])
+@login_required
+def importar_questoes():
+    """Importação em massa (import_questoes.py): arquivo CSV, JSON Lines ou DOCX no campo 'arquivo'.
+
+    Campos opcionais: formato (padrão: pela extensão) e tipo/nivel/grau/area para o
+    que o arquivo não informar. Responde com o relatório: contagens, vazão e erros por linha.
+    """
+    arquivo = request.files.get('arquivo')
+    if not arquivo or not arquivo.filename:
+        return jsonify({'error': 'Envie o arquivo no campo "arquivo".'}), 400
+    formato = request.form.get('formato') or import_questoes.detect_format(arquivo.filename)
+    if formato not in import_questoes.READERS:
+        return jsonify({'error': f"Formato não suportado. Use {', '.join(import_questoes.FORMATS)}."}), 400
+    defaults = {'tipo_questao': request.form.get('tipo'), 'nivel_dificuldade': request.form.get('nivel'),
+                'grau_ensino': request.form.get('grau'), 'area_conhecimento': request.form.get('area')}
+    conn = get_db_connection()
+    try:
+        report = import_questoes.import_file(conn, arquivo.stream, formato, session['user_id'], store_image, defaults)
+    except psycopg2.Error as e:
+        conn.rollback()
+        print(f"Erro em /importar_questoes: {e}")
+        return jsonify({'error': 'Erro no servidor'}), 500
+    data = report.as_dict()
+    print(f"Importação ({formato}): {data['importadas']}/{data['lidas']} questões em {data['segundos']}s.")
+    return jsonify(data), 200 if data['importadas'] or not data['lidas'] else 422
+
+
 @app.route('/upload_foto', methods=['POST'])
 @login_required
 def upload_foto():
     image_data = request.get_json().get('image')
     if not image_data:
         return jsonify({'success': False, 'error': 'Dados da imagem em falta'}), 400
+    binary = 'foto_hash' in columns_in_usuarios()
+    if binary:
+        # Decodifica uma única vez; o tipo real é detectado pelo conteúdo, não pelo cabeçalho da data URL.
+        try:
+            foto_bytes, _ = parse_data_url(image_data)
+            foto = image_pipeline.run(image_pipeline.normalize, foto_bytes, image_pipeline.AVATAR_DIMENSION)
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        foto_bytes, foto_mime = foto.data, foto.mime
+        foto_hash = hashlib.sha256(foto_bytes).hexdigest()
     conn = None
     try:
         conn = get_db_connection()
         cursor = conn.cursor()
-        cursor.execute("UPDATE usuarios SET foto_perfil = %s WHERE id = %s", (image_data, session['user_id']))
+        if binary:
+            cursor.execute("""UPDATE usuarios
+                              SET foto_dados = %s, foto_mime = %s, foto_hash = %s,
+                                  foto_atualizada_em = NOW(), foto_perfil = NULL
+                              WHERE id = %s""",
+                           (psycopg2.Binary(foto_bytes), foto_mime, foto_hash, session['user_id']))
+        else:
+            cursor.execute("UPDATE usuarios SET foto_perfil = %s WHERE id = %s", (image_data, session['user_id']))
         conn.commit()
-        return jsonify({'success': True})
+        invalidate_user_cache(session['user_id'])
+        foto_perfil_url = url_for('avatar', user_id=session['user_id'], v=foto_hash[:16]) if binary else image_data
+        return jsonify({'success': True, 'foto_perfil_url': foto_perfil_url})
     except psycopg2.Error as e:
         if conn: conn.rollback()
         print(f"Erro em /upload_foto: {e}")
@@ -1134,7 +1494,125 @@ def upload_foto():
     finally:
         if conn:
             cursor.close()
-            conn.close()
+
+
+@app.route('/avatar/<int:user_id>')
+@login_required
+def avatar(user_id):
+    """Serve a foto de perfil com ETag/Last-Modified. URLs versionadas (?v=<hash>) são imutáveis."""
+    if 'foto_hash' not in columns_in_usuarios():
+        return Response(status=404)
+    conn = get_db_connection()
+    cursor = conn.cursor(cursor_factory=DictCursor)
+    try:
+        cursor.execute("SELECT foto_hash, foto_mime, foto_atualizada_em FROM usuarios WHERE id = %s", (user_id,))
+        meta = cursor.fetchone()
+        if not meta or not meta['foto_hash']:
+            return Response(status=404)
+
+        def load_bytes():
+            cursor.execute("SELECT foto_dados FROM usuarios WHERE id = %s", (user_id,))
+            return bytes(cursor.fetchone()['foto_dados'])
+
+        return send_image(meta['foto_hash'], meta['foto_mime'], load_bytes,
+                          versioned=request.args.get('v') == meta['foto_hash'][:16],
+                          last_modified=meta['foto_atualizada_em'])
+    except psycopg2.Error as e:
+        print(f"Erro em /avatar: {e}")
+        return Response(status=500)
+    finally:
+        cursor.close()
+
+
+def _send_media(table, row_id):
+    """Serve a imagem de uma linha de questoes ou opcoes (media store ou BYTEA legado)."""
+    cursor = get_db_connection().cursor(cursor_factory=DictCursor)
+    try:
+        cursor.execute(f"SELECT imagem_hash, imagem_mime, imagem_url IS NOT NULL AS legado FROM {table} WHERE id = %s",
+                       (row_id,))
+        meta = cursor.fetchone()
+        if not meta or not meta['imagem_hash']:
+            return Response(status=404)
+
+        versioned = request.args.get('v') == meta['imagem_hash'][:16]
+        variante = request.args.get('variante')
+        if variante in image_pipeline.VARIANTS:
+            cursor.execute("SELECT variante_hash, mime FROM midia_variantes WHERE original_hash = %s AND variante = %s",
+                           (meta['imagem_hash'], variante))
+            found = cursor.fetchone()
+            if found:
+                return send_image(found['variante_hash'], found['mime'], lambda: media.get(found['variante_hash']),
+                                  versioned=versioned)
+            # variante ainda não gerada (ou imagem menor que ela): serve a original
+
+        def load_bytes():
+            legacy = None
+            if meta['legado']:
+                cursor.execute(f"SELECT imagem_url FROM {table} WHERE id = %s", (row_id,))
+                legacy = cursor.fetchone()['imagem_url']
+            return load_image_bytes(meta['imagem_hash'], legacy)
+
+        return send_image(meta['imagem_hash'], meta['imagem_mime'], load_bytes, versioned=versioned)
+    except media_store.BlobNotFound:
+        return Response(status=404)
+    except psycopg2.Error as e:
+        print(f"Erro ao servir imagem de {table} #{row_id}: {e}")
+        return Response(status=500)
+    finally:
+        cursor.close()
+
+
+@app.route('/media/blob/<imagem_hash>')
+@login_required
+def media_blob(imagem_hash):
+    """Serve um blob diretamente pelo hash (ex.: pré-visualização de imagens ainda não cadastradas)."""
+    if not media_store.is_valid_key(imagem_hash):
+        return Response(status=404)
+    try:
+        data = media.get(imagem_hash)
+    except media_store.BlobNotFound:
+        return Response(status=404)
+    return send_image(imagem_hash, magic.from_buffer(data[:2048], mime=True), lambda: data, versioned=True)
+
+
+@app.route('/media/questao/<int:questao_id>')
+@login_required
+def media_questao(questao_id):
+    return _send_media('questoes', questao_id)
+
+
+@app.route('/media/opcao/<int:opcao_id>')
+@login_required
+def media_opcao(opcao_id):
+    return _send_media('opcoes', opcao_id)
+
+
+@app.route('/metrics/db_pool')
+@login_required
+def db_pool_metrics():
+    """Métricas do pool de conexões deste processo (checkouts, espera, overflow)."""
+    return jsonify(db.get_pool().stats())
+
+
+@app.route('/metrics/intencoes')
+@login_required
+def intent_metrics():
+    """Classificação de intenções do chat neste processo: quantas dispensaram o modelo (taxa_local)."""
+    return jsonify(intent_classifier.stats())
+
+
+@app.route('/metrics/geracao')
+@login_required
+def generation_metrics():
+    """Cache de geração de questões: acertos, pedidos agrupados, variantes prontas."""
+    return jsonify(question_generation_cache.stats())
+
+
+@app.route('/metrics/json_ia')
+@login_required
+def ai_json_metrics():
+    """Extração do JSON das respostas da IA: reparos por tipo e chamadas repetidas evitadas."""
+    return jsonify(ai_json.stats())
 
 
 @app.route('/logout')
@@ -1144,11 +1622,9 @@ def logout():
     return redirect(url_for('login'))
 
 
-@app.route('/export_questoes', methods=['POST'])
-@login_required
-def export_questoes():
-    """Exporta questões selecionadas como um arquivo .docx e o retorna como download.
-    Espera JSON { "ids": [1,2,3] } ou um form com 'ids' como CSV ou 'ids[]'.
+def parse_export_ids():
+    """Lista de IDs de um pedido de exportação: JSON { "ids": [...] } ou form com 'ids' (CSV) / 'ids[]'.
+    Levanta ValueError se algum ID não for inteiro.
     """
     # Obter lista de ids do pedido (suporta JSON e form data)
     ids = []
@@ -1165,84 +1641,74 @@ def export_questoes():
 
     # Normalizar para inteiros
     try:
-        ids = [int(i) for i in ids]
-    except Exception:
+        return [int(i) for i in ids or []]
+    except (TypeError, ValueError):
+        raise ValueError('IDs inválidos')
+
+
+def parse_export_format():
+    """(formato, opções) de um pedido de exportação; 'docx' quando o formato não é informado."""
+    payload = request.get_json(silent=True) or {}
+    formato = payload.get('format') or request.form.get('format') or 'docx'
+    opcoes = payload.get('options') or {
+        'gabarito': request.form.get('gabarito'),
+        'colunas': request.form.get('colunas'),
+    }
+    return formato, opcoes
+
+
+@app.route('/export_questoes', methods=['POST'])
+@login_required
+def export_questoes():
+    """Exporta questões selecionadas no formato pedido (docx, pdf, txt, json, moodle, gift ou qti) e retorna o download.
+    Espera JSON { "ids": [1,2,3], "format": "pdf", "options": {...} } ou um form com 'ids' como CSV ou 'ids[]'.
+    Para seleções grandes use /export_jobs, que gera o arquivo em segundo plano.
+    """
+    try:
+        ids = parse_export_ids()
+    except ValueError:
         return jsonify({'error': 'IDs inválidos'}), 400
 
     if not ids:
         return jsonify({'error': 'Nenhum ID fornecido para exportação.'}), 400
 
+    formato, opcoes = parse_export_format()
+    try:
+        renderer = exporters.get_renderer(formato)
+        opcoes = exporters.clean_options(opcoes)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
     conn = None
     try:
         conn = get_db_connection()
         cursor = conn.cursor(cursor_factory=DictCursor)
-        cursor.execute(
-            """SELECT id, enunciado, tipo_questao, nivel_dificuldade, grau_ensino, area_conhecimento, imagem_url
-               FROM questoes WHERE id = ANY(%s) ORDER BY id""",
-            (ids,)
-        )
-        questoes = cursor.fetchall()
-
-        if not questoes:
+        # só (id, versao) antes de decidir se é preciso renderizar
+        versoes = question_loader.load_versions(cursor, ids)
+
+        if not versoes:
             return jsonify({'error': 'Nenhuma questão encontrada para os IDs fornecidos.'}), 404
 
-        doc = Document()
-        doc.styles['Normal'].font.name = 'Arial'
-        doc.styles['Normal'].font.size = Pt(11)
-
-        for idx, q in enumerate(questoes, start=1):
-            # Apenas adicionar o enunciado (sem número da questão) — não adicionar meta/linha de tipo, nível, grau ou área
-            enunciado = q.get('enunciado') or ''
-            doc.add_paragraph(enunciado)
-
-            # Inserir imagem da questão, se houver
-            imagem_bytes = q.get('imagem_url')
-            if imagem_bytes:
-                try:
-                    if isinstance(imagem_bytes, memoryview):
-                        imagem_bytes = bytes(imagem_bytes)
-                    img_io = io.BytesIO(imagem_bytes)
-                    # Adicionar imagem com largura máxima de 4 polegadas
-                    doc.add_picture(img_io, width=Inches(4))
-                except Exception as e:
-                    print(f"Erro ao inserir imagem da questão {q['id']}: {e}")
-
-            # Opções (sem marcações extras além das letras e texto/imagem)
-            if q.get('tipo_questao') != 'DISCURSIVA':
-                cursor.execute("SELECT texto_opcao, is_correta, imagem_url FROM opcoes WHERE questao_id = %s ORDER BY id",
-                               (q['id'],))
-                opcoes = cursor.fetchall()
-                if opcoes:
-                    p = doc.add_paragraph()
-                    for i, op in enumerate(opcoes):
-                        letra = chr(ord('A') + i)
-                        texto = op.get('texto_opcao') or ''
-                        p.add_run(f"{letra}. {texto}")
-                        p.add_run('\n')
-                        op_img = op.get('imagem_url')
-                        if op_img:
-                            try:
-                                if isinstance(op_img, memoryview):
-                                    op_img = bytes(op_img)
-                                img_io = io.BytesIO(op_img)
-                                doc.add_picture(img_io, width=Inches(3))
-                            except Exception as e:
-                                print(f"Erro ao inserir imagem da opção da questão {q['id']}: {e}")
-
-            doc.add_page_break()
-
-        # Preparar arquivo em memória
-        out_io = io.BytesIO()
-        doc.save(out_io)
-        out_io.seek(0)
+        # Mesma lista, mesmo formato e nenhuma questão alterada: o arquivo sai do cache em disco
+        chave = export_cache.cache_key(formato, opcoes, versoes)
+        artefato = export_cache_store.open(chave, renderer.extension)
+        if artefato is None:
+            # Questões lidas de cursores do servidor e documento escrito direto num arquivo
+            # do cache: a memória não cresce com o tamanho da seleção, e a resposta é o arquivo.
+            questoes = question_loader.iter_questions(conn, ids, variante='exportacao', legacy_bytes=True)
+            chave, artefato = export_cache.render_to_cache(export_cache_store, formato, opcoes, questoes,
+                                                           load_image_bytes)
 
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = f"questoes_export_{timestamp}.docx"
+        filename = f"questoes_export_{timestamp}.{renderer.extension}"
 
-        return send_file(out_io,
-                         as_attachment=True,
-                         download_name=filename,
-                         mimetype='application/vnd.openxmlformats-officedocument.wordprocessingml.document')
+        response = send_file(artefato,
+                             as_attachment=True,
+                             download_name=filename,
+                             mimetype=renderer.mimetype,
+                             etag=chave)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
 
     except psycopg2.Error as e:
         print(f"Erro ao exportar questões: {e}")
@@ -1250,7 +1716,88 @@ def export_questoes():
     finally:
         if conn:
             cursor.close()
-            conn.close()
+
+
+# --- EXPORTAÇÕES ASSÍNCRONAS (export_jobs.py) ---
+
+@app.route('/export_jobs', methods=['POST'])
+@login_required
+def create_export_job():
+    """Enfileira uma exportação. Espera o mesmo corpo de /export_questoes ('ids', 'format', 'options').
+    Responde 202 com o id do job; o progresso fica em /export_jobs/<id>.
+    """
+    try:
+        ids = parse_export_ids()
+    except ValueError:
+        return jsonify({'error': 'IDs inválidos'}), 400
+    formato, opcoes = parse_export_format()
+    conn = None
+    try:
+        conn = get_db_connection()
+        job_id = export_jobs.create_job(conn, session['user_id'], ids, formato, opcoes)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except export_jobs.JobLimitExceeded as e:
+        return jsonify({'error': str(e)}), 429
+    except psycopg2.Error as e:
+        if conn: conn.rollback()
+        print(f"Erro ao criar exportação: {e}")
+        return jsonify({'error': 'Erro no servidor ao exportar.'}), 500
+    export_jobs.ensure_workers()
+    return jsonify({'job_id': job_id,
+                    'status_url': url_for('export_job_status', job_id=job_id),
+                    'download_url': url_for('download_export_job', job_id=job_id)}), 202
+
+
+@app.route('/export_jobs/<job_id>')
+@login_required
+def export_job_status(job_id):
+    conn = None
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor(cursor_factory=DictCursor)
+        job = export_jobs.get_job(cursor, job_id, session['user_id'])
+        if not job:
+            return jsonify({'error': 'Exportação não encontrada.'}), 404
+        return jsonify(export_jobs.job_status(job))
+    except psycopg2.Error as e:
+        print(f"Erro em /export_jobs: {e}")
+        return jsonify({'error': 'Erro no servidor'}), 500
+    finally:
+        if conn:
+            cursor.close()
+
+
+@app.route('/export_jobs/<job_id>/download')
+@login_required
+def download_export_job(job_id):
+    conn = None
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor(cursor_factory=DictCursor)
+        job = export_jobs.get_job(cursor, job_id, session['user_id'])
+    except psycopg2.Error as e:
+        print(f"Erro em /export_jobs/download: {e}")
+        return jsonify({'error': 'Erro no servidor'}), 500
+    finally:
+        if conn:
+            cursor.close()
+    if not job:
+        return jsonify({'error': 'Exportação não encontrada.'}), 404
+    status = export_jobs.job_status(job)['status']
+    if status == 'expirado':
+        return jsonify({'error': 'O arquivo expirou. Exporte novamente.'}), 410
+    if status != 'concluido':
+        return jsonify({'error': 'A exportação ainda não foi concluída.'}), 409
+    path = export_jobs.artifact_path(job['arquivo'])
+    if not os.path.exists(path):
+        return jsonify({'error': 'O arquivo expirou. Exporte novamente.'}), 410
+    mimetype = exporters.get_renderer(job['formato']).mimetype
+    # a chave do cache identifica o conteúdo exato do arquivo: ETag forte (If-None-Match -> 304)
+    response = send_file(path, as_attachment=True, download_name=job['nome_arquivo'], mimetype=mimetype,
+                         etag=job['chave_cache'] or True)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
 
 
 @app.route('/update_profile', methods=['POST'])
@@ -1268,6 +1815,7 @@ def update_profile():
         cursor.execute("UPDATE usuarios SET nome = %s, sobrenome = %s WHERE id = %s",
                        (nome, sobrenome, session['user_id']))
         conn.commit()
+        invalidate_user_cache(session['user_id'])
         session['user_nome'] = nome
         session['user_sobrenome'] = sobrenome
         flash("Perfil atualizado com sucesso!", "success")
@@ -1278,7 +1826,6 @@ def update_profile():
     finally:
         if conn:
             cursor.close()
-            conn.close()
     return redirect(url_for('configuracoes'))
 
 
@@ -1300,7 +1847,7 @@ def change_password():
     conn = None
     try:
         conn = get_db_connection()
-        cursor = conn.cursor()
+        cursor = conn.cursor(cursor_factory=DictCursor)
 
         # Verificar a senha atual
         cursor.execute("SELECT senha_hash FROM usuarios WHERE id = %s", (session['user_id'],))
@@ -1311,9 +1858,12 @@ def change_password():
 
         # Atualizar para a nova senha
         nova_hash = bcrypt.generate_password_hash(nova_senha).decode('utf-8')
-        cursor.execute("UPDATE usuarios SET senha_hash = %s, must_change_password = FALSE WHERE id = %s",
-                       (nova_hash, session['user_id']))
+        set_sql = "senha_hash = %s"
+        if 'must_change_password' in columns_in_usuarios():
+            set_sql += ", must_change_password = FALSE"
+        cursor.execute(f"UPDATE usuarios SET {set_sql} WHERE id = %s", (nova_hash, session['user_id']))
         conn.commit()
+        invalidate_user_cache(session['user_id'])
 
         session.pop('must_change_password', None)  # Garantir que a sessão seja limpa
         flash('Senha alterada com sucesso!', 'success')
@@ -1324,7 +1874,6 @@ def change_password():
     finally:
         if conn:
             cursor.close()
-            conn.close()
     return redirect(url_for('configuracoes'))
 
 
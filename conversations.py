@@ -0,0 +1,206 @@
+# conversations.py
+"""Conversas do chat com a IA, guardadas no banco, e o contexto enviado ao modelo.
+
+Cada mensagem do usuário e cada resposta ficam em conversa_mensagens
+(migrations/011_conversas.sql). O prompt de uma mensagem de conversa livre
+leva só:
+- o resumo acumulado da conversa (até CHAT_SUMMARY_TOKENS);
+- as últimas CHAT_RECENT_TURNS trocas que couberem em CHAT_CONTEXT_TOKENS.
+As mensagens que saem dessa janela são incorporadas ao resumo em segundo
+plano, de CHAT_SUMMARY_BATCH em CHAT_SUMMARY_BATCH, por uma chamada ao modelo
+no pool de llm.py. Assim o prompt — e a latência do modelo — fica do mesmo
+tamanho na décima ou na centésima mensagem.
+
+Os tokens são estimados (~4 caracteres por token); basta para limitar o tamanho.
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import llm
+
+CONTEXT_TOKENS = int(os.environ.get('CHAT_CONTEXT_TOKENS', 1500))
+RECENT_TURNS = int(os.environ.get('CHAT_RECENT_TURNS', 6))
+SUMMARY_TOKENS = int(os.environ.get('CHAT_SUMMARY_TOKENS', 300))
+SUMMARY_BATCH = int(os.environ.get('CHAT_SUMMARY_BATCH', 6))
+PAGE_SIZE = 30
+MAX_PAGE_SIZE = 100
+TITLE_LENGTH = 60
+
+_PAPEIS = {'usuario': 'Usuário', 'assistente': 'Assistente'}
+
+
+def estimate_tokens(text):
+    return (len(text or '') + 3) // 4
+
+
+def truncate_tokens(text, max_tokens):
+    """`text` cortado para caber em `max_tokens` (estimados)."""
+    text = text or ''
+    limit = max_tokens * 4
+    if len(text) <= limit:
+        return text
+    return text[:max(limit - 1, 0)].rstrip() + '…'
+
+
+# --- CONVERSAS E MENSAGENS ---
+
+def create(cursor, usuario_id, titulo=None):
+    cursor.execute("INSERT INTO conversas (usuario_id, titulo) VALUES (%s, %s) RETURNING id",
+                   (usuario_id, titulo))
+    return cursor.fetchone()[0]
+
+
+def get(cursor, conversa_id, usuario_id):
+    """A conversa (id, titulo, resumo, resumo_ate) se pertencer ao usuário; senão None."""
+    cursor.execute("""SELECT id, titulo, resumo, resumo_ate FROM conversas
+                      WHERE id = %s AND usuario_id = %s""", (conversa_id, usuario_id))
+    return cursor.fetchone()
+
+
+def add_message(cursor, conversa_id, papel, conteudo):
+    """Grava uma mensagem; a primeira do usuário vira o título da conversa. Retorna o id."""
+    cursor.execute("""INSERT INTO conversa_mensagens (conversa_id, papel, conteudo)
+                      VALUES (%s, %s, %s) RETURNING id""", (conversa_id, papel, conteudo))
+    mensagem_id = cursor.fetchone()[0]
+    titulo = ' '.join((conteudo or '').split())[:TITLE_LENGTH] if papel == 'usuario' else None
+    cursor.execute("""UPDATE conversas SET atualizado_em = NOW(), titulo = COALESCE(titulo, %s)
+                      WHERE id = %s""", (titulo or None, conversa_id))
+    return mensagem_id
+
+
+def _page(rows, page_size):
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        return rows, rows[-1]['id']
+    return rows, None
+
+
+def list_conversations(cursor, usuario_id, after_id=None, page_size=PAGE_SIZE):
+    """(conversas, próximo_cursor) do usuário, das mais novas para as mais antigas (keyset por id)."""
+    page_size = max(1, min(int(page_size), MAX_PAGE_SIZE))
+    cursor.execute("""SELECT id, titulo, criado_em, atualizado_em FROM conversas
+                      WHERE usuario_id = %s AND (%s::int IS NULL OR id < %s)
+                      ORDER BY id DESC LIMIT %s""", (usuario_id, after_id, after_id, page_size + 1))
+    return _page(cursor.fetchall(), page_size)
+
+
+def list_messages(cursor, conversa_id, after_id=None, page_size=PAGE_SIZE):
+    """(mensagens, próximo_cursor): uma página de mensagens, das mais recentes para as mais antigas.
+
+    O chat carrega a primeira página ao abrir e as anteriores ao rolar para cima,
+    passando próximo_cursor como `after_id`.
+    """
+    page_size = max(1, min(int(page_size), MAX_PAGE_SIZE))
+    cursor.execute("""SELECT id, papel, conteudo, criado_em FROM conversa_mensagens
+                      WHERE conversa_id = %s AND (%s::bigint IS NULL OR id < %s)
+                      ORDER BY id DESC LIMIT %s""", (conversa_id, after_id, after_id, page_size + 1))
+    return _page(cursor.fetchall(), page_size)
+
+
+# --- CONTEXTO DO PROMPT ---
+
+def build_context(cursor, conversa, reserve_tokens=0):
+    """(texto_de_contexto, resumir_ate) para o prompt da próxima mensagem.
+
+    `reserve_tokens` é o que o resto do prompt (instruções, mensagem atual) vai
+    ocupar. `resumir_ate` é o id da mensagem mais nova que ficou fora da janela
+    quando já há CHAT_SUMMARY_BATCH delas sem resumo (ver schedule_summary), ou None.
+    """
+    cursor.execute("""SELECT id, papel, conteudo FROM conversa_mensagens
+                      WHERE conversa_id = %s AND id > %s
+                      ORDER BY id DESC LIMIT %s""",
+                   (conversa['id'], conversa['resumo_ate'], 2 * RECENT_TURNS + SUMMARY_BATCH))
+    rows = cursor.fetchall()
+
+    resumo = truncate_tokens(conversa['resumo'], SUMMARY_TOKENS)
+    budget = CONTEXT_TOKENS - reserve_tokens - estimate_tokens(resumo)
+    janela = []
+    for row in rows[:2 * RECENT_TURNS]:
+        linha = f"{_PAPEIS.get(row['papel'], row['papel'])}: {row['conteudo']}"
+        custo = estimate_tokens(linha)
+        if custo > budget:
+            if not janela:
+                # a mensagem mais recente entra sempre, cortada se preciso; as demais
+                # só se ainda couberem no que sobrou
+                linha = truncate_tokens(linha, max(budget, 50))
+                janela.append(linha)
+                budget -= estimate_tokens(linha)
+                continue
+            break
+        janela.append(linha)
+        budget -= custo
+    fora = rows[len(janela):]
+
+    partes = []
+    if resumo:
+        partes.append(f"Resumo da conversa até aqui: {resumo}")
+    if janela:
+        partes.append("Mensagens recentes:\n" + '\n'.join(reversed(janela)))
+    resumir_ate = fora[0]['id'] if len(fora) >= SUMMARY_BATCH else None
+    return '\n\n'.join(partes), resumir_ate
+
+
+# --- RESUMO EM SEGUNDO PLANO ---
+
+_summary_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='resumo')
+_summary_pending = set()
+_summary_lock = threading.Lock()
+
+
+def summary_prompt(resumo, mensagens):
+    linhas = '\n'.join(f"{_PAPEIS.get(m['papel'], m['papel'])}: {m['conteudo']}" for m in mensagens)
+    return (f"Atualize o resumo de uma conversa entre um usuário e o assistente de uma base de questões escolares. "
+            f"Mantenha os fatos, pedidos e preferências que possam ser úteis depois, em no máximo "
+            f"{SUMMARY_TOKENS * 3 // 4} palavras. Responda apenas com o novo resumo.\n\n"
+            f"Resumo atual: {resumo or '(vazio)'}\n\nNovas mensagens:\n{linhas}")
+
+
+def summarize(conn, conversa_id, ate_id):
+    """Incorpora ao resumo as mensagens até `ate_id` que ainda não estão nele. Retorna True se atualizou."""
+    with conn.cursor() as cur:
+        cur.execute("SELECT resumo, resumo_ate FROM conversas WHERE id = %s", (conversa_id,))
+        row = cur.fetchone()
+        if row is None or row[1] >= ate_id:
+            conn.rollback()
+            return False
+        resumo, resumo_ate = row
+        cur.execute("""SELECT papel, conteudo FROM conversa_mensagens
+                       WHERE conversa_id = %s AND id > %s AND id <= %s ORDER BY id""",
+                    (conversa_id, resumo_ate, ate_id))
+        mensagens = [{'papel': papel, 'conteudo': conteudo} for papel, conteudo in cur.fetchall()]
+    conn.rollback()  # não segura a transação enquanto o modelo responde
+    novo = ' '.join(llm.generate(summary_prompt(resumo, mensagens)).split())
+    with conn.cursor() as cur:
+        # só grava se ninguém atualizou o resumo nesse meio-tempo
+        cur.execute("""UPDATE conversas SET resumo = %s, resumo_ate = %s
+                       WHERE id = %s AND resumo_ate = %s""",
+                    (truncate_tokens(novo, SUMMARY_TOKENS), ate_id, conversa_id, resumo_ate))
+        updated = cur.rowcount == 1
+    conn.commit()
+    return updated
+
+
+def schedule_summary(conversa_id, ate_id):
+    """Atualiza o resumo da conversa em segundo plano (no máximo uma vez por conversa ao mesmo tempo)."""
+    with _summary_lock:
+        if conversa_id in _summary_pending:
+            return
+        _summary_pending.add(conversa_id)
+    _summary_executor.submit(_summary_job, conversa_id, ate_id)
+
+
+def _summary_job(conversa_id, ate_id):
+    import db
+
+    try:
+        with db.get_pool().connection() as conn:
+            summarize(conn, conversa_id, ate_id)
+    except llm.LLMBusy:
+        # o pool de IA está ocupado com pedidos de usuários; tenta de novo na próxima mensagem
+        pass
+    except Exception as e:
+        print(f"Erro ao resumir a conversa {conversa_id}: {e}")
+    finally:
+        with _summary_lock:
+            _summary_pending.discard(conversa_id)
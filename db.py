@@ -0,0 +1,321 @@
+# db.py
+"""Pool de conexões PostgreSQL compartilhado por app.py e add_user.py.
+
+O pool é criado uma única vez por processo (workers com fork recriam o seu
+próprio pool) e mantém entre DB_POOL_MIN e DB_POOL_MAX conexões abertas.
+Conexões ociosas há mais de DB_POOL_HEALTHCHECK_INTERVAL segundos são
+testadas com SELECT 1 antes de serem entregues; as que ultrapassam
+DB_POOL_MAX_LIFETIME são descartadas e reabertas.
+"""
+import os
+import time
+import threading
+from contextlib import contextmanager
+import psycopg2
+from psycopg2 import extensions
+
+
+class PoolTimeout(psycopg2.OperationalError):
+    """Nenhuma conexão ficou disponível dentro do tempo de espera configurado."""
+
+
+def connect():
+    """Abre uma conexão nova com o banco de dados PostgreSQL."""
+    conn_str = os.environ.get('DATABASE_URL')
+    if conn_str:
+        return psycopg2.connect(conn_str)
+    return psycopg2.connect(
+        host=os.environ.get('DB_HOST'),
+        dbname=os.environ.get('DB_NAME'),
+        user=os.environ.get('DB_USER'),
+        password=os.environ.get('DB_PASSWORD'),
+        port=os.environ.get('DB_PORT', 5432)
+    )
+
+
+class _Entry:
+    __slots__ = ('conn', 'created_at', 'last_used')
+
+    def __init__(self, conn):
+        now = time.monotonic()
+        self.conn = conn
+        self.created_at = now
+        self.last_used = now
+
+
+class ConnectionPool:
+    """Pool thread-safe de conexões psycopg2 com health-check e métricas.
+
+    - min_size conexões ficam abertas permanentemente;
+    - acima disso o pool cresce sob demanda até max_size (overflow);
+    - com todas as conexões em uso, getconn() espera até `timeout` segundos;
+    - conexões de overflow ociosas são fechadas após `overflow_idle_timeout`.
+    """
+
+    def __init__(self, min_size=1, max_size=10, timeout=30.0,
+                 healthcheck_interval=30.0, max_lifetime=1800.0, overflow_idle_timeout=300.0,
+                 connect_fn=connect):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError('Configuração inválida do pool: exige 0 <= min_size <= max_size e max_size >= 1.')
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.healthcheck_interval = healthcheck_interval
+        self.max_lifetime = max_lifetime
+        self.overflow_idle_timeout = overflow_idle_timeout
+        self._connect = connect_fn
+        self._cond = threading.Condition()
+        self._idle = []
+        self._in_use = {}
+        self._opening = 0
+        self._waiting = 0
+        self._closed = False
+        self._metrics = {
+            'checkouts': 0,
+            'wait_time_total': 0.0,
+            'wait_time_max': 0.0,
+            'waits': 0,
+            'timeouts': 0,
+            'created': 0,
+            'discarded_stale': 0,
+            'overflow_peak': 0,
+        }
+        for _ in range(min_size):
+            self._idle.append(self._open())
+
+    # --- ciclo de vida das conexões ---
+
+    def _open(self):
+        entry = _Entry(self._connect())
+        with self._cond:
+            self._metrics['created'] += 1
+        return entry
+
+    @staticmethod
+    def _discard(entry):
+        try:
+            entry.conn.close()
+        except Exception:
+            pass
+
+    def _size(self):
+        return len(self._idle) + len(self._in_use) + self._opening
+
+    def _is_healthy(self, entry):
+        conn = entry.conn
+        if conn.closed:
+            return False
+        now = time.monotonic()
+        if self.max_lifetime and now - entry.created_at > self.max_lifetime:
+            return False
+        if now - entry.last_used < self.healthcheck_interval:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute('SELECT 1')
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def getconn(self):
+        """Retira uma conexão do pool, abrindo uma nova se houver espaço."""
+        started = time.monotonic()
+        waited = False
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise psycopg2.InterfaceError('O pool de conexões está fechado.')
+                if self._idle:
+                    # a conexão deixa de ser ociosa mas o lugar dela continua reservado
+                    # (_opening) durante o health-check e uma eventual reconexão
+                    entry = self._idle.pop()
+                    self._opening += 1
+                    break
+                if self._size() < self.max_size:
+                    # reserva o lugar antes de conectar fora do lock
+                    entry = None
+                    self._opening += 1
+                    break
+                remaining = self.timeout - (time.monotonic() - started)
+                if remaining <= 0:
+                    self._metrics['timeouts'] += 1
+                    raise PoolTimeout(f'Nenhuma conexão disponível após {self.timeout:.1f}s.')
+                waited = True
+                self._waiting += 1
+                try:
+                    self._cond.wait(remaining)
+                finally:
+                    self._waiting -= 1
+
+        try:
+            if entry is not None and not self._is_healthy(entry):
+                self._discard(entry)
+                with self._cond:
+                    self._metrics['discarded_stale'] += 1
+                entry = None
+            if entry is None:
+                entry = self._open()
+        except BaseException:
+            with self._cond:
+                self._opening -= 1
+                self._cond.notify()
+            raise
+
+        wait = time.monotonic() - started
+        with self._cond:
+            self._opening -= 1
+            self._in_use[id(entry.conn)] = entry
+            self._metrics['checkouts'] += 1
+            if waited:
+                self._metrics['waits'] += 1
+            self._metrics['wait_time_total'] += wait
+            self._metrics['wait_time_max'] = max(self._metrics['wait_time_max'], wait)
+            overflow = max(0, self._size() - self.min_size)
+            self._metrics['overflow_peak'] = max(self._metrics['overflow_peak'], overflow)
+        return entry.conn
+
+    def putconn(self, conn):
+        """Devolve uma conexão ao pool, desfazendo transações pendentes."""
+        with self._cond:
+            entry = self._in_use.pop(id(conn), None)
+        if entry is None:
+            return
+        keep = not conn.closed and not self._closed
+        if keep:
+            try:
+                if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except psycopg2.Error:
+                keep = False
+        with self._cond:
+            if keep:
+                entry.last_used = time.monotonic()
+                self._idle.append(entry)
+            else:
+                self._discard(entry)
+            self._prune_overflow()
+            self._cond.notify()
+
+    def _prune_overflow(self):
+        # As conexões ociosas são reutilizadas em ordem LIFO, então as do início
+        # da lista são as mais antigas; as de overflow são fechadas após ficarem
+        # `overflow_idle_timeout` segundos sem uso.
+        now = time.monotonic()
+        while (self._idle and self._size() > self.min_size
+               and now - self._idle[0].last_used > self.overflow_idle_timeout):
+            self._discard(self._idle.pop(0))
+
+    @contextmanager
+    def connection(self):
+        """Context manager: `with pool.connection() as conn: ...`."""
+        conn = self.getconn()
+        try:
+            yield conn
+        finally:
+            self.putconn(conn)
+
+    def closeall(self):
+        with self._cond:
+            self._closed = True
+            for entry in self._idle:
+                self._discard(entry)
+            self._idle = []
+            self._cond.notify_all()
+
+    def stats(self):
+        """Retorna as métricas do pool (contadores acumulados e estado atual)."""
+        with self._cond:
+            data = dict(self._metrics)
+            data.update({
+                'min_size': self.min_size,
+                'max_size': self.max_size,
+                'idle': len(self._idle),
+                'in_use': len(self._in_use),
+                'overflow': max(0, self._size() - self.min_size),
+            })
+        checkouts = data['checkouts'] or 1
+        data['wait_time_avg'] = data['wait_time_total'] / checkouts
+        return data
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Retorna o pool do processo atual, criando-o no primeiro uso.
+
+    Após um fork (ex.: gunicorn com --preload) o PID muda e um pool novo é
+    criado, pois conexões não podem ser compartilhadas entre processos.
+    """
+    global _pool, _pool_pid
+    pid = os.getpid()
+    if _pool is not None and _pool_pid == pid:
+        return _pool
+    with _pool_lock:
+        if _pool is None or _pool_pid != pid:
+            _pool = ConnectionPool(
+                min_size=int(os.environ.get('DB_POOL_MIN', 1)),
+                max_size=int(os.environ.get('DB_POOL_MAX', 10)),
+                timeout=float(os.environ.get('DB_POOL_TIMEOUT', 30)),
+                healthcheck_interval=float(os.environ.get('DB_POOL_HEALTHCHECK_INTERVAL', 30)),
+                max_lifetime=float(os.environ.get('DB_POOL_MAX_LIFETIME', 1800)),
+                overflow_idle_timeout=float(os.environ.get('DB_POOL_OVERFLOW_IDLE_TIMEOUT', 300)),
+            )
+            _pool_pid = pid
+    return _pool
+
+
+class SchemaRegistry:
+    """Cache process-wide das colunas existentes em cada tabela do schema.
+
+    O catálogo (information_schema) é lido uma única vez — na inicialização do
+    app ou, se o banco ainda não estiver no ar, no primeiro uso — e
+    reaproveitado por todos os requests. Com `ttl` > 0 a leitura é refeita
+    após `ttl` segundos; refresh() força a releitura (ex.: após uma migração).
+    """
+
+    def __init__(self, ttl=0.0):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._columns = None
+        self._loaded_at = 0.0
+
+    def refresh(self):
+        """Relê o catálogo do banco e substitui o cache."""
+        with get_pool().connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""SELECT table_name, column_name
+                               FROM information_schema.columns
+                               WHERE table_schema = ANY (current_schemas(false))""")
+                rows = cur.fetchall()
+        columns = {}
+        for table, column in rows:
+            columns.setdefault(table, set()).add(column)
+        snapshot = {t: frozenset(c) for t, c in columns.items()}
+        with self._lock:
+            self._columns = snapshot
+            self._loaded_at = time.monotonic()
+        return snapshot
+
+    def invalidate(self):
+        """Descarta o cache; a próxima consulta relê o catálogo."""
+        with self._lock:
+            self._columns = None
+
+    def columns(self, table):
+        """Retorna o frozenset de colunas de `table` (vazio se a tabela não existir)."""
+        # cache e horário lidos juntos: outra thread pode invalidar/recarregar a qualquer momento
+        with self._lock:
+            snapshot, loaded_at = self._columns, self._loaded_at
+        if snapshot is None or (self.ttl and time.monotonic() - loaded_at > self.ttl):
+            snapshot = self.refresh()
+        return snapshot.get(table, frozenset())
+
+    def has(self, table, column):
+        return column in self.columns(table)
+
+
+schema = SchemaRegistry(ttl=float(os.environ.get('SCHEMA_CACHE_TTL', 0)))
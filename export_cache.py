@@ -0,0 +1,157 @@
+# export_cache.py
+"""Cache em disco dos arquivos de exportação já gerados.
+
+A chave (cache_key) combina o formato, as opções do renderer, os IDs ordenados
+e a versão de cada questão (questoes.versao, incrementada por trigger a cada
+alteração da questão ou das suas opções). Exportar de novo a mesma lista sem
+mudanças devolve o arquivo do disco, sem refazer o documento; a chave também
+serve de ETag forte.
+
+O tamanho total é limitado por EXPORT_CACHE_MAX_BYTES: ao gravar, os arquivos
+usados há mais tempo (mtime, renovado a cada acerto) são removidos primeiro.
+O diretório pode ser compartilhado entre processos (gravações atômicas).
+"""
+import os
+import json
+import time
+import shutil
+import hashlib
+import tempfile
+
+import exporters
+
+DEFAULT_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'exportacoes', 'cache')
+
+
+def cache_key(formato, opcoes, questoes):
+    """Chave SHA-256 de uma exportação; `questoes` precisam trazer 'id' e 'versao'."""
+    payload = {
+        'renderer': exporters.RENDER_VERSION,
+        'formato': formato,
+        'opcoes': opcoes,
+        'questoes': sorted((q['id'], q['versao']) for q in questoes),
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class ExportCache:
+    """Arquivos <chave>.<extensão> sob `root`, com despejo LRU por tamanho total."""
+
+    def __init__(self, root, max_bytes):
+        self.root = root
+        self.max_bytes = max_bytes
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, key, extension):
+        return os.path.join(self.root, f"{key}.{extension}")
+
+    def open(self, key, extension):
+        """Arquivo aberto (binário) do artefato, ou None se não estiver no cache.
+
+        Abrir antes de responder evita corrida com o despejo feito por outro
+        processo: no POSIX o arquivo aberto continua legível mesmo se removido.
+        """
+        path = self.path(key, extension)
+        try:
+            f = open(path, 'rb')
+        except FileNotFoundError:
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return f
+
+    def put_file(self, key, extension, src_path):
+        """Move `src_path` (já completo) para o cache e aplica o limite de tamanho."""
+        path = self.path(key, extension)
+        os.replace(src_path, path)
+        self.evict()
+        return path
+
+    def add(self, key, extension, src_path):
+        """Guarda uma cópia de `src_path` no cache (hard link quando possível)."""
+        tmp = self.temp_path()
+        os.unlink(tmp)
+        try:
+            os.link(src_path, tmp)
+        except OSError:
+            shutil.copyfile(src_path, tmp)
+        return self.put_file(key, extension, tmp)
+
+    def temp_path(self):
+        """Caminho temporário no próprio diretório do cache (para um put_file atômico)."""
+        fd, path = tempfile.mkstemp(dir=self.root, prefix='.tmp-')
+        os.close(fd)
+        return path
+
+    def evict(self):
+        """Remove os artefatos menos usados até o total caber em max_bytes."""
+        entries = []
+        total = 0
+        with os.scandir(self.root) as it:
+            for entry in it:
+                if entry.name.startswith('.') or not entry.is_file():
+                    continue
+                st = entry.stat()
+                entries.append((st.st_mtime, st.st_size, entry.path))
+                total += st.st_size
+        if total <= self.max_bytes:
+            return 0
+        removed = 0
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            removed += 1
+        return removed
+
+    def clear_stale_temp(self, max_age=3600):
+        """Apaga temporários órfãos (gravação interrompida)."""
+        cutoff = time.time() - max_age
+        with os.scandir(self.root) as it:
+            for entry in it:
+                if entry.name.startswith('.tmp-') and entry.stat().st_mtime < cutoff:
+                    try:
+                        os.unlink(entry.path)
+                    except FileNotFoundError:
+                        pass
+
+
+def render_to_cache(cache, formato, opcoes, questoes, load_image, progress=None):
+    """Renderiza `questoes` (iterável, ex.: question_loader.iter_questions) direto
+    num temporário do cache e o grava sob a chave das versões efetivamente lidas.
+
+    A chave calculada antes de renderizar (a partir de load_versions) pode ficar
+    velha se uma questão for editada no meio da exportação; gravar sob a chave
+    do que foi renderizado mantém o cache consistente. Retorna (chave, arquivo),
+    com o arquivo já aberto para leitura (como em open()).
+    """
+    renderer = exporters.get_renderer(formato)
+    lidas = []
+
+    def registrar():
+        for q in questoes:
+            lidas.append({'id': q['id'], 'versao': q['versao']})
+            yield q
+
+    tmp = cache.temp_path()
+    try:
+        with open(tmp, 'wb') as out:
+            renderer.build(registrar(), load_image, out, progress, **opcoes)
+        artefato = open(tmp, 'rb')
+    except BaseException:
+        os.unlink(tmp)
+        raise
+    chave = cache_key(formato, opcoes, lidas)
+    cache.put_file(chave, renderer.extension, tmp)
+    return chave, artefato
+
+
+def get_cache():
+    return ExportCache(os.environ.get('EXPORT_CACHE_DIR', DEFAULT_ROOT),
+                       int(os.environ.get('EXPORT_CACHE_MAX_BYTES', 512 * 1024 * 1024)))
@@ -0,0 +1,333 @@
+# export_jobs.py
+"""Exportações assíncronas: fila em PostgreSQL (tabela export_jobs) e workers em processos separados.
+
+Fluxo:
+1. o app chama create_job() com os IDs e o formato; o pedido vira uma linha
+   'pendente' e os workers são avisados com NOTIFY export_jobs;
+2. um worker (`python export_jobs.py worker`) reserva a linha com
+   FOR UPDATE SKIP LOCKED, gera o arquivo em EXPORT_SPOOL_DIR e atualiza
+   processadas/total enquanto trabalha;
+3. o cliente acompanha GET /export_jobs/<id> e baixa o arquivo pronto em
+   GET /export_jobs/<id>/download;
+4. os arquivos expiram após EXPORT_ARTIFACT_TTL segundos e são apagados pelo worker.
+
+Cada usuário pode ter no máximo EXPORT_MAX_JOBS_PER_USER exportações em
+andamento. Se EXPORT_EMBEDDED_WORKERS > 0, o próprio app inicia esse número de
+workers (subprocessos) no primeiro pedido; eles são encerrados quando o
+processo do app termina (atexit) e, se o app morrer sem isso (SIGKILL, reinício
+do reloader), saem sozinhos ao perceber que o processo pai mudou. Em produção
+com vários servidores ou workers do gunicorn, rode os workers à parte e use
+EXPORT_EMBEDDED_WORKERS=0. O diretório de spool precisa ser compartilhado entre
+o app e os workers.
+"""
+import os
+import sys
+import time
+import atexit
+import select
+import shutil
+import secrets
+import subprocess
+import threading
+import psycopg2
+from psycopg2.extras import DictCursor, Json
+
+import exporters
+import export_cache
+import question_loader
+
+DEFAULT_SPOOL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'exportacoes')
+SPOOL_DIR = os.environ.get('EXPORT_SPOOL_DIR', DEFAULT_SPOOL_DIR)
+ARTIFACT_TTL = float(os.environ.get('EXPORT_ARTIFACT_TTL', 3600))
+MAX_ACTIVE_PER_USER = int(os.environ.get('EXPORT_MAX_JOBS_PER_USER', 2))
+MAX_QUESTIONS = int(os.environ.get('EXPORT_MAX_QUESTIONS', 2000))
+JOB_TIMEOUT = float(os.environ.get('EXPORT_JOB_TIMEOUT', 900))
+EMBEDDED_WORKERS = int(os.environ.get('EXPORT_EMBEDDED_WORKERS', 1))
+
+CHANNEL = 'export_jobs'
+# classe usada em pg_advisory_xact_lock(classe, usuario_id) ao criar jobs
+_LOCK_CLASS = 7001
+
+ACTIVE_STATUSES = ('pendente', 'processando')
+
+
+class JobLimitExceeded(Exception):
+    """O usuário já tem o número máximo de exportações em andamento."""
+
+
+def artifact_path(nome):
+    return os.path.join(SPOOL_DIR, os.path.basename(nome))
+
+
+# --- LADO DO APP ---
+
+def create_job(conn, usuario_id, ids, formato, opcoes=None):
+    """Enfileira uma exportação e retorna o id do job.
+
+    `opcoes` são as opções do renderer (exporters.clean_options). Levanta
+    ValueError para formato/IDs/opções inválidos e JobLimitExceeded se o
+    usuário já tiver MAX_ACTIVE_PER_USER jobs pendentes ou em processamento.
+    """
+    exporters.get_renderer(formato)
+    opcoes = exporters.clean_options(opcoes)
+    ids = sorted({int(i) for i in ids})
+    if not ids:
+        raise ValueError("Nenhum ID fornecido para exportação.")
+    if len(ids) > MAX_QUESTIONS:
+        raise ValueError(f"Selecione no máximo {MAX_QUESTIONS} questões por exportação.")
+    job_id = secrets.token_urlsafe(16)
+    with conn.cursor() as cur:
+        # serializa a criação de jobs do mesmo usuário para o limite valer sob concorrência
+        cur.execute("SELECT pg_advisory_xact_lock(%s, %s)", (_LOCK_CLASS, usuario_id))
+        cur.execute("SELECT COUNT(*) FROM export_jobs WHERE usuario_id = %s AND status = ANY(%s)",
+                    (usuario_id, list(ACTIVE_STATUSES)))
+        if cur.fetchone()[0] >= MAX_ACTIVE_PER_USER:
+            conn.rollback()
+            raise JobLimitExceeded(
+                f"Você já tem {MAX_ACTIVE_PER_USER} exportações em andamento. Aguarde a conclusão.")
+        cur.execute("""INSERT INTO export_jobs (id, usuario_id, formato, opcoes, questao_ids, total)
+                       VALUES (%s, %s, %s, %s, %s, %s)""",
+                    (job_id, usuario_id, formato, Json(opcoes), ids, len(ids)))
+        cur.execute(f"NOTIFY {CHANNEL}")
+    conn.commit()
+    return job_id
+
+
+def get_job(cursor, job_id, usuario_id):
+    """Linha do job, se pertencer ao usuário; None caso contrário."""
+    cursor.execute("""SELECT id, formato, status, processadas, total, arquivo, nome_arquivo, erro, chave_cache,
+                             criado_em, concluido_em, expira_em, expira_em < NOW() AS vencido
+                      FROM export_jobs WHERE id = %s AND usuario_id = %s""", (job_id, usuario_id))
+    return cursor.fetchone()
+
+
+def job_status(job):
+    """Representação JSON do estado de um job (sem caminhos do servidor)."""
+    status = 'expirado' if job['status'] == 'concluido' and job['vencido'] else job['status']
+    total = job['total'] or 0
+    return {
+        'job_id': job['id'],
+        'formato': job['formato'],
+        'status': status,
+        'processadas': job['processadas'],
+        'total': total,
+        'progresso': 100 if status == 'concluido' else (int(100 * job['processadas'] / total) if total else 0),
+        'erro': job['erro'],
+        'expira_em': job['expira_em'].isoformat() if job['expira_em'] else None,
+    }
+
+
+_workers = []
+_workers_lock = threading.Lock()
+_workers_atexit = False
+
+
+def ensure_workers():
+    """Inicia (ou reinicia) os workers embutidos configurados por EXPORT_EMBEDDED_WORKERS."""
+    global _workers_atexit
+    if EMBEDDED_WORKERS <= 0:
+        return
+    with _workers_lock:
+        if not _workers_atexit:
+            atexit.register(stop_workers)
+            _workers_atexit = True
+        _workers[:] = [p for p in _workers if p.poll() is None]
+        while len(_workers) < EMBEDDED_WORKERS:
+            _workers.append(subprocess.Popen([sys.executable, os.path.abspath(__file__), 'worker',
+                                              '--parent-pid', str(os.getpid())]))
+
+
+def stop_workers(timeout=5.0):
+    """Encerra os workers embutidos deste processo (SIGTERM e, após `timeout`, SIGKILL)."""
+    with _workers_lock:
+        workers, _workers[:] = list(_workers), []
+    for p in workers:
+        if p.poll() is None:
+            p.terminate()
+    deadline = time.monotonic() + timeout
+    for p in workers:
+        try:
+            p.wait(max(deadline - time.monotonic(), 0))
+        except subprocess.TimeoutExpired:
+            p.kill()
+            p.wait()
+
+
+# --- LADO DO WORKER ---
+
+def claim_next(conn):
+    """Reserva o job pendente mais antigo; retorna a linha ou None."""
+    with conn.cursor(cursor_factory=DictCursor) as cur:
+        cur.execute("""UPDATE export_jobs SET status = 'processando', iniciado_em = NOW()
+                       WHERE id = (SELECT id FROM export_jobs WHERE status = 'pendente'
+                                   ORDER BY criado_em FOR UPDATE SKIP LOCKED LIMIT 1)
+                       RETURNING id, usuario_id, formato, opcoes, questao_ids""")
+        job = cur.fetchone()
+    conn.commit()
+    return job
+
+
+def run_job(conn, load_image, job, cache, status_conn):
+    """Gera o arquivo de um job já reservado e registra o resultado.
+
+    As questões são lidas de cursores nomeados em `conn` (question_loader.iter_questions)
+    e o documento vai direto para um arquivo do `cache` (export_cache.ExportCache):
+    uma exportação idêntica já gerada (mesmo formato, opções e versões das questões)
+    é reaproveitada, e a memória do worker não depende do tamanho do job. Como um
+    commit em `conn` fecharia os cursores, o progresso é gravado por `status_conn`
+    (em autocommit).
+    """
+    renderer = exporters.get_renderer(job['formato'])
+    extensao = renderer.extension
+    os.makedirs(SPOOL_DIR, exist_ok=True)
+    nome = f"{job['id']}.{extensao}"
+    tmp_path = artifact_path(nome + '.part')
+    last_update = [0.0]
+
+    def progress(done):
+        now = time.monotonic()
+        if now - last_update[0] < 0.5:
+            return
+        last_update[0] = now
+        with status_conn.cursor() as cur:
+            cur.execute("UPDATE export_jobs SET processadas = %s WHERE id = %s", (done, job['id']))
+
+    try:
+        with conn.cursor() as cur:
+            versoes = question_loader.load_versions(cur, job['questao_ids'])
+        with status_conn.cursor() as cur:
+            cur.execute("UPDATE export_jobs SET total = %s WHERE id = %s", (len(versoes), job['id']))
+        if not versoes:
+            raise ValueError("Nenhuma questão encontrada para os IDs fornecidos.")
+        opcoes = exporters.clean_options(job['opcoes'])
+        chave = export_cache.cache_key(job['formato'], opcoes, versoes)
+        artefato = cache.open(chave, extensao)
+        if artefato is None:
+            questoes = question_loader.iter_questions(conn, job['questao_ids'], variante='exportacao',
+                                                      legacy_bytes=True)
+            chave, artefato = export_cache.render_to_cache(cache, job['formato'], opcoes, questoes,
+                                                           load_image, progress)
+        conn.rollback()
+        with artefato, open(tmp_path, 'wb') as out:
+            shutil.copyfileobj(artefato, out)
+        os.replace(tmp_path, artifact_path(nome))
+        timestamp = time.strftime('%Y%m%d_%H%M%S')
+        with status_conn.cursor() as cur:
+            cur.execute("""UPDATE export_jobs
+                           SET status = 'concluido', processadas = total, arquivo = %s, nome_arquivo = %s,
+                               chave_cache = %s, concluido_em = NOW(),
+                               expira_em = NOW() + make_interval(secs => %s)
+                           WHERE id = %s""",
+                        (nome, f"questoes_export_{timestamp}.{extensao}", chave, ARTIFACT_TTL, job['id']))
+    except Exception as e:
+        conn.rollback()
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        print(f"Erro na exportação {job['id']}: {e}")
+        mensagem = str(e) if isinstance(e, ValueError) else "Erro ao gerar o arquivo."
+        with status_conn.cursor() as cur:
+            cur.execute("UPDATE export_jobs SET status = 'erro', erro = %s, concluido_em = NOW() WHERE id = %s",
+                        (mensagem, job['id']))
+
+
+def expire_jobs(conn):
+    """Apaga arquivos vencidos, marca jobs travados como erro e remove registros antigos."""
+    with conn.cursor() as cur:
+        cur.execute("""UPDATE export_jobs SET status = 'expirado'
+                       WHERE id IN (SELECT id FROM export_jobs WHERE status = 'concluido' AND expira_em < NOW()
+                                    FOR UPDATE SKIP LOCKED)
+                       RETURNING arquivo""")
+        arquivos = [row[0] for row in cur.fetchall() if row[0]]
+        # worker que morreu no meio de um job (OOM, deploy...)
+        cur.execute("""UPDATE export_jobs SET status = 'erro', erro = 'A exportação excedeu o tempo limite.'
+                       WHERE status = 'processando' AND iniciado_em < NOW() - make_interval(secs => %s)""",
+                    (JOB_TIMEOUT,))
+        cur.execute("""DELETE FROM export_jobs
+                       WHERE status IN ('expirado', 'erro') AND criado_em < NOW() - INTERVAL '7 days'""")
+    conn.commit()
+    for nome in arquivos:
+        try:
+            os.unlink(artifact_path(nome))
+        except FileNotFoundError:
+            pass
+    return len(arquivos)
+
+
+def run_worker(poll_interval=5.0, sweep_interval=60.0, parent_pid=None):
+    """Laço principal do worker: espera NOTIFY (ou o poll_interval), processa a fila e faz a limpeza.
+
+    Com `parent_pid` (workers embutidos), termina quando o processo pai deixa de existir.
+    """
+    import db
+    import media_store
+
+    store = media_store.get_store()
+    cache = export_cache.get_cache()
+    cache.clear_stale_temp()
+
+    def load_image(imagem_hash, legacy_bytes=None):
+        if legacy_bytes is not None:
+            return bytes(legacy_bytes)
+        return store.get(imagem_hash)
+
+    def orphaned():
+        return parent_pid is not None and os.getppid() != parent_pid
+
+    print(f"Worker de exportação iniciado (pid {os.getpid()}).")
+    while not orphaned():
+        conn = listen_conn = None
+        try:
+            conn = db.connect()
+            listen_conn = db.connect()
+            listen_conn.set_session(autocommit=True)
+            with listen_conn.cursor() as cur:
+                cur.execute(f"LISTEN {CHANNEL}")
+            last_sweep = 0.0
+            while not orphaned():
+                if time.monotonic() - last_sweep > sweep_interval:
+                    expire_jobs(conn)
+                    last_sweep = time.monotonic()
+                job = claim_next(conn)
+                if job:
+                    # listen_conn está em autocommit: serve também para gravar o progresso
+                    run_job(conn, load_image, job, cache, listen_conn)
+                    continue
+                if select.select([listen_conn], [], [], poll_interval)[0]:
+                    listen_conn.poll()
+                    listen_conn.notifies.clear()
+        except psycopg2.Error as e:
+            print(f"Erro no worker de exportação: {e}")
+            time.sleep(poll_interval)
+        finally:
+            for c in (conn, listen_conn):
+                if c is not None:
+                    c.close()
+    print(f"Worker de exportação {os.getpid()} encerrado: o processo do app terminou.")
+
+
+def main(argv):
+    import argparse
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description='Fila de exportações de questões.')
+    sub = parser.add_subparsers(dest='command', required=True)
+    worker_parser = sub.add_parser('worker', help='Processa a fila de exportações.')
+    worker_parser.add_argument('--poll-interval', type=float, default=5.0)
+    worker_parser.add_argument('--parent-pid', type=int, help=argparse.SUPPRESS)
+    sub.add_parser('expirar', help='Apaga os arquivos vencidos e sai.')
+    args = parser.parse_args(argv)
+
+    if args.command == 'worker':
+        try:
+            run_worker(args.poll_interval, parent_pid=args.parent_pid)
+        except KeyboardInterrupt:
+            pass
+    else:
+        import db
+        with db.get_pool().connection() as conn:
+            print(f"{expire_jobs(conn)} arquivos de exportação removidos.")
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,767 @@
+# exporters.py
+"""Geração dos arquivos de exportação de questões.
+
+Cada formato é um renderer registrado em RENDERERS (docx, pdf, txt, json e,
+para importar em outros sistemas, moodle, gift e qti — pacotes zip).
+Os renderers recebem um iterável de questões no formato de question_loader
+(variante='exportacao', legacy_bytes=True) — uma lista de load_questions() ou,
+para exportações grandes, o gerador iter_questions(), consumido uma única vez —
+e uma função load_image(hash, bytes_legados) que devolve os bytes de uma imagem. Não acessam o banco nem o
+Flask, de modo que rodam tanto no request quanto no worker de export_jobs.py.
+
+Assinatura comum: build(questoes, load_image, out, progress=None, **opcoes), onde
+`out` é um arquivo binário, `progress(n)` é chamado após cada questão e as
+opções reconhecidas são `gabarito` (bool) e `colunas` (int, só no PDF).
+"""
+import io
+import os
+import re
+import json
+import zlib
+import shutil
+import hashlib
+import zipfile
+import tempfile
+from xml.sax.saxutils import escape as xml_escape
+from collections import namedtuple
+from fpdf import FPDF
+from PIL import Image
+
+# Incrementar quando a saída de algum renderer mudar: invalida o cache de exportações.
+RENDER_VERSION = 2
+
+DOCX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+
+Renderer = namedtuple('Renderer', 'extension mimetype build')
+
+RENDERERS = {}
+
+
+def register(formato, extension, mimetype):
+    """Decorator que registra um renderer para `formato`."""
+    def decorator(build):
+        RENDERERS[formato] = Renderer(extension, mimetype, build)
+        return build
+    return decorator
+
+
+def get_renderer(formato):
+    """Renderer do formato pedido; levanta ValueError se não houver."""
+    try:
+        return RENDERERS[formato]
+    except KeyError:
+        raise ValueError(f"Formato de exportação não suportado: {formato}.")
+
+
+def clean_options(opcoes):
+    """Valida as opções de exportação vindas do cliente."""
+    opcoes = opcoes or {}
+    try:
+        colunas = int(opcoes.get('colunas') or 1)
+    except (TypeError, ValueError):
+        raise ValueError("Número de colunas inválido.")
+    return {'gabarito': bool(opcoes.get('gabarito')), 'colunas': min(max(colunas, 1), 3)}
+
+
+def resposta(q):
+    """Resposta de uma questão no gabarito: letras das opções corretas (ou 'Discursiva')."""
+    if q.get('tipo_questao') == 'DISCURSIVA':
+        return 'Discursiva'
+    letras = [chr(ord('A') + i) for i, op in enumerate(q['opcoes']) if op.get('is_correta')]
+    return ', '.join(letras) or '-'
+
+
+def embeddable_image(data):
+    """(bytes, extensão, largura, altura) de uma imagem em JPEG ou PNG, formatos
+    aceitos tanto pelo Word quanto pelo FPDF; outros formatos são convertidos para PNG."""
+    img = Image.open(io.BytesIO(data))
+    width, height = img.size
+    if img.format == 'JPEG' and img.mode in ('RGB', 'L', 'CMYK'):
+        return data, 'jpeg', width, height
+    if img.format == 'PNG' and not img.info.get('interlace'):
+        return data, 'png', width, height
+    # PNG entrelaçado, GIF, WEBP... são recodificados como PNG simples
+    out = io.BytesIO()
+    img.convert('RGBA' if 'A' in img.getbands() or 'transparency' in img.info else 'RGB').save(out, 'PNG')
+    return out.getvalue(), 'png', width, height
+
+
+# --- DOCX ---
+# O documento é montado diretamente como pacote OOXML (zip), sem o grafo de
+# objetos do python-docx: o corpo (word/document.xml) vai para um arquivo
+# temporário em spool à medida que as questões chegam, as imagens entram no zip
+# uma única vez cada, e só no final o corpo é copiado para o pacote.
+
+_DOCX_SPOOL_MAX = 4 * 1024 * 1024
+_EMU_PER_INCH = 914400
+_XML_INVALID = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+_DOCX_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Default Extension="jpeg" ContentType="image/jpeg"/>'
+    '<Default Extension="png" ContentType="image/png"/>'
+    '<Override PartName="/word/document.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+    '<Override PartName="/word/styles.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.styles+xml"/>'
+    '</Types>')
+
+_DOCX_ROOT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="word/document.xml"/>'
+    '</Relationships>')
+
+# Arial 11 como padrão e o estilo de título usado no gabarito
+_DOCX_STYLES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<w:styles xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+    '<w:docDefaults><w:rPrDefault><w:rPr>'
+    '<w:rFonts w:ascii="Arial" w:hAnsi="Arial" w:eastAsia="Arial" w:cs="Arial"/>'
+    '<w:sz w:val="22"/><w:szCs w:val="22"/><w:lang w:val="pt-BR"/>'
+    '</w:rPr></w:rPrDefault>'
+    '<w:pPrDefault><w:pPr><w:spacing w:after="160" w:line="259" w:lineRule="auto"/></w:pPr></w:pPrDefault>'
+    '</w:docDefaults>'
+    '<w:style w:type="paragraph" w:default="1" w:styleId="Normal"><w:name w:val="Normal"/></w:style>'
+    '<w:style w:type="paragraph" w:styleId="Heading1"><w:name w:val="heading 1"/>'
+    '<w:basedOn w:val="Normal"/><w:next w:val="Normal"/>'
+    '<w:pPr><w:keepNext/><w:spacing w:before="240" w:after="120"/><w:outlineLvl w:val="0"/></w:pPr>'
+    '<w:rPr><w:b/><w:sz w:val="32"/></w:rPr></w:style>'
+    '</w:styles>')
+
+_DOCX_BODY_START = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships" '
+    'xmlns:wp="http://schemas.openxmlformats.org/drawingml/2006/wordprocessingDrawing" '
+    'xmlns:a="http://schemas.openxmlformats.org/drawingml/2006/main" '
+    'xmlns:pic="http://schemas.openxmlformats.org/drawingml/2006/picture">'
+    '<w:body>')
+
+# A4, margens de 2,5 cm
+_DOCX_BODY_END = (
+    '<w:sectPr><w:pgSz w:w="11906" w:h="16838"/>'
+    '<w:pgMar w:top="1417" w:right="1417" w:bottom="1417" w:left="1417" '
+    'w:header="708" w:footer="708" w:gutter="0"/></w:sectPr>'
+    '</w:body></w:document>')
+
+
+def _docx_text(text):
+    return xml_escape(_XML_INVALID.sub('', text or ''))
+
+
+def _docx_paragraph(text, style=None):
+    ppr = f'<w:pPr><w:pStyle w:val="{style}"/></w:pPr>' if style else ''
+    runs = '<w:r><w:br/></w:r>'.join(
+        f'<w:r><w:t xml:space="preserve">{_docx_text(line)}</w:t></w:r>' for line in (text or '').split('\n'))
+    return f'<w:p>{ppr}{runs}</w:p>'
+
+
+class _DocxWriter:
+    """Escreve o pacote DOCX incrementalmente em `out`."""
+
+    def __init__(self, out):
+        self.zip = zipfile.ZipFile(out, 'w', zipfile.ZIP_DEFLATED)
+        self.body = tempfile.SpooledTemporaryFile(max_size=_DOCX_SPOOL_MAX)
+        self.images = {}  # sha256 -> (rId, largura, altura)
+        self.drawings = 0
+        self.zip.writestr('[Content_Types].xml', _DOCX_CONTENT_TYPES)
+        self.zip.writestr('_rels/.rels', _DOCX_ROOT_RELS)
+        self.zip.writestr('word/styles.xml', _DOCX_STYLES)
+        self.write(_DOCX_BODY_START)
+
+    def write(self, xml):
+        self.body.write(xml.encode('utf-8'))
+
+    def paragraph(self, text, style=None):
+        self.write(_docx_paragraph(text, style))
+
+    def page_break(self):
+        self.write('<w:p><w:r><w:br w:type="page"/></w:r></w:p>')
+
+    def picture(self, data, width_inches):
+        key = hashlib.sha256(data).hexdigest()
+        if key not in self.images:
+            data, ext, px_w, px_h = embeddable_image(data)
+            rid = f'rIdImg{len(self.images) + 1}'
+            self.zip.writestr(f'word/media/image{len(self.images) + 1}.{ext}', data)
+            self.images[key] = (rid, ext, px_w, px_h)
+        rid, ext, px_w, px_h = self.images[key]
+        self.drawings += 1
+        n = self.drawings
+        cx = int(width_inches * _EMU_PER_INCH)
+        cy = int(cx * px_h / px_w)
+        self.write(
+            f'<w:p><w:r><w:drawing><wp:inline distT="0" distB="0" distL="0" distR="0">'
+            f'<wp:extent cx="{cx}" cy="{cy}"/><wp:docPr id="{n}" name="Imagem {n}"/>'
+            f'<wp:cNvGraphicFramePr><a:graphicFrameLocks noChangeAspect="1"/></wp:cNvGraphicFramePr>'
+            f'<a:graphic><a:graphicData uri="http://schemas.openxmlformats.org/drawingml/2006/picture">'
+            f'<pic:pic><pic:nvPicPr><pic:cNvPr id="{n}" name="imagem{n}.{ext}"/><pic:cNvPicPr/></pic:nvPicPr>'
+            f'<pic:blipFill><a:blip r:embed="{rid}"/><a:stretch><a:fillRect/></a:stretch></pic:blipFill>'
+            f'<pic:spPr><a:xfrm><a:off x="0" y="0"/><a:ext cx="{cx}" cy="{cy}"/></a:xfrm>'
+            f'<a:prstGeom prst="rect"><a:avLst/></a:prstGeom></pic:spPr></pic:pic>'
+            f'</a:graphicData></a:graphic></wp:inline></w:drawing></w:r></w:p>')
+
+    def close(self):
+        self.write(_DOCX_BODY_END)
+        size = self.body.tell()
+        self.body.seek(0)
+        with self.zip.open('word/document.xml', 'w', force_zip64=size >= zipfile.ZIP64_LIMIT) as dst:
+            shutil.copyfileobj(self.body, dst)
+        self.body.close()
+        rels = ['<Relationship Id="rIdStyles" '
+                'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" '
+                'Target="styles.xml"/>']
+        for i, (rid, ext, _, _) in enumerate(self.images.values(), start=1):
+            rels.append(f'<Relationship Id="{rid}" '
+                        f'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/image" '
+                        f'Target="media/image{i}.{ext}"/>')
+        self.zip.writestr('word/_rels/document.xml.rels',
+                          '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                          '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+                          + ''.join(rels) + '</Relationships>')
+        self.zip.close()
+
+
+@register('docx', 'docx', DOCX_MIMETYPE)
+def build_docx(questoes, load_image, out, progress=None, gabarito=False, **_):
+    """Escreve em `out` o DOCX com as questões (uma por página), em memória limitada.
+
+    `questoes` pode ser qualquer iterável (ex.: question_loader.iter_questions):
+    cada questão é escrita e descartada antes da próxima.
+    """
+    doc = _DocxWriter(out)
+    respostas = []
+    for idx, q in enumerate(questoes, start=1):
+        # Apenas adicionar o enunciado (sem número da questão) — não adicionar meta/linha de tipo, nível, grau ou área
+        doc.paragraph(q.get('enunciado') or '')
+
+        # Inserir imagem da questão, se houver (largura de 4 polegadas)
+        if q.get('variante_hash'):
+            try:
+                doc.picture(load_image(q['variante_hash'], q.get('imagem_url')), 4)
+            except Exception as e:
+                print(f"Erro ao inserir imagem da questão {q['id']}: {e}")
+
+        # Opções (sem marcações extras além das letras e texto/imagem)
+        for i, op in enumerate(q['opcoes']):
+            letra = chr(ord('A') + i)
+            doc.paragraph(f"{letra}. {op.get('texto_opcao') or ''}")
+            if op.get('variante_hash'):
+                try:
+                    doc.picture(load_image(op['variante_hash'], op.get('imagem_url')), 3)
+                except Exception as e:
+                    print(f"Erro ao inserir imagem da opção da questão {q['id']}: {e}")
+
+        doc.page_break()
+        if gabarito:
+            respostas.append((idx, resposta(q)))
+        if progress:
+            progress(idx)
+
+    if gabarito:
+        doc.paragraph('Gabarito', style='Heading1')
+        for numero, texto in respostas:
+            doc.paragraph(f"{numero}. {texto}")
+    doc.close()
+
+
+@register('txt', 'txt', 'text/plain')
+def build_txt(questoes, load_image, out, progress=None, gabarito=False, **_):
+    """Texto simples, sem imagens."""
+    respostas = []
+    for idx, q in enumerate(questoes, start=1):
+        linhas = [f"{idx}. {q.get('enunciado') or ''}"]
+        for i, op in enumerate(q['opcoes']):
+            linhas.append(f"   {chr(ord('A') + i)}. {op.get('texto_opcao') or ''}")
+        out.write(('\n'.join(linhas) + '\n\n').encode('utf-8'))
+        if gabarito:
+            respostas.append((idx, resposta(q)))
+        if progress:
+            progress(idx)
+    if gabarito:
+        out.write('Gabarito\n'.encode('utf-8'))
+        for numero, texto in respostas:
+            out.write(f"{numero}. {texto}\n".encode('utf-8'))
+
+
+@register('json', 'json', 'application/json')
+def build_json(questoes, load_image, out, progress=None, **_):
+    """Lista JSON com enunciado, metadados e opções (as imagens vão como hash do media store)."""
+    out.write(b'[')
+    for idx, q in enumerate(questoes, start=1):
+        item = {k: q.get(k) for k in ('id', 'enunciado', 'tipo_questao', 'nivel_dificuldade',
+                                      'grau_ensino', 'area_conhecimento', 'imagem_hash')}
+        item['opcoes'] = [{k: op.get(k) for k in ('texto_opcao', 'is_correta', 'imagem_hash')}
+                          for op in q['opcoes']]
+        if idx > 1:
+            out.write(b',')
+        out.write(json.dumps(item, ensure_ascii=False).encode('utf-8'))
+        if progress:
+            progress(idx)
+    out.write(b']')
+
+
+# --- PDF ---
+
+# As fontes padrão do PDF só cobrem Latin-1; alguns caracteres comuns fora dele
+# (aspas tipográficas, travessões...) são trocados por equivalentes.
+_PDF_REPLACEMENTS = str.maketrans({
+    '\u2018': "'", '\u2019': "'", '\u201c': '"', '\u201d': '"', '\u2013': '-', '\u2014': '-',
+    '\u2026': '...', '\u2022': '-', '\u2212': '-', '\u00a0': ' ',
+})
+
+
+def _pdf_text(text):
+    text = (text or '').translate(_PDF_REPLACEMENTS)
+    return text.encode('latin-1', 'replace').decode('latin-1')
+
+
+class StreamingPDF(FPDF):
+    """FPDF que grava cada página no arquivo assim que ela termina.
+
+    O FPDF original acumula todas as páginas e imagens em memória e só monta o
+    documento no final. Aqui o cabeçalho é escrito na abertura, cada página
+    (e cada imagem, no primeiro uso) vira objeto PDF imediatamente, e no fim
+    só restam a árvore de páginas, fontes, recursos e a tabela xref: a memória
+    fica limitada a uma página, qualquer que seja o tamanho da exportação.
+    Links internos e alias_nb_pages não são suportados.
+    """
+
+    def __init__(self, out, columns=1, column_gap=8, **kwargs):
+        super().__init__(**kwargs)
+        self._file = out
+        self._pos = 0
+        self._page_objs = []
+        self.columns = max(1, int(columns))
+        self.column_gap = column_gap
+        self.col = 0
+        self.col_top = self.t_margin
+
+    # --- layout em colunas ---
+
+    @property
+    def col_width(self):
+        usable = self.w - 2 * self._base_margin - self.column_gap * (self.columns - 1)
+        return usable / self.columns
+
+    def set_margins(self, left, top, right=-1):
+        super().set_margins(left, top, right)
+        self._base_margin = left
+
+    def set_col(self, col):
+        self.col = col
+        x = self._base_margin + col * (self.col_width + self.column_gap)
+        self.set_left_margin(x)
+        self.set_right_margin(self.w - x - self.col_width)
+        self.set_x(x)
+
+    def header(self):
+        self.col_top = self.t_margin
+
+    def accept_page_break(self):
+        # com colunas livres na página, continua no topo da próxima coluna
+        if self.col < self.columns - 1:
+            self.set_col(self.col + 1)
+            self.set_y(self.col_top)
+            return False
+        self.set_col(0)
+        return True
+
+    # --- escrita incremental ---
+
+    def _out(self, s):
+        if self.state == 2:
+            return super()._out(s)
+        if isinstance(s, str):
+            s = s.encode('latin-1')
+        elif not isinstance(s, bytes):
+            s = str(s).encode('latin-1')
+        self._file.write(s + b'\n')
+        self._pos += len(s) + 1
+
+    def _newobj(self):
+        self.n += 1
+        self.offsets[self.n] = self._pos
+        self._out(f'{self.n} 0 obj')
+
+    def open(self):
+        super().open()
+        self._out('%PDF-' + self.pdf_version)
+
+    def _endpage(self):
+        super()._endpage()
+        content = self.pages.pop(self.page).encode('latin-1')
+        filter_ = ''
+        if self.compress:
+            content = zlib.compress(content)
+            filter_ = '/Filter /FlateDecode '
+        self._newobj()
+        self._page_objs.append(self.n)
+        self._out('<</Type /Page')
+        self._out('/Parent 1 0 R')
+        self._out('/Resources 2 0 R')
+        self._out(f'/Contents {self.n + 1} 0 R>>')
+        self._out('endobj')
+        self._newobj()
+        self._out(f'<<{filter_}/Length {len(content)}>>')
+        self._putstream(content)
+        self._out('endobj')
+
+    def image(self, name, x=None, y=None, w=0, h=0, type='', link=''):
+        first_use = name not in self.images
+        super().image(name, x, y, w, h, type, link)
+        if first_use:
+            # grava o XObject já e descarta os bytes da imagem
+            info = self.images[name]
+            state, self.state = self.state, 1
+            try:
+                self._putimage(info)
+            finally:
+                self.state = state
+            info.pop('data', None)
+            info.pop('smask', None)
+
+    def _putimages(self):
+        pass
+
+    def _putcatalog(self):
+        self._out('/Type /Catalog')
+        self._out('/Pages 1 0 R')
+        if self._page_objs:
+            self._out(f'/OpenAction [{self._page_objs[0]} 0 R /FitH null]')
+        self._out('/PageLayout /OneColumn')
+
+    def _enddoc(self):
+        self._putfonts()
+        self.offsets[2] = self._pos
+        self._out('2 0 obj')
+        self._out('<<')
+        self._putresourcedict()
+        self._out('>>')
+        self._out('endobj')
+        self.offsets[1] = self._pos
+        self._out('1 0 obj')
+        self._out('<</Type /Pages')
+        self._out('/Kids [' + ' '.join(f'{n} 0 R' for n in self._page_objs) + ']')
+        self._out(f'/Count {len(self._page_objs)}')
+        self._out(f'/MediaBox [0 0 {self.w_pt:.2f} {self.h_pt:.2f}]')
+        self._out('>>')
+        self._out('endobj')
+        self._newobj()
+        self._out('<<')
+        self._putinfo()
+        self._out('>>')
+        self._out('endobj')
+        self._newobj()
+        self._out('<<')
+        self._putcatalog()
+        self._out('>>')
+        self._out('endobj')
+        xref = self._pos
+        self._out('xref')
+        self._out(f'0 {self.n + 1}')
+        self._out('0000000000 65535 f ')
+        for i in range(1, self.n + 1):
+            self._out(f'{self.offsets[i]:010d} 00000 n ')
+        self._out('trailer')
+        self._out('<<')
+        self._puttrailer()
+        self._out('>>')
+        self._out('startxref')
+        self._out(str(xref))
+        self._out('%%EOF')
+        self.state = 3
+
+
+def _pdf_image_file(tmpdir, data):
+    """Grava a imagem num arquivo que o FPDF aceite (JPEG ou PNG); retorna (caminho, largura, altura)."""
+    path = os.path.join(tmpdir, hashlib.sha256(data).hexdigest())
+    for ext in ('jpeg', 'png'):
+        if os.path.exists(f"{path}.{ext}"):
+            width, height = Image.open(f"{path}.{ext}").size
+            return f"{path}.{ext}", width, height
+    data, ext, width, height = embeddable_image(data)
+    with open(f"{path}.{ext}", 'wb') as f:
+        f.write(data)
+    return f"{path}.{ext}", width, height
+
+
+def _pdf_add_image(pdf, tmpdir, data, max_width):
+    path, px_w, px_h = _pdf_image_file(tmpdir, data)
+    # 96 dpi, sem ampliar imagens pequenas nem passar da largura da coluna / 70% da altura útil
+    w = min(max_width, px_w * 25.4 / 96)
+    h = w * px_h / px_w
+    max_h = (pdf.h - pdf.t_margin - pdf.b_margin) * 0.7
+    if h > max_h:
+        w, h = w * max_h / h, max_h
+    pdf.image(path, w=w, h=h)
+    pdf.ln(2)
+
+
+@register('pdf', 'pdf', 'application/pdf')
+def build_pdf(questoes, load_image, out, progress=None, gabarito=False, colunas=1, **_):
+    """Prova em PDF: questões numeradas, opções A, B, C..., imagens e gabarito opcional.
+
+    As páginas vão para `out` à medida que são geradas (StreamingPDF).
+    """
+    pdf = StreamingPDF(out, columns=colunas)
+    pdf.set_title('Questões')
+    pdf.set_auto_page_break(True, margin=15)
+    pdf.add_page()
+    pdf.set_font('Arial', 'B', 14)
+    pdf.cell(0, 10, _pdf_text('Questões'), ln=1)
+    pdf.col_top = pdf.get_y()
+    pdf.set_col(0)
+
+    respostas = []
+    with tempfile.TemporaryDirectory(prefix='export-pdf-') as tmpdir:
+        for idx, q in enumerate(questoes, start=1):
+            pdf.set_font('Arial', '', 11)
+            pdf.multi_cell(pdf.col_width, 5.5, _pdf_text(f"{idx}. {q.get('enunciado') or ''}"))
+            pdf.ln(1)
+            if q.get('variante_hash'):
+                try:
+                    _pdf_add_image(pdf, tmpdir, load_image(q['variante_hash'], q.get('imagem_url')),
+                                   min(pdf.col_width, 110))
+                except Exception as e:
+                    print(f"Erro ao inserir imagem da questão {q['id']}: {e}")
+            for i, op in enumerate(q['opcoes']):
+                pdf.set_x(pdf.l_margin + 4)
+                pdf.multi_cell(pdf.col_width - 4, 5.5,
+                               _pdf_text(f"{chr(ord('A') + i)}) {op.get('texto_opcao') or ''}"))
+                if op.get('variante_hash'):
+                    try:
+                        _pdf_add_image(pdf, tmpdir, load_image(op['variante_hash'], op.get('imagem_url')),
+                                       min(pdf.col_width - 4, 70))
+                    except Exception as e:
+                        print(f"Erro ao inserir imagem da opção da questão {q['id']}: {e}")
+            pdf.ln(5)
+            if gabarito:
+                respostas.append((idx, resposta(q)))
+            if progress:
+                progress(idx)
+
+        if gabarito:
+            pdf.add_page()
+            pdf.set_col(0)
+            pdf.set_font('Arial', 'B', 14)
+            pdf.cell(0, 10, 'Gabarito', ln=1)
+            pdf.col_top = pdf.get_y()
+            pdf.set_font('Arial', '', 11)
+            for numero, texto in respostas:
+                pdf.cell(pdf.col_width, 6, _pdf_text(f"{numero}. {texto}"), ln=1)
+        pdf.close()
+
+
+# --- INTERCÂMBIO: MOODLE XML, GIFT, QTI 2.1 ---
+# Os três saem como um zip: o arquivo de questões (ou, no QTI, um XML por item
+# mais o imsmanifest.xml) e as imagens como entradas próprias em imagens/,
+# uma vez cada, referenciadas por <img src="imagens/...">. O arquivo principal
+# é escrito em spool à medida que as questões chegam, como no DOCX.
+
+_ZIP_MIMETYPE = 'application/zip'
+_QTI_NS = 'http://www.imsglobal.org/xsd/imsqti_v2p1'
+_QTI_MATCH_CORRECT = 'http://www.imsglobal.org/question/qti_v2p1/rptemplates/match_correct'
+_GIFT_SPECIAL = re.compile(r'([~=#{}:\\])')
+
+
+class _ZipPackage:
+    """Zip com um arquivo principal escrito incrementalmente e imagens deduplicadas."""
+
+    def __init__(self, out, main_name):
+        self.zip = zipfile.ZipFile(out, 'w', zipfile.ZIP_DEFLATED)
+        self.main_name = main_name
+        self.body = tempfile.SpooledTemporaryFile(max_size=_DOCX_SPOOL_MAX)
+        self.images = {}  # sha256 -> caminho no zip
+
+    def write(self, text):
+        self.body.write(text.encode('utf-8'))
+
+    def entry(self, name, text):
+        self.zip.writestr(name, text.encode('utf-8'))
+
+    def image(self, data):
+        """Grava a imagem (se ainda não estiver no pacote) e retorna o caminho dela no zip."""
+        key = hashlib.sha256(data).hexdigest()
+        if key not in self.images:
+            data, ext, _, _ = embeddable_image(data)
+            path = f'imagens/{key[:32]}.{ext}'
+            self.zip.writestr(path, data)
+            self.images[key] = path
+        return self.images[key]
+
+    def close(self):
+        size = self.body.tell()
+        self.body.seek(0)
+        with self.zip.open(self.main_name, 'w', force_zip64=size >= zipfile.ZIP64_LIMIT) as dst:
+            shutil.copyfileobj(self.body, dst)
+        self.body.close()
+        self.zip.close()
+
+
+def _html(text, image=None):
+    """Texto simples como HTML (quebras de linha viram <br/>), com a imagem ao final."""
+    html = '<br/>'.join(xml_escape(_XML_INVALID.sub('', line)) for line in (text or '').split('\n'))
+    if image:
+        html += f'<br/><img src="{image}" alt=""/>' if html else f'<img src="{image}" alt=""/>'
+    return html
+
+
+def _fraction(value):
+    """Percentual no formato do Moodle: 100, 50, 33.33333, -25..."""
+    return f'{value:.5f}'.rstrip('0').rstrip('.')
+
+
+def _fractions(q):
+    """Percentual de cada opção: as corretas dividem 100; numa múltipla escolha,
+    as erradas dividem -100 (marcar tudo não pontua)."""
+    corretas = sum(1 for op in q['opcoes'] if op.get('is_correta'))
+    erradas = len(q['opcoes']) - corretas
+    multipla = q.get('tipo_questao') == 'MULTIPLA_ESCOLHA'
+    return [100 / corretas if op.get('is_correta') and corretas
+            else (-100 / erradas if multipla else 0)
+            for op in q['opcoes']]
+
+
+def _question_images(pkg, q, load_image):
+    """(imagem do enunciado, [imagem de cada opção]) como caminhos no pacote."""
+    def image(item):
+        if not item.get('variante_hash'):
+            return None
+        try:
+            return pkg.image(load_image(item['variante_hash'], item.get('imagem_url')))
+        except Exception as e:
+            print(f"Erro ao incluir imagem da questão {q.get('id')}: {e}")
+            return None
+    return image(q), [image(op) for op in q['opcoes']]
+
+
+@register('moodle', 'zip', _ZIP_MIMETYPE)
+def build_moodle(questoes, load_image, out, progress=None, **_):
+    """Moodle XML (questoes.xml): multichoice de resposta única ou múltipla e essay para as discursivas."""
+    pkg = _ZipPackage(out, 'questoes.xml')
+    pkg.write('<?xml version="1.0" encoding="UTF-8"?>\n<quiz>\n')
+    for idx, q in enumerate(questoes, start=1):
+        imagem, imagens_opcoes = _question_images(pkg, q, load_image)
+        tipo = q.get('tipo_questao')
+        partes = [f'<question type="{"essay" if tipo == "DISCURSIVA" else "multichoice"}">',
+                  f'<name><text>Questão {q.get("id") or idx}</text></name>',
+                  f'<questiontext format="html"><text>{xml_escape(_html(q.get("enunciado"), imagem))}</text>'
+                  '</questiontext>',
+                  '<generalfeedback format="html"><text></text></generalfeedback>',
+                  '<defaultgrade>1</defaultgrade><penalty>0</penalty><hidden>0</hidden>']
+        if tipo == 'DISCURSIVA':
+            partes.append('<responseformat>editor</responseformat><responserequired>1</responserequired>'
+                          '<responsefieldlines>15</responsefieldlines><attachments>0</attachments>')
+        else:
+            partes.append(f'<single>{"false" if tipo == "MULTIPLA_ESCOLHA" else "true"}</single>'
+                          '<shuffleanswers>true</shuffleanswers><answernumbering>ABCD</answernumbering>')
+            for op, fracao, img in zip(q['opcoes'], _fractions(q), imagens_opcoes):
+                partes.append(f'<answer fraction="{_fraction(fracao)}" format="html">'
+                              f'<text>{xml_escape(_html(op.get("texto_opcao"), img))}</text>'
+                              '<feedback format="html"><text></text></feedback></answer>')
+        tags = [t for t in (q.get('nivel_dificuldade'), q.get('grau_ensino'), q.get('area_conhecimento')) if t]
+        if tags:
+            partes.append('<tags>' + ''.join(f'<tag><text>{_docx_text(t)}</text></tag>' for t in tags) + '</tags>')
+        partes.append('</question>\n')
+        pkg.write(''.join(partes))
+        if progress:
+            progress(idx)
+    pkg.write('</quiz>\n')
+    pkg.close()
+
+
+def _gift_text(text, image=None):
+    return _GIFT_SPECIAL.sub(r'\\\1', _html(text, image))
+
+
+@register('gift', 'zip', _ZIP_MIMETYPE)
+def build_gift(questoes, load_image, out, progress=None, **_):
+    """GIFT (questoes.gift): =certa/~errada, percentuais na múltipla escolha e {} nas discursivas."""
+    pkg = _ZipPackage(out, 'questoes.gift')
+    for idx, q in enumerate(questoes, start=1):
+        imagem, imagens_opcoes = _question_images(pkg, q, load_image)
+        tipo = q.get('tipo_questao')
+        linhas = []
+        tags = [t for t in (q.get('area_conhecimento'), q.get('grau_ensino'), q.get('nivel_dificuldade')) if t]
+        if tags:
+            linhas.append('// ' + ' | '.join(' '.join(t.split()) for t in tags))
+        titulo = _gift_text(f"Questão {q.get('id') or idx}")
+        linhas.append(f"::{titulo}::[html]{_gift_text(q.get('enunciado'), imagem)} {{")
+        if tipo != 'DISCURSIVA':
+            for op, fracao, img in zip(q['opcoes'], _fractions(q), imagens_opcoes):
+                texto = _gift_text(op.get('texto_opcao'), img)
+                if tipo == 'ESCOLHA_UNICA':
+                    linhas.append(f"\t{'=' if op.get('is_correta') else '~'}{texto}")
+                else:
+                    linhas.append(f"\t~%{_fraction(fracao)}%{texto}")
+        linhas.append('}\n\n')
+        pkg.write('\n'.join(linhas))
+        if progress:
+            progress(idx)
+    pkg.close()
+
+
+def _relative(path):
+    return f'../{path}' if path else None
+
+
+def _qti_item(identifier, q, imagem, imagens_opcoes):
+    tipo = q.get('tipo_questao')
+    titulo = xml_escape(f"Questão {q.get('id') or identifier}")
+    partes = ['<?xml version="1.0" encoding="UTF-8"?>\n',
+              f'<assessmentItem xmlns="{_QTI_NS}" identifier="{identifier}" title="{titulo}" '
+              'adaptive="false" timeDependent="false">']
+    if tipo == 'DISCURSIVA':
+        partes.append('<responseDeclaration identifier="RESPONSE" cardinality="single" baseType="string"/>')
+    else:
+        cardinality = 'multiple' if tipo == 'MULTIPLA_ESCOLHA' else 'single'
+        corretas = ''.join(f'<value>C{i + 1}</value>' for i, op in enumerate(q['opcoes']) if op.get('is_correta'))
+        partes.append(f'<responseDeclaration identifier="RESPONSE" cardinality="{cardinality}" baseType="identifier">'
+                      f'<correctResponse>{corretas}</correctResponse></responseDeclaration>')
+    partes.append('<outcomeDeclaration identifier="SCORE" cardinality="single" baseType="float">'
+                  '<defaultValue><value>0</value></defaultValue></outcomeDeclaration>')
+    partes.append(f'<itemBody><div>{_html(q.get("enunciado"), imagem)}</div>')
+    if tipo == 'DISCURSIVA':
+        partes.append('<extendedTextInteraction responseIdentifier="RESPONSE" expectedLines="15"/>')
+    else:
+        max_choices = 0 if tipo == 'MULTIPLA_ESCOLHA' else 1
+        partes.append(f'<choiceInteraction responseIdentifier="RESPONSE" shuffle="false" maxChoices="{max_choices}">')
+        for i, (op, img) in enumerate(zip(q['opcoes'], imagens_opcoes)):
+            partes.append(f'<simpleChoice identifier="C{i + 1}">{_html(op.get("texto_opcao"), img)}</simpleChoice>')
+        partes.append('</choiceInteraction>')
+    partes.append('</itemBody>')
+    if tipo != 'DISCURSIVA':
+        partes.append(f'<responseProcessing template="{_QTI_MATCH_CORRECT}"/>')
+    partes.append('</assessmentItem>\n')
+    return ''.join(partes)
+
+
+@register('qti', 'zip', _ZIP_MIMETYPE)
+def build_qti(questoes, load_image, out, progress=None, **_):
+    """Pacote IMS QTI 2.1: um assessmentItem por questão (choiceInteraction ou
+    extendedTextInteraction) e o imsmanifest.xml listando itens e imagens."""
+    pkg = _ZipPackage(out, 'imsmanifest.xml')
+    pkg.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+              '<manifest xmlns="http://www.imsglobal.org/xsd/imscp_v1p1" identifier="MANIFEST-QUESTOES">'
+              '<metadata><schema>QTIv2.1 Package</schema><schemaversion>1.0.0</schemaversion></metadata>'
+              '<organizations/><resources>\n')
+    for idx, q in enumerate(questoes, start=1):
+        imagem, imagens_opcoes = _question_images(pkg, q, load_image)
+        identifier = f"Q{q.get('id') or idx}"
+        href = f'itens/{identifier}.xml'
+        # os itens ficam em itens/: as imagens são referenciadas a partir de lá
+        pkg.entry(href, _qti_item(identifier, q, _relative(imagem), [_relative(img) for img in imagens_opcoes]))
+        arquivos = [href] + [img for img in dict.fromkeys([imagem] + imagens_opcoes) if img]
+        pkg.write(f'<resource identifier="R{identifier}" type="imsqti_item_xmlv2p1" href="{href}">'
+                  + ''.join(f'<file href="{a}"/>' for a in arquivos) + '</resource>\n')
+        if progress:
+            progress(idx)
+    pkg.write('</resources></manifest>\n')
+    pkg.close()
@@ -0,0 +1,167 @@
+# generation_cache.py
+"""Cache das questões geradas pela IA, por parâmetros normalizados.
+
+Pedidos idênticos de geração (mesmo tipo/nível/grau/área no formulário, mesmo
+tópico no chat) compartilham uma entrada:
+- pool de variantes: até GENERATION_VARIANTS questões já geradas ficam
+  guardadas; cada pedido consome uma (questões diferentes a cada clique em
+  "gerar") e uma tarefa em segundo plano repõe o pool;
+- single-flight: com o pool vazio, só o primeiro pedido chama o modelo; os
+  idênticos que chegam enquanto ele está em andamento esperam e recebem o
+  mesmo resultado;
+- expiração: variantes mais velhas que GENERATION_TTL segundos são
+  descartadas, e no máximo GENERATION_MAX_KEYS chaves são mantidas (as usadas
+  há mais tempo saem primeiro).
+A reposição usa o mesmo pool de llm.py, com orçamento próprio: no máximo
+GENERATION_REFILL_WORKERS chamadas de pré-geração ao mesmo tempo, e só
+enquanto o pool tiver menos de GENERATION_REFILL_MAX_LOAD chamadas em
+andamento (padrão: metade de LLM_WORKERS). Com o pool mais cheio que isso a
+reposição desiste e fica para o próximo acerto; as demais vagas ficam para
+os pedidos de usuários. Cada variante pré-gerada é uma chamada paga ao modelo:
+GENERATION_VARIANTS=0 desliga a reposição.
+"""
+import os
+import copy
+import time
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import llm
+
+
+def make_key(*parts):
+    """Chave de cache: partes em minúsculas e com espaços normalizados."""
+    return tuple(' '.join(str(p or '').lower().split()) for p in parts)
+
+
+class _Entry:
+    __slots__ = ('variants', 'inflight', 'refilling')
+
+    def __init__(self):
+        self.variants = deque()  # (criada_em, questão)
+        self.inflight = None
+        self.refilling = False
+
+
+class GenerationCache:
+    """Pools de variantes por chave, com single-flight e reposição em segundo plano."""
+
+    def __init__(self, variants=2, ttl=3600, max_keys=200, refill_workers=1, refill_max_load=None):
+        self.variants = variants
+        self.refill_max_load = max(1, llm.WORKERS // 2) if refill_max_load is None else refill_max_load
+        self.ttl = ttl
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._refill_executor = ThreadPoolExecutor(max_workers=refill_workers, thread_name_prefix='geracao')
+        self._metrics = {'hits': 0, 'misses': 0, 'coalesced': 0, 'refills': 0, 'refill_errors': 0,
+                         'refills_skipped': 0, 'expired': 0, 'evicted_keys': 0}
+
+    def _entry(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = self._entries[key] = _Entry()
+            while len(self._entries) > self.max_keys:
+                self._entries.popitem(last=False)
+                self._metrics['evicted_keys'] += 1
+        else:
+            self._entries.move_to_end(key)
+        cutoff = time.monotonic() - self.ttl
+        while entry.variants and entry.variants[0][0] < cutoff:
+            entry.variants.popleft()
+            self._metrics['expired'] += 1
+        return entry
+
+    def get(self, key, produce):
+        """Uma questão para `key`: do pool, da geração em andamento ou de `produce()`.
+
+        `produce` chama o modelo e retorna a questão já validada (ou levanta exceção).
+        O resultado é uma cópia, que o chamador pode alterar à vontade.
+        """
+        owner = False
+        with self._lock:
+            entry = self._entry(key)
+            if entry.variants:
+                _, value = entry.variants.popleft()
+                self._metrics['hits'] += 1
+                self._schedule_refill(key, entry, produce)
+                return copy.deepcopy(value)
+            future = entry.inflight
+            if future is None:
+                future = entry.inflight = Future()
+                owner = True
+                self._metrics['misses'] += 1
+            else:
+                self._metrics['coalesced'] += 1
+
+        if not owner:
+            return copy.deepcopy(future.result())
+        try:
+            value = produce()
+        except BaseException as e:
+            future.set_exception(e)
+            with self._lock:
+                entry.inflight = None
+            raise
+        future.set_result(value)
+        with self._lock:
+            entry.inflight = None
+            self._schedule_refill(key, entry, produce)
+        return copy.deepcopy(value)
+
+    def _schedule_refill(self, key, entry, produce):
+        # chamado com self._lock
+        if self.variants <= 0 or entry.refilling or len(entry.variants) >= self.variants:
+            return
+        entry.refilling = True
+        self._refill_executor.submit(self._refill, key, entry, produce)
+
+    def _refill(self, key, entry, produce):
+        try:
+            while True:
+                with self._lock:
+                    if len(entry.variants) >= self.variants or self._entries.get(key) is not entry:
+                        return
+                    if llm.in_flight() >= self.refill_max_load:
+                        # pool ocupado por pedidos de usuários: a reposição fica para depois
+                        self._metrics['refills_skipped'] += 1
+                        return
+                try:
+                    value = produce()
+                except llm.LLMBusy:
+                    return
+                except Exception as e:
+                    print(f"Erro ao pré-gerar questão para {key}: {e}")
+                    with self._lock:
+                        self._metrics['refill_errors'] += 1
+                    return
+                with self._lock:
+                    entry.variants.append((time.monotonic(), value))
+                    self._metrics['refills'] += 1
+        finally:
+            with self._lock:
+                entry.refilling = False
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Métricas acumuladas e estado atual (chaves e variantes prontas)."""
+        with self._lock:
+            data = dict(self._metrics)
+            data['keys'] = len(self._entries)
+            data['ready_variants'] = sum(len(e.variants) for e in self._entries.values())
+        requests = data['hits'] + data['misses'] + data['coalesced']
+        data['hit_rate'] = (data['hits'] + data['coalesced']) / requests if requests else 0.0
+        return data
+
+
+def get_cache():
+    return GenerationCache(variants=int(os.environ.get('GENERATION_VARIANTS', 2)),
+                           ttl=float(os.environ.get('GENERATION_TTL', 3600)),
+                           max_keys=int(os.environ.get('GENERATION_MAX_KEYS', 200)),
+                           refill_workers=int(os.environ.get('GENERATION_REFILL_WORKERS', 1)),
+                           refill_max_load=(int(os.environ['GENERATION_REFILL_MAX_LOAD'])
+                                            if os.environ.get('GENERATION_REFILL_MAX_LOAD') else None))
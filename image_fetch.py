@@ -0,0 +1,112 @@
+# image_fetch.py
+"""Download concorrente de imagens candidatas (resultados da busca de imagens do chat).
+
+fetch_first() baixa todas as URLs ao mesmo tempo num pool de threads, com uma
+única sessão HTTP compartilhada (conexões reaproveitadas), e devolve a primeira
+imagem que passar nas verificações — Content-Type image/*, tamanho até
+IMAGE_MAX_BYTES, MIME detectado nos próprios bytes e a função `accept`
+opcional (ex.: image_pipeline.normalize). Assim que uma imagem é aceita, os
+downloads restantes são cancelados; o conjunto todo respeita um prazo
+(IMAGE_FETCH_DEADLINE), em vez de esperar o timeout de cada URL em sequência.
+"""
+import os
+import time
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import magic
+import requests
+from requests.adapters import HTTPAdapter
+
+import image_pipeline
+
+WORKERS = int(os.environ.get('IMAGE_FETCH_WORKERS', 5))
+DEADLINE = float(os.environ.get('IMAGE_FETCH_DEADLINE', 12))
+CONNECT_TIMEOUT = float(os.environ.get('IMAGE_FETCH_CONNECT_TIMEOUT', 3.05))
+READ_TIMEOUT = float(os.environ.get('IMAGE_FETCH_READ_TIMEOUT', 5))
+MAX_BYTES = image_pipeline.MAX_BYTES
+CHUNK_SIZE = 64 * 1024
+
+HEADERS = {'User-Agent': 'Mozilla/5.0'}
+
+FetchedImage = namedtuple('FetchedImage', 'url data mime result')
+
+_executor = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix='download-imagens')
+
+_session = requests.Session()
+_session.headers.update(HEADERS)
+_adapter = HTTPAdapter(pool_connections=WORKERS, pool_maxsize=WORKERS)
+_session.mount('http://', _adapter)
+_session.mount('https://', _adapter)
+
+
+class Cancelled(Exception):
+    """O download foi interrompido porque outra imagem já foi aceita (ou o prazo acabou)."""
+
+
+def _download(url, cancel, deadline, accept):
+    """Baixa uma URL e aplica as verificações; levanta exceção se a imagem não servir."""
+    if cancel.is_set():
+        raise Cancelled(url)
+    timeout = (CONNECT_TIMEOUT, min(READ_TIMEOUT, max(deadline - time.monotonic(), 0.1)))
+    with _session.get(url, timeout=timeout, stream=True) as response:
+        response.raise_for_status()
+        content_type = response.headers.get('Content-Type', '').split(';')[0].strip().lower()
+        if not content_type.startswith('image/'):
+            raise ValueError(f"Content-Type não é de imagem: {content_type or 'ausente'}")
+        length = response.headers.get('Content-Length')
+        if length and length.isdigit() and int(length) > MAX_BYTES:
+            raise ValueError(f"Imagem grande demais ({length} bytes)")
+
+        chunks = []
+        total = 0
+        for chunk in response.iter_content(CHUNK_SIZE):
+            if cancel.is_set() or time.monotonic() > deadline:
+                raise Cancelled(url)
+            total += len(chunk)
+            if total > MAX_BYTES:
+                raise ValueError(f"Imagem grande demais (mais de {MAX_BYTES} bytes)")
+            chunks.append(chunk)
+    data = b''.join(chunks)
+
+    mime = magic.from_buffer(data[:2048], mime=True)
+    if not mime.startswith('image/'):
+        raise ValueError(f"O conteúdo baixado não é uma imagem ({mime})")
+    result = accept(data) if accept else None
+    return FetchedImage(url, data, mime, result)
+
+
+def fetch_first(urls, accept=None, deadline=DEADLINE):
+    """Primeira imagem válida entre `urls` (FetchedImage), ou None se nenhuma servir dentro do prazo.
+
+    `accept(data)` roda na thread do download e deve levantar ValueError (ou
+    InvalidImage) para rejeitar a imagem; o valor retornado vai em `result`.
+    """
+    urls = [u for u in dict.fromkeys(urls) if u]
+    if not urls:
+        return None
+    limit = time.monotonic() + deadline
+    cancel = threading.Event()
+    pending = {_executor.submit(_download, url, cancel, limit, accept): url for url in urls}
+    try:
+        while pending:
+            remaining = limit - time.monotonic()
+            if remaining <= 0:
+                print(f"Prazo de {deadline:g}s esgotado ao baixar imagens ({len(pending)} pendentes).")
+                return None
+            done, _ = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                url = pending.pop(future)
+                try:
+                    return future.result()
+                except Cancelled:
+                    pass
+                except Exception as e:
+                    print(f"Falha ao descarregar {url}: {e}")
+        return None
+    finally:
+        # downloads ainda na fila nem começam; os em andamento param no próximo bloco
+        cancel.set()
+        for future in pending:
+            future.cancel()
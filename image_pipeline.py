@@ -0,0 +1,121 @@
+# image_pipeline.py
+"""Normalização das imagens recebidas (uploads, fotos de perfil e imagens da web).
+
+Cada imagem é validada (formato e tamanho), tem a orientação EXIF aplicada e
+os metadados removidos, é reduzida para no máximo IMAGE_MAX_DIMENSION pixels
+no maior lado e recodificada: JPEG para imagens opacas, PNG quando há
+transparência (formatos que os exportadores DOCX e PDF embutem diretamente).
+
+Além da imagem principal são geradas variantes de tamanho fixo (VARIANTS),
+usadas em listas/modais e nas exportações.
+
+O processamento roda num pool de threads limitado (IMAGE_WORKERS): o Pillow
+libera o GIL durante decodificação, redimensionamento e codificação, e o
+limite impede que vários uploads grandes ocupem toda a CPU do worker.
+"""
+import io
+import os
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+MAX_DIMENSION = int(os.environ.get('IMAGE_MAX_DIMENSION', 1600))
+MAX_BYTES = int(os.environ.get('IMAGE_MAX_BYTES', 10 * 1024 * 1024))
+MAX_PIXELS = int(os.environ.get('IMAGE_MAX_PIXELS', 40_000_000))
+JPEG_QUALITY = int(os.environ.get('IMAGE_JPEG_QUALITY', 85))
+TIMEOUT = float(os.environ.get('IMAGE_TIMEOUT', 60))
+AVATAR_DIMENSION = 512
+
+ACCEPTED_FORMATS = {'JPEG', 'PNG', 'GIF', 'WEBP', 'BMP', 'TIFF'}
+
+# Variantes de tamanho fixo: nome -> maior lado em pixels
+VARIANTS = {
+    'miniatura': 240,
+    'exportacao': 800,
+}
+
+NormalizedImage = namedtuple('NormalizedImage', 'data mime width height')
+
+_executor = ThreadPoolExecutor(max_workers=int(os.environ.get('IMAGE_WORKERS', 2)),
+                               thread_name_prefix='imagens')
+
+
+class InvalidImage(ValueError):
+    """Os bytes recebidos não são uma imagem aceita."""
+
+
+def _open(data):
+    if len(data) > MAX_BYTES:
+        raise InvalidImage(f"A imagem excede o limite de {MAX_BYTES // (1024 * 1024)} MB.")
+    try:
+        img = Image.open(io.BytesIO(data))
+        if img.format not in ACCEPTED_FORMATS:
+            raise InvalidImage(f"Formato de imagem não suportado: {img.format}.")
+        if img.width * img.height > MAX_PIXELS:
+            raise InvalidImage("A imagem tem dimensões grandes demais.")
+        img.load()
+    except InvalidImage:
+        raise
+    except (UnidentifiedImageError, OSError, Image.DecompressionBombError) as e:
+        raise InvalidImage("O arquivo enviado não é uma imagem válida.") from e
+    # aplica a rotação indicada no EXIF antes de descartar os metadados
+    return ImageOps.exif_transpose(img)
+
+
+def _has_alpha(img):
+    return img.mode in ('RGBA', 'LA', 'PA') or (img.mode == 'P' and 'transparency' in img.info)
+
+
+def _encode(img):
+    """Recodifica sem metadados (EXIF, ICC, comentários não são repassados ao save)."""
+    out = io.BytesIO()
+    if _has_alpha(img):
+        img = img.convert('RGBA')
+        img.save(out, 'PNG', optimize=True)
+        mime_type = 'image/png'
+    else:
+        img = img.convert('RGB')
+        img.save(out, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+        mime_type = 'image/jpeg'
+    return NormalizedImage(out.getvalue(), mime_type, img.width, img.height)
+
+
+def normalize(data, max_dimension=MAX_DIMENSION):
+    """Valida e normaliza uma imagem; levanta InvalidImage se não for aceita."""
+    img = _open(data)
+    img.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+    return _encode(img)
+
+
+def make_variants(data):
+    """Gera as variantes de VARIANTS a partir de uma imagem já normalizada.
+    Variantes maiores que a própria imagem são omitidas (a original serve no lugar).
+    """
+    img = _open(data)
+    variants = {}
+    for name, size in VARIANTS.items():
+        if max(img.width, img.height) <= size:
+            continue
+        copy = img.copy()
+        copy.thumbnail((size, size), Image.LANCZOS)
+        variants[name] = _encode(copy)
+    return variants
+
+
+def run(fn, *args, timeout=None):
+    """Executa `fn` no pool de imagens e espera o resultado.
+
+    Se passar de `timeout` (IMAGE_TIMEOUT) segundos, levanta InvalidImage — um
+    ValueError, como as demais imagens recusadas — em vez de TimeoutError.
+    """
+    future = _executor.submit(fn, *args)
+    try:
+        return future.result(timeout=TIMEOUT if timeout is None else timeout)
+    except FutureTimeout:
+        future.cancel()
+        raise InvalidImage("A imagem demorou demais para ser processada.")
+
+
+def submit(fn, *args):
+    """Agenda `fn` no pool de imagens sem esperar (ex.: geração de variantes)."""
+    return _executor.submit(fn, *args)
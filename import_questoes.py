@@ -0,0 +1,459 @@
+# import_questoes.py
+"""Importação em massa de questões a partir de CSV, JSON Lines ou DOCX.
+
+Uso: python import_questoes.py ARQUIVO --autor EMAIL_OU_ID [--formato csv|jsonl|docx]
+                               [--tipo T] [--nivel N] [--grau G] [--area A]
+                               [--lote 500] [--erros relatorio.csv]
+O mesmo pipeline atende POST /importar_questoes (app.py).
+
+Formatos:
+- CSV (separador ',' ou ';', detectado; UTF-8 ou Windows-1252, como o Excel
+  grava): colunas enunciado, tipo (ou tipo_questao), nivel, grau, area, as
+  opções em opcao_a, opcao_b... (ou opcao_1...; ou todas numa coluna 'opcoes'
+  separadas por '|') e as corretas em 'corretas' (letras ou números: "A",
+  "B;D", "1,3");
+- JSON Lines: um objeto por linha, com as chaves das questões geradas pela IA
+  ('opcoes' como lista de {"texto_opcao", "is_correta"} ou de textos + 'corretas');
+- DOCX: o formato de /export_questoes (uma questão por página; opções "A. ...";
+  seção "Gabarito" no fim com "1. A, C"), com as imagens. Sem gabarito, a opção
+  correta pode ser marcada com '*' antes da letra ("*B. ...").
+Campos ausentes são completados com --tipo/--nivel/--grau/--area; sem tipo,
+ele é deduzido (sem opções: discursiva; mais de uma correta: múltipla escolha).
+
+Pipeline: os registros são lidos e validados um a um (question_batch.normalize_question)
+e gravados em lotes de IMPORT_CHUNK questões, cada lote numa transação com
+dois INSERTs via execute_values (question_batch.bulk_insert). Se um lote falha
+no banco, as questões dele são regravadas uma a uma para apontar as linhas com
+erro. O relatório traz as contagens, a vazão e o erro de cada linha rejeitada.
+"""
+import os
+import re
+import csv
+import sys
+import codecs
+import itertools
+import json
+import time
+import zipfile
+import posixpath
+import xml.etree.ElementTree as ET
+
+import psycopg2
+
+import question_batch
+
+CHUNK_SIZE = int(os.environ.get('IMPORT_CHUNK', 500))
+MAX_REPORTED_ERRORS = 1000
+FORMATS = ('csv', 'jsonl', 'docx')
+
+_ALIASES = {'tipo': 'tipo_questao', 'nivel': 'nivel_dificuldade', 'grau': 'grau_ensino',
+            'area': 'area_conhecimento', 'resposta': 'corretas', 'gabarito': 'corretas'}
+_OPTION_COLUMN = re.compile(r'^opcao_?([a-z]|\d+)$')
+
+
+def detect_format(filename):
+    ext = os.path.splitext(filename or '')[1].lower().lstrip('.')
+    return {'ndjson': 'jsonl', 'json': 'jsonl'}.get(ext, ext) if ext else None
+
+
+def _answer_indices(value):
+    """'A, C' / 'b;d' / '1,3' -> {0, 2}."""
+    indices = set()
+    for token in re.split(r'[\s,;|/]+', str(value or '').strip()):
+        if not token:
+            continue
+        if token.isdigit():
+            indices.add(int(token) - 1)
+        elif len(token) == 1 and token.isalpha():
+            indices.add(ord(token.upper()) - ord('A'))
+        else:
+            raise ValueError(f"Resposta inválida: '{token}'.")
+    return indices
+
+
+def _apply_aliases(dados):
+    return {_ALIASES.get(k, k): v for k, v in dados.items()}
+
+
+def _apply_answers(dados):
+    """Opções como textos + 'corretas' -> lista de {'texto_opcao', 'is_correta'}."""
+    if 'corretas' not in dados:
+        return dados
+    corretas = _answer_indices(dados.pop('corretas'))
+    opcoes = []
+    for i, opcao in enumerate(dados.get('opcoes') or []):
+        if not isinstance(opcao, dict):
+            opcao = {'texto_opcao': opcao}
+        opcoes.append(dict(opcao, is_correta=opcao.get('is_correta') or i in corretas))
+    dados['opcoes'] = opcoes
+    return dados
+
+
+# --- LEITORES (geram (linha, dados, erro)) ---
+
+def _text_lines(stream):
+    """Linhas de `stream` (binário) como texto, decodificadas uma a uma: UTF-8 (com
+    ou sem BOM) ou, se a linha não for UTF-8 válido, Windows-1252 — o que o Excel
+    grava em pt-BR. Mantém o fim de linha, como o csv espera."""
+    for i, raw in enumerate(stream):
+        if i == 0 and raw.startswith(codecs.BOM_UTF8):
+            raw = raw[len(codecs.BOM_UTF8):]
+        try:
+            yield raw.decode('utf-8')
+        except UnicodeDecodeError:
+            yield raw.decode('cp1252', errors='replace')
+
+
+def read_csv(stream):
+    lines = _text_lines(stream)
+    amostra = []
+    for line in lines:
+        amostra.append(line)
+        if sum(map(len, amostra)) >= 8192:
+            break
+    try:
+        dialect = csv.Sniffer().sniff(''.join(amostra), delimiters=',;\t')
+    except csv.Error:
+        dialect = csv.excel
+    yield from _csv_records(csv.DictReader(itertools.chain(amostra, lines), dialect=dialect))
+
+
+def _csv_records(reader):
+    for row in reader:
+        linha = reader.line_num
+        try:
+            dados = {}
+            opcoes = []
+            for key, value in row.items():
+                if key is None:
+                    raise ValueError("Linha com mais colunas que o cabeçalho.")
+                key = key.strip().lower()
+                value = (value or '').strip()
+                match = _OPTION_COLUMN.match(key)
+                if match:
+                    ordem = match.group(1)
+                    opcoes.append((int(ordem) if ordem.isdigit() else ord(ordem) - ord('a') + 1, value))
+                elif key == 'opcoes':
+                    opcoes.extend(enumerate((op.strip() for op in value.split('|')), start=1))
+                elif value:
+                    dados[key] = value
+            dados['opcoes'] = [texto for _, texto in sorted(opcoes, key=lambda op: op[0]) if texto]
+            yield linha, _apply_answers(_apply_aliases(dados)), None
+        except ValueError as e:
+            yield linha, None, str(e)
+
+
+def read_jsonl(stream):
+    for linha, raw in enumerate(_text_lines(stream), start=1):
+        if not raw.strip():
+            continue
+        try:
+            dados = json.loads(raw)
+            if not isinstance(dados, dict):
+                raise ValueError("A linha não é um objeto JSON.")
+            yield linha, _apply_answers(_apply_aliases(dados)), None
+        except ValueError as e:
+            yield linha, None, f"JSON inválido: {e}" if isinstance(e, json.JSONDecodeError) else str(e)
+
+
+_W = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+_R = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}'
+_A = '{http://schemas.openxmlformats.org/drawingml/2006/main}'
+_REL = '{http://schemas.openxmlformats.org/package/2006/relationships}'
+_OPTION_LINE = re.compile(r'^(\*)?\s*([A-Z])[.)]\s*(.*)$', re.S)
+_ANSWER_LINE = re.compile(r'^(\d+)[.)]\s*(.+)$')
+
+
+def _docx_run_text(run):
+    """Texto de um run, com as quebras de linha (w:br, exceto de página) e tabulações."""
+    partes = []
+    for child in run:
+        if child.tag == f'{_W}t':
+            partes.append(child.text or '')
+        elif child.tag == f'{_W}tab':
+            partes.append('\t')
+        elif child.tag == f'{_W}cr' or (child.tag == f'{_W}br' and child.get(f'{_W}type') not in ('page', 'column')):
+            partes.append('\n')
+    return ''.join(partes)
+
+
+def _docx_paragraphs(docx):
+    """Gera (texto, estilo, quebra_de_página, [rIds das imagens]) de cada parágrafo, sem montar a árvore toda."""
+    with docx.open('word/document.xml') as f:
+        for _, elem in ET.iterparse(f):
+            if elem.tag != f'{_W}p':
+                continue
+            texto = ''.join(_docx_run_text(run) for run in elem.iter(f'{_W}r'))
+            style = elem.find(f'{_W}pPr/{_W}pStyle')
+            quebra = any(br.get(f'{_W}type') == 'page' for br in elem.iter(f'{_W}br'))
+            imagens = [blip.get(f'{_R}embed') for blip in elem.iter(f'{_A}blip')]
+            yield texto.strip(), style.get(f'{_W}val') if style is not None else None, quebra, imagens
+            elem.clear()
+
+
+def read_docx(stream):
+    """Lê o DOCX no formato da exportação. As questões só são entregues no fim,
+    porque o gabarito fica depois delas; as imagens são lidas do zip sob demanda."""
+    try:
+        docx = zipfile.ZipFile(stream)
+        with docx.open('word/_rels/document.xml.rels') as f:
+            rels = {rel.get('Id'): posixpath.normpath(posixpath.join('word', rel.get('Target')))
+                    for rel in ET.parse(f).getroot().iter(f'{_REL}Relationship')}
+    except (zipfile.BadZipFile, KeyError, ET.ParseError) as e:
+        yield 1, None, f"DOCX inválido: {e}"
+        return
+
+    questoes, gabarito = [], {}
+    atual = None
+    em_gabarito = False
+    for texto, style, quebra, imagens in _docx_paragraphs(docx):
+        if style and style.lower().startswith('heading') and texto.lower() == 'gabarito':
+            em_gabarito = True
+            continue
+        if em_gabarito:
+            match = _ANSWER_LINE.match(texto)
+            if match:
+                gabarito[int(match.group(1))] = match.group(2).strip()
+            continue
+        if texto or imagens:
+            if atual is None:
+                atual = {'enunciado': [], 'opcoes': [], 'imagem': None}
+                questoes.append(atual)
+            match = _OPTION_LINE.match(texto)
+            esperada = chr(ord('A') + len(atual['opcoes']))
+            if match and match.group(2) == esperada and (atual['enunciado'] or atual['imagem']):
+                atual['opcoes'].append({'texto_opcao': match.group(3).strip(), 'is_correta': bool(match.group(1)),
+                                        'imagem': None})
+            elif texto and atual['opcoes']:
+                # continuação do texto da última opção
+                atual['opcoes'][-1]['texto_opcao'] += '\n' + texto
+            elif texto:
+                atual['enunciado'].append(texto)
+            for rid in imagens:
+                destino = atual['opcoes'][-1] if atual['opcoes'] else atual
+                if destino['imagem'] is None and rid in rels:
+                    destino['imagem'] = rels[rid]
+        if quebra:
+            atual = None
+
+    for numero, q in enumerate(questoes, start=1):
+        try:
+            dados = {'enunciado': '\n'.join(q['enunciado']), 'opcoes': q['opcoes']}
+            if q['imagem']:
+                dados['imagem'] = docx.read(q['imagem'])
+            for opcao in q['opcoes']:
+                if opcao['imagem']:
+                    opcao['imagem'] = docx.read(opcao['imagem'])
+            resposta = gabarito.get(numero)
+            if resposta and resposta.lower() == 'discursiva':
+                dados['tipo_questao'] = 'DISCURSIVA'
+            elif resposta and resposta != '-':
+                dados['corretas'] = resposta
+            yield numero, _apply_answers(dados), None
+        except (KeyError, ValueError) as e:
+            yield numero, None, str(e)
+
+
+READERS = {'csv': read_csv, 'jsonl': read_jsonl, 'docx': read_docx}
+
+
+# --- VALIDAÇÃO E GRAVAÇÃO ---
+
+class ImportReport:
+    """Contagens, vazão e erros por linha de uma importação."""
+
+    def __init__(self):
+        self.lidas = 0
+        self.importadas = 0
+        self.com_erro = 0
+        self.erros = []
+        self.ids = []
+        self.inicio = time.monotonic()
+        self.segundos = None
+
+    def error(self, linha, mensagem):
+        self.com_erro += 1
+        if len(self.erros) < MAX_REPORTED_ERRORS:
+            self.erros.append((linha, mensagem))
+
+    def finish(self):
+        self.segundos = time.monotonic() - self.inicio
+
+    def as_dict(self, max_erros=MAX_REPORTED_ERRORS):
+        segundos = self.segundos if self.segundos is not None else time.monotonic() - self.inicio
+        return {
+            'lidas': self.lidas,
+            'importadas': self.importadas,
+            'com_erro': self.com_erro,
+            'segundos': round(segundos, 3),
+            'questoes_por_segundo': round(self.importadas / segundos, 1) if segundos else None,
+            'erros': [{'linha': linha, 'erro': erro} for linha, erro in self.erros[:max_erros]],
+        }
+
+    def write_errors_csv(self, f):
+        writer = csv.writer(f)
+        writer.writerow(['linha', 'erro'])
+        writer.writerows(self.erros)
+
+
+def _infer_type(dados):
+    opcoes = dados.get('opcoes') or []
+    if not opcoes:
+        return 'DISCURSIVA'
+    corretas = sum(1 for op in opcoes if isinstance(op, dict) and question_batch._is_true(op.get('is_correta')))
+    return 'MULTIPLA_ESCOLHA' if corretas > 1 else 'ESCOLHA_UNICA'
+
+
+def prepare(dados, defaults, store_image):
+    """Questão pronta para bulk_insert: imagens gravadas no media store e campos validados."""
+    dados = dict(dados)
+    if not dados.get('tipo_questao') and not defaults.get('tipo_questao'):
+        dados['tipo_questao'] = _infer_type(dados)
+    imagem = dados.pop('imagem', None)
+    if imagem:
+        dados['imagem_mime'], dados['imagem_hash'] = store_image(imagem)
+    opcoes = []
+    for opcao in dados.get('opcoes') or []:
+        if isinstance(opcao, dict) and opcao.get('imagem'):
+            opcao = dict(opcao)
+            opcao['imagem_mime'], opcao['imagem_hash'] = store_image(opcao.pop('imagem'))
+        opcoes.append(opcao)
+    dados['opcoes'] = opcoes
+    return question_batch.normalize_question(dados, defaults)
+
+
+def _flush(conn, lote, autor_id, report):
+    try:
+        with conn.cursor() as cursor:
+            ids = question_batch.bulk_insert(cursor, [q for _, q in lote], autor_id)
+        conn.commit()
+        report.importadas += len(ids)
+        report.ids.extend(ids)
+        return
+    except psycopg2.Error as e:
+        conn.rollback()
+        print(f"Lote de {len(lote)} questões recusado pelo banco ({e.pgcode}); regravando uma a uma.")
+    for linha, questao in lote:
+        try:
+            with conn.cursor() as cursor:
+                ids = question_batch.bulk_insert(cursor, [questao], autor_id)
+            conn.commit()
+            report.importadas += 1
+            report.ids.extend(ids)
+        except psycopg2.Error as e:
+            conn.rollback()
+            report.error(linha, f"Erro no banco: {(e.pgerror or str(e)).strip()}")
+
+
+def import_questions(conn, records, autor_id, store_image, defaults=None, chunk_size=CHUNK_SIZE, progress=None):
+    """Valida e grava os registros de um leitor (READERS); retorna o ImportReport.
+
+    `store_image(bytes)` grava uma imagem e retorna (mime, hash). Cada lote de
+    `chunk_size` questões é gravado e confirmado antes de o próximo ser lido.
+    """
+    defaults = {k: v for k, v in (defaults or {}).items() if v}
+    report = ImportReport()
+    lote = []
+    for linha, dados, erro in records:
+        report.lidas += 1
+        if erro:
+            report.error(linha, erro)
+            continue
+        try:
+            lote.append((linha, prepare(dados, defaults, store_image)))
+        except ValueError as e:
+            report.error(linha, str(e))
+            continue
+        if len(lote) >= chunk_size:
+            _flush(conn, lote, autor_id, report)
+            lote = []
+            if progress:
+                progress(report)
+    if lote:
+        _flush(conn, lote, autor_id, report)
+    report.finish()
+    if progress:
+        progress(report)
+    return report
+
+
+def import_file(conn, stream, formato, autor_id, store_image, defaults=None, chunk_size=CHUNK_SIZE, progress=None):
+    if formato not in READERS:
+        raise ValueError(f"Formato de importação não suportado: {formato}. Use {', '.join(FORMATS)}.")
+    return import_questions(conn, READERS[formato](stream), autor_id, store_image, defaults, chunk_size, progress)
+
+
+# --- LINHA DE COMANDO ---
+
+def _find_author(conn, autor):
+    with conn.cursor() as cursor:
+        if str(autor).isdigit():
+            cursor.execute("SELECT id FROM usuarios WHERE id = %s", (int(autor),))
+        else:
+            cursor.execute("SELECT id FROM usuarios WHERE email = %s", (autor,))
+        row = cursor.fetchone()
+    conn.rollback()
+    return row[0] if row else None
+
+
+def main(argv):
+    import argparse
+    from dotenv import load_dotenv
+
+    import db
+    import image_pipeline
+    import media_store
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description='Importa questões de um arquivo CSV, JSON Lines ou DOCX.')
+    parser.add_argument('arquivo')
+    parser.add_argument('--autor', required=True, help='email ou id do usuário autor das questões')
+    parser.add_argument('--formato', choices=FORMATS, help='padrão: pela extensão do arquivo')
+    parser.add_argument('--tipo', help='tipo_questao quando o arquivo não informa')
+    parser.add_argument('--nivel', help='nivel_dificuldade quando o arquivo não informa')
+    parser.add_argument('--grau', help='grau_ensino quando o arquivo não informa')
+    parser.add_argument('--area', help='area_conhecimento quando o arquivo não informa')
+    parser.add_argument('--lote', type=int, default=CHUNK_SIZE, help='questões por transação')
+    parser.add_argument('--erros', help='grava o relatório de erros (linha, erro) neste CSV')
+    args = parser.parse_args(argv)
+
+    formato = args.formato or detect_format(args.arquivo)
+    if formato not in READERS:
+        parser.error(f"não foi possível deduzir o formato de '{args.arquivo}'; use --formato.")
+    store = media_store.get_store()
+
+    def store_image(dados):
+        imagem = image_pipeline.normalize(dados)
+        return imagem.mime, store.put(imagem.data)
+
+    def progress(report):
+        print(f"  {report.lidas} lidas, {report.importadas} importadas, {report.com_erro} com erro")
+
+    defaults = {'tipo_questao': args.tipo, 'nivel_dificuldade': args.nivel,
+                'grau_ensino': args.grau, 'area_conhecimento': args.area}
+    with db.get_pool().connection() as conn:
+        autor_id = _find_author(conn, args.autor)
+        if autor_id is None:
+            print(f"Erro: usuário '{args.autor}' não encontrado.")
+            return 1
+        with open(args.arquivo, 'rb') as f:
+            report = import_file(conn, f, formato, autor_id, store_image, defaults, args.lote, progress)
+
+    data = report.as_dict()
+    print(f"\n{data['importadas']} de {data['lidas']} questões importadas em {data['segundos']:.1f}s "
+          f"({data['questoes_por_segundo'] or 0} questões/s); {data['com_erro']} com erro.")
+    if report.erros:
+        if args.erros:
+            with open(args.erros, 'w', newline='', encoding='utf-8') as f:
+                report.write_errors_csv(f)
+            print(f"Relatório de erros gravado em {args.erros}.")
+        else:
+            for linha, erro in report.erros[:20]:
+                print(f"  linha {linha}: {erro}")
+    if report.importadas and formato == 'docx':
+        print("As miniaturas das imagens importadas são geradas com: python media_store.py variantes")
+    return 0 if not report.com_erro else 2
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,170 @@
+# intent_classifier.py
+"""Classificação local (por regras) da intenção das mensagens do chat.
+
+A maior parte das mensagens é óbvia — "buscar questões de frações", "sim",
+"crie uma questão sobre o sistema solar" — e não precisa de uma ida ao modelo
+só para decidir entre SEARCH, CREATE, INSERT e CHAT. classify() aplica regras
+de palavras-chave, extrai o tópico e atribui uma confiança; o app só chama o
+modelo quando ela fica abaixo de INTENT_LOCAL_THRESHOLD.
+
+As métricas (stats()) mostram quantas mensagens foram resolvidas localmente,
+por intenção, e quantas ainda foram para o modelo.
+"""
+import os
+import re
+import threading
+import unicodedata
+from collections import namedtuple
+
+THRESHOLD = float(os.environ.get('INTENT_LOCAL_THRESHOLD', 0.8))
+
+Intent = namedtuple('Intent', 'intent topic confidence rule')
+
+AFFIRMATIVES = {"sim", "s", "yes", "y", "claro", "pode", "ok", "porfavor", "por favor",
+                "isso", "beleza", "certo", "confirmo"}
+NEGATIVES = {"nao", "no", "nem", "cancela", "cancelar", "espera"}
+INSERT_VERBS = r'(cadastr\w*|salv\w*|insir\w*|inser\w*|confirm\w*|registr\w*|adicion\w*|guard\w*)'
+# Imperativo e infinitivo por extenso: radicais como "cri", "ger" ou "list" também
+# casariam "critério", "geografia", "lista"...
+CREATE_VERBS = (r'(crie|criem|cria|criar|gere|gerem|gera|gerar|elabore|elaborem|elabora|elaborar|faca|facam|'
+                r'faz|fazer|monte|montem|monta|montar|prepare|preparem|prepara|preparar|formule|formular|'
+                r'invente|inventar|escreva|escrevam|escrever|redija|redigir)')
+SEARCH_VERBS = (r'(busque|busquem|busca|buscar|procure|procurem|procura|procurar|pesquise|pesquisem|pesquisa|'
+                r'pesquisar|encontre|encontrem|encontrar|ache|achem|achar|liste|listem|listar|mostre|mostrem|'
+                r'mostra|mostrar|exiba|exibam|exibir|localize|localizar)')
+QUESTION_NOUNS = r'(questa\w*|questoe\w*|pergunt\w*|exercicio\w*|item|itens)'
+GREETINGS = {'oi', 'ola', 'opa', 'bom dia', 'boa tarde', 'boa noite', 'obrigado', 'obrigada', 'valeu',
+             'tchau', 'ate mais', 'tudo bem', 'e ai'}
+
+# "uma questão sobre o sistema solar", "exercícios relacionados a ..." (preferidos);
+# "questões de frações", "perguntas da segunda guerra" (quando não há os anteriores)
+_TOPIC_RES = (
+    re.compile(r'\b(?:sobre|acerca d[eoa]s?|relacionad[oa]s? (?:a|ao|aos|as|com)|referentes? a|'
+               r'envolvendo|com o tema|do tema)\s+(.+)$'),
+    re.compile(r'\b(?:de|do|da|dos|das|em|no|na|nos|nas)\s+(.+)$'),
+)
+_LEADING_ARTICLES = re.compile(r'^(?:o|a|os|as|um|uma|uns|umas)\s+', re.IGNORECASE)
+_TRAILING = re.compile(r'[\s.!?,;:]+$')
+
+
+def normalize(text):
+    """Minúsculas, sem acentos e com espaços simples (usado só para casar as regras)."""
+    text = unicodedata.normalize('NFKD', text or '').encode('ascii', 'ignore').decode('ascii')
+    return ' '.join(re.findall(r"[\w']+|[?!.,;:]", text.lower()))
+
+
+def is_affirmative(text):
+    """Resposta afirmativa curta ("sim", "pode", "ok"...)."""
+    if not text:
+        return False
+    words = re.findall(r"\w+", normalize(text))
+    return any(w in AFFIRMATIVES for w in words)
+
+
+def _topic(original, normalized, start, bare=False):
+    """Tópico a partir da posição `start` (no texto normalizado), com a grafia original.
+    Com `bare`, na falta de preposição vale o resto da mensagem ("pesquise fotossíntese").
+    """
+    for pattern in _TOPIC_RES + ((re.compile(r'^\s*(.+)$'),) if bare else ()):
+        match = pattern.search(normalized[start:])
+        if match:
+            break
+    else:
+        return None
+    # o tópico são as últimas N palavras da mensagem; recorta-as do texto original (acentos, hífens)
+    words = len(re.findall(r"[\w']+", match.group(1)))
+    spans = [m.span() for m in re.finditer(r"[\w']+", original)]
+    if not words or words > len(spans):
+        return None
+    topic = original[spans[-words][0]:spans[-1][1]]
+    topic = _TRAILING.sub('', _LEADING_ARTICLES.sub('', topic, count=1))
+    return topic or None
+
+
+def classify(message, pending=False):
+    """Intent(intent, topic, confidence, rule) para `message`, ou None se nenhuma regra se aplica.
+
+    `pending` indica se há uma questão criada aguardando confirmação (habilita INSERT).
+    """
+    text = normalize(message)
+    if not text:
+        return None
+    words = re.findall(r"\w+", text)
+    create = re.search(rf'\b{CREATE_VERBS}\b', text)
+    search = re.search(rf'\b{SEARCH_VERBS}\b', text)
+
+    # "pode gerar outra?", "ok, busque outras" pedem outra coisa: não confirmam a pendente
+    if pending and not NEGATIVES.intersection(words) and not (create or search):
+        if len(words) <= 4 and (is_affirmative(text) or re.search(rf'\b{INSERT_VERBS}\b', text)):
+            return Intent('INSERT', None, 0.95, 'confirmacao')
+        if re.search(rf'\b{INSERT_VERBS}\b', text) and re.search(r'\b(ela|essa|esta|isso|questao)\b', text):
+            return Intent('INSERT', None, 0.85, 'verbo_cadastro')
+
+    noun = re.search(rf'\b{QUESTION_NOUNS}\b', text)
+    if create and search:
+        # o primeiro verbo é o pedido; o outro costuma fazer parte do tópico
+        if create.start() < search.start():
+            search = None
+        else:
+            create = None
+    # "a questão de frações, pode gerar outra?": com o substantivo antes do verbo o pedido é
+    # menos claro, e a confiança fica abaixo do limiar
+    verb = create or search
+    verb_first = verb is not None and (noun is None or noun.start() > verb.start())
+    if create and noun:
+        topic = _topic(message, text, noun.end())
+        confidence = (0.9 if verb_first else 0.6) if topic else 0.5
+        return Intent('CREATE', topic, confidence, 'criar_questao')
+    if search:
+        start = noun.end() if noun else search.end()
+        topic = _topic(message, text, start)
+        if topic:
+            return Intent('SEARCH', topic, (0.9 if noun else 0.75) if verb_first else 0.6, 'buscar_questoes')
+        topic = _topic(message, text, start, bare=True)
+        if topic:
+            # "pesquise fotossíntese": provável, mas o resto da frase pode não ser só o tópico
+            return Intent('SEARCH', topic, 0.8 if len(topic.split()) <= 4 else 0.6, 'buscar_termo')
+        return Intent('SEARCH', None, 0.4, 'buscar_sem_topico')
+
+    if text.strip(' ?!.') in GREETINGS or (len(words) <= 3 and ' '.join(words) in GREETINGS):
+        return Intent('CHAT', None, 0.9, 'saudacao')
+    return None
+
+
+# --- MÉTRICAS ---
+
+_lock = threading.Lock()
+_metrics = {'mensagens': 0, 'locais': 0, 'modelo': 0, 'por_intencao': {}, 'por_regra': {}}
+
+
+def record(result, local):
+    """Registra uma classificação: `local` True se a resposta local foi usada."""
+    with _lock:
+        _metrics['mensagens'] += 1
+        if local:
+            _metrics['locais'] += 1
+            _metrics['por_intencao'][result.intent] = _metrics['por_intencao'].get(result.intent, 0) + 1
+        else:
+            _metrics['modelo'] += 1
+        if result is not None:
+            chave = f"{result.rule}:{'local' if local else 'modelo'}"
+            _metrics['por_regra'][chave] = _metrics['por_regra'].get(chave, 0) + 1
+
+
+def resolve(message, pending=False, threshold=None):
+    """Intent local se a confiança bastar (registrando a métrica), senão None — cabe ao chamador
+    consultar o modelo. Nesse caso a chamada ao modelo também é contabilizada aqui.
+    """
+    result = classify(message, pending)
+    local = result is not None and result.confidence >= (THRESHOLD if threshold is None else threshold)
+    record(result, local)
+    return result if local else None
+
+
+def stats():
+    """Métricas acumuladas neste processo, com a taxa de acerto local (chamadas ao modelo evitadas)."""
+    with _lock:
+        data = {k: (dict(v) if isinstance(v, dict) else v) for k, v in _metrics.items()}
+    data['taxa_local'] = data['locais'] / data['mensagens'] if data['mensagens'] else 0.0
+    data['limiar'] = THRESHOLD
+    return data
@@ -0,0 +1,251 @@
+# llm.py
+"""Chamadas ao modelo de linguagem (Gemini) fora das threads que atendem o banco.
+
+Toda geração passa por um pool de threads próprio e limitado (LLM_WORKERS):
+- generate(prompt) espera a resposta completa (com LLM_TIMEOUT);
+- stream(prompt) devolve um iterador com os trechos de texto à medida que o
+  modelo os produz (generate_content(stream=True) do SDK), usado pelo chat
+  via Server-Sent Events.
+Se o pool e a fila de espera (LLM_QUEUE) estiverem cheios, a chamada falha
+na hora com LLMBusy, em vez de acumular requests parados esperando a IA.
+
+O backend é escolhido por LLM_BACKEND:
+- 'gemini' (padrão): google.generativeai, chave em GEMINI_API_KEY;
+- 'fake': respostas determinísticas geradas localmente, com atraso
+  configurável entre trechos (LLM_FAKE_DELAY) — para desenvolvimento e testes
+  sem acesso à API.
+"""
+import os
+import re
+import json
+import time
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+WORKERS = int(os.environ.get('LLM_WORKERS', 4))
+QUEUE_SIZE = int(os.environ.get('LLM_QUEUE', 8))
+TIMEOUT = float(os.environ.get('LLM_TIMEOUT', 60))
+MODEL_NAME = os.environ.get('GEMINI_MODEL', 'gemini-1.5-flash')
+
+GENERATION_CONFIG = {
+    "temperature": 0.7,
+    "top_p": 1,
+    "top_k": 1,
+    "max_output_tokens": 8192,
+}
+
+_executor = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix='llm')
+# vagas = threads + fila; liberadas quando a chamada termina
+_slots = threading.BoundedSemaphore(WORKERS + QUEUE_SIZE)
+_in_flight = 0
+_in_flight_lock = threading.Lock()
+_DONE = object()
+
+
+class LLMError(RuntimeError):
+    """Falha ao obter a resposta do modelo."""
+
+
+class LLMBusy(LLMError):
+    """Todas as vagas do pool de IA estão ocupadas."""
+
+
+class GeminiBackend:
+    """Backend real: google.generativeai."""
+
+    def __init__(self, model_name=MODEL_NAME, api_key=None):
+        import google.generativeai as genai
+
+        genai.configure(api_key=api_key or os.environ.get("GEMINI_API_KEY"))
+        self.model = genai.GenerativeModel(model_name=model_name, generation_config=GENERATION_CONFIG)
+
+    def generate(self, prompt):
+        return self.model.generate_content(prompt).text
+
+    def stream(self, prompt):
+        for chunk in self.model.generate_content(prompt, stream=True):
+            try:
+                text = chunk.text
+            except ValueError:
+                # trecho sem texto (ex.: só metadados de segurança)
+                continue
+            if text:
+                yield text
+
+
+class FakeBackend:
+    """Backend local: imita as respostas que o app espera de cada tipo de prompt."""
+
+    def __init__(self, delay=None):
+        self.delay = float(os.environ.get('LLM_FAKE_DELAY', 0.02) if delay is None else delay)
+
+    @staticmethod
+    def _topic(text):
+        m = re.search(r'\bsobre\s+(?:o\s+|a\s+|os\s+|as\s+)?(.+)', text, re.IGNORECASE)
+        return (m.group(1) if m else text).strip(' .?!"') or 'conhecimentos gerais'
+
+    def _intent(self, prompt):
+        m = re.search(r'Mensagem do usuário: "(.*)"', prompt, re.S)
+        message = m.group(1) if m else ''
+        pending = 'pending_action: Sim' in prompt
+        lower = message.lower()
+        if pending and re.search(r'\b(sim|pode|cadastr\w*|confirm\w*)\b', lower):
+            return {'intent': 'INSERT', 'topic': None}
+        if re.search(r'\b(cri\w*|ger\w*|elabor\w*)\b', lower):
+            return {'intent': 'CREATE', 'topic': self._topic(message)}
+        if re.search(r'\b(procur\w*|pesquis\w*|busc\w*|encontr\w*)\b', lower):
+            return {'intent': 'SEARCH', 'topic': self._topic(message)}
+        return {'intent': 'CHAT', 'topic': None}
+
+    @staticmethod
+    def _question(prompt):
+        m = re.search(r'sobre (?:o tópico )?"?([^".\n]+)', prompt)
+        topic = m.group(1).strip() if m else 'conhecimentos gerais'
+        return {
+            'enunciado': f'Qual alternativa está correta sobre {topic}?',
+            'tipo_questao': 'ESCOLHA_UNICA',
+            'nivel_dificuldade': 'Fácil',
+            'grau_ensino': 'Ensino Fundamental',
+            'area_conhecimento': 'Conhecimentos Gerais',
+            'opcoes': [{'texto_opcao': f'Alternativa {letra}', 'is_correta': letra == 'A'} for letra in 'ABCD'],
+        }
+
+    def _batch(self, prompt):
+        questoes = []
+        for i, item in enumerate(re.findall(r'^\d+\. (.+)$', prompt, re.M), start=1):
+            tipo, nivel, grau, area = (item.split(', ') + ['', '', '', ''])[:4]
+            questao = dict(self._question(f'sobre "{area}"'), enunciado=f'Questão {i} de teste ({item})?',
+                           tipo_questao=tipo.upper().replace(' ', '_'), nivel_dificuldade=nivel.replace('dificuldade ', ''),
+                           grau_ensino=grau, area_conhecimento=area.replace('área ', ''))
+            if questao['tipo_questao'] == 'DISCURSIVA':
+                questao['opcoes'] = []
+            questoes.append(questao)
+        return questoes
+
+    def generate(self, prompt):
+        if 'Responda APENAS com o array JSON' in prompt:
+            return '```json\n' + json.dumps(self._batch(prompt), ensure_ascii=False, indent=1) + '\n```'
+        if 'determinar a intenção' in prompt:
+            return json.dumps(self._intent(prompt), ensure_ascii=False)
+        if 'Responda APENAS com o JSON' in prompt:
+            return '```json\n' + json.dumps(self._question(prompt), ensure_ascii=False) + '\n```'
+        m = re.search(r'Responda à seguinte mensagem: "(.*)"', prompt, re.S)
+        return f'Resposta de teste para: {m.group(1) if m else prompt[:80]}'
+
+    def stream(self, prompt):
+        for piece in re.findall(r'\S+\s*', self.generate(prompt)):
+            if self.delay:
+                time.sleep(self.delay)
+            yield piece
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    """Backend configurado por LLM_BACKEND, criado uma única vez."""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                name = os.environ.get('LLM_BACKEND', 'gemini')
+                _backend = FakeBackend() if name == 'fake' else GeminiBackend()
+    return _backend
+
+
+def set_backend(backend):
+    """Troca o backend em uso (ex.: FakeBackend em testes)."""
+    global _backend
+    _backend = backend
+
+
+def _acquire():
+    global _in_flight
+    if not _slots.acquire(blocking=False):
+        raise LLMBusy("O assistente está ocupado no momento. Tente novamente em instantes.")
+    with _in_flight_lock:
+        _in_flight += 1
+
+
+def _release():
+    global _in_flight
+    with _in_flight_lock:
+        _in_flight -= 1
+    _slots.release()
+
+
+def in_flight():
+    """Chamadas ocupando vagas do pool agora (em execução ou na fila)."""
+    return _in_flight
+
+
+def generate(prompt, timeout=TIMEOUT):
+    """Texto completo da resposta, gerado no pool de IA."""
+    _acquire()
+    future = _executor.submit(get_backend().generate, prompt)
+    future.add_done_callback(lambda _: _release())
+    try:
+        return future.result(timeout=timeout)
+    except FutureTimeout:
+        future.cancel()
+        raise LLMError(f"O modelo não respondeu em {timeout:g}s.")
+
+
+class _Stream:
+    """Iterador dos trechos de uma geração em andamento no pool (ver stream())."""
+
+    def __init__(self, prompt, timeout):
+        self.timeout = timeout
+        self.chunks = queue.Queue()
+        self.cancel = threading.Event()
+        _acquire()
+        try:
+            _executor.submit(self._produce, prompt)
+        except BaseException:
+            _release()
+            raise
+
+    def _produce(self, prompt):
+        try:
+            if not self.cancel.is_set():
+                for text in get_backend().stream(prompt):
+                    if self.cancel.is_set():
+                        break
+                    self.chunks.put(text)
+            self.chunks.put(_DONE)
+        except Exception as e:
+            self.chunks.put(e)
+        finally:
+            _release()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.cancel.is_set():
+            raise StopIteration
+        try:
+            item = self.chunks.get(timeout=self.timeout)
+        except queue.Empty:
+            self.close()
+            raise LLMError(f"O modelo ficou {self.timeout:g}s sem responder.")
+        if item is _DONE:
+            self.close()
+            raise StopIteration
+        if isinstance(item, Exception):
+            self.close()
+            raise LLMError(str(item)) from item
+        return item
+
+    def close(self):
+        self.cancel.set()
+
+
+def stream(prompt, timeout=TIMEOUT):
+    """Iterador com os trechos da resposta. A geração roda no pool de IA e os
+    trechos chegam por uma fila; close() (ex.: cliente desconectou) interrompe a
+    leitura do modelo no próximo trecho — ou antes de começar, se ainda estiver na fila.
+    """
+    return _Stream(prompt, timeout)
@@ -0,0 +1,341 @@
+# media_store.py
+"""Armazenamento de imagens endereçado por conteúdo (SHA-256).
+
+As linhas de questoes/opcoes guardam apenas o hash (imagem_hash); os bytes
+ficam num BlobStore. Imagens idênticas são gravadas uma única vez.
+
+Backends:
+- LocalBlobStore: sistema de arquivos, em diretórios fragmentados (ab/cd/<hash>);
+- ObjectStoreBlobStore: qualquer serviço com a API do S3 (boto3, MinIO, um
+  stand-in local...) — basta um cliente com put_object/copy_object/get_object/head_object/
+  delete_object/list_objects_v2.
+
+Uso como comando (mesmas variáveis de ambiente do app):
+    python media_store.py migrate      # move os BYTEA existentes para o store
+    python media_store.py variantes    # gera as variantes que faltam (image_pipeline.py)
+    python media_store.py gc [--dry-run] [--grace-hours 24]
+"""
+import os
+import re
+import sys
+import time
+import hashlib
+import tempfile
+
+_KEY_RE = re.compile(r'^[0-9a-f]{64}$')
+
+DEFAULT_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'midia')
+
+
+class BlobNotFound(KeyError):
+    """O blob pedido não existe no store."""
+
+
+def blob_key(data):
+    """Chave de um blob: o SHA-256 (hex) do seu conteúdo."""
+    return hashlib.sha256(data).hexdigest()
+
+
+def is_valid_key(key):
+    return bool(key) and bool(_KEY_RE.match(key))
+
+
+def _check_key(key):
+    if not is_valid_key(key):
+        raise ValueError(f'Chave de blob inválida: {key!r}')
+
+
+class BlobStore:
+    """Interface dos backends de armazenamento de blobs."""
+
+    def put(self, data):
+        """Grava `data` (se já existir, só renova a data de modificação) e retorna a sua chave SHA-256."""
+        raise NotImplementedError
+
+    def get(self, key):
+        """Retorna os bytes do blob; levanta BlobNotFound se não existir."""
+        raise NotImplementedError
+
+    def exists(self, key):
+        raise NotImplementedError
+
+    def delete(self, key):
+        """Remove o blob (não faz nada se já não existir)."""
+        raise NotImplementedError
+
+    def iter_blobs(self):
+        """Itera (chave, timestamp_de_modificação) de todos os blobs."""
+        raise NotImplementedError
+
+
+class LocalBlobStore(BlobStore):
+    """Blobs em arquivos sob `root`, fragmentados pelos primeiros caracteres do hash."""
+
+    def __init__(self, root, levels=2, width=2):
+        self.root = root
+        self.levels = levels
+        self.width = width
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, key):
+        _check_key(key)
+        parts = [key[i * self.width:(i + 1) * self.width] for i in range(self.levels)]
+        return os.path.join(self.root, *parts, key)
+
+    def put(self, data):
+        key = blob_key(data)
+        path = self.path(key)
+        try:
+            # já existe: renova o mtime para o período de carência de collect_garbage
+            # valer a partir de agora, não de quando o blob foi gravado pela primeira vez
+            os.utime(path)
+            return key
+        except FileNotFoundError:
+            pass
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        # escrita atômica: arquivo temporário no mesmo diretório + rename
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        return key
+
+    def get(self, key):
+        try:
+            with open(self.path(key), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            raise BlobNotFound(key)
+
+    def exists(self, key):
+        return os.path.exists(self.path(key))
+
+    def delete(self, key):
+        try:
+            os.unlink(self.path(key))
+        except FileNotFoundError:
+            pass
+
+    def iter_blobs(self):
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                if is_valid_key(name):
+                    yield name, os.path.getmtime(os.path.join(dirpath, name))
+
+
+class ObjectStoreBlobStore(BlobStore):
+    """Blobs num bucket compatível com S3. `client` segue a API do boto3."""
+
+    def __init__(self, client, bucket, prefix=''):
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix
+
+    def _object_key(self, key):
+        _check_key(key)
+        return f"{self.prefix}{key[:2]}/{key}"
+
+    @staticmethod
+    def _is_not_found(error):
+        code = getattr(error, 'response', {}).get('Error', {}).get('Code')
+        return code in ('404', 'NoSuchKey', 'NotFound')
+
+    def put(self, data):
+        key = blob_key(data)
+        object_key = self._object_key(key)
+        if self.exists(key):
+            # copia o objeto sobre si mesmo para renovar o LastModified (ver LocalBlobStore.put)
+            try:
+                self.client.copy_object(Bucket=self.bucket, Key=object_key,
+                                        CopySource={'Bucket': self.bucket, 'Key': object_key},
+                                        MetadataDirective='REPLACE')
+                return key
+            except Exception as e:
+                if not self._is_not_found(e):
+                    raise
+        self.client.put_object(Bucket=self.bucket, Key=object_key, Body=data)
+        return key
+
+    def get(self, key):
+        try:
+            obj = self.client.get_object(Bucket=self.bucket, Key=self._object_key(key))
+        except Exception as e:
+            if self._is_not_found(e):
+                raise BlobNotFound(key)
+            raise
+        return obj['Body'].read()
+
+    def exists(self, key):
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self._object_key(key))
+            return True
+        except Exception as e:
+            if self._is_not_found(e):
+                return False
+            raise
+
+    def delete(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=self._object_key(key))
+
+    def iter_blobs(self):
+        kwargs = {'Bucket': self.bucket, 'Prefix': self.prefix}
+        while True:
+            page = self.client.list_objects_v2(**kwargs)
+            for obj in page.get('Contents', []):
+                name = obj['Key'].rsplit('/', 1)[-1]
+                if is_valid_key(name):
+                    modified = obj.get('LastModified')
+                    yield name, modified.timestamp() if modified else time.time()
+            if not page.get('IsTruncated'):
+                break
+            kwargs['ContinuationToken'] = page['NextContinuationToken']
+
+
+def get_store():
+    """Cria o store configurado por MEDIA_BACKEND ('local' ou 's3')."""
+    backend = os.environ.get('MEDIA_BACKEND', 'local')
+    if backend == 's3':
+        try:
+            import boto3
+        except ImportError:
+            raise RuntimeError("MEDIA_BACKEND=s3 requer o pacote boto3 (pip install boto3).")
+        client = boto3.client('s3', endpoint_url=os.environ.get('MEDIA_S3_ENDPOINT') or None)
+        return ObjectStoreBlobStore(client, os.environ['MEDIA_S3_BUCKET'], os.environ.get('MEDIA_S3_PREFIX', ''))
+    return LocalBlobStore(os.environ.get('MEDIA_ROOT', DEFAULT_ROOT))
+
+
+# --- TABELAS QUE REFERENCIAM BLOBS ---
+# (tabela, coluna com o hash, coluna BYTEA legada)
+REFERENCING_COLUMNS = [
+    ('questoes', 'imagem_hash', 'imagem_url'),
+    ('opcoes', 'imagem_hash', 'imagem_url'),
+]
+
+
+def original_keys(cursor):
+    """Conjunto de hashes referenciados diretamente por linhas de questoes/opcoes."""
+    keys = set()
+    for table, hash_col, _ in REFERENCING_COLUMNS:
+        cursor.execute(f"SELECT DISTINCT {hash_col} FROM {table} WHERE {hash_col} IS NOT NULL")
+        keys.update(row[0] for row in cursor.fetchall())
+    return keys
+
+
+def referenced_keys(cursor):
+    """Conjunto de hashes em uso: os referenciados pelas linhas e as variantes deles."""
+    keys = original_keys(cursor)
+    cursor.execute("SELECT original_hash, variante_hash FROM midia_variantes")
+    keys.update(variante for original, variante in cursor.fetchall() if original in keys)
+    return keys
+
+
+def save_variants(conn, store, original_hash, data):
+    """Gera e grava as variantes de uma imagem, se ainda não existirem."""
+    import image_pipeline
+
+    with conn.cursor() as cur:
+        cur.execute("SELECT 1 FROM midia_variantes WHERE original_hash = %s LIMIT 1", (original_hash,))
+        if cur.fetchone():
+            conn.rollback()
+            return 0
+        variants = image_pipeline.make_variants(data)
+        for name, img in variants.items():
+            cur.execute("""INSERT INTO midia_variantes (original_hash, variante, variante_hash, mime, largura, altura)
+                           VALUES (%s, %s, %s, %s, %s, %s)
+                           ON CONFLICT (original_hash, variante) DO NOTHING""",
+                        (original_hash, name, store.put(img.data), img.mime, img.width, img.height))
+    conn.commit()
+    return len(variants)
+
+
+def migrate_legacy_blobs(conn, store, batch_size=100):
+    """Move as imagens ainda gravadas em BYTEA (imagem_url) para o store e limpa a coluna."""
+    moved = 0
+    for table, hash_col, data_col in REFERENCING_COLUMNS:
+        while True:
+            with conn.cursor() as cur:
+                cur.execute(f"SELECT id, {data_col} FROM {table} WHERE {data_col} IS NOT NULL LIMIT %s",
+                            (batch_size,))
+                rows = cur.fetchall()
+                if not rows:
+                    break
+                for row_id, data in rows:
+                    key = store.put(bytes(data))
+                    cur.execute(f"UPDATE {table} SET {hash_col} = %s, {data_col} = NULL WHERE id = %s",
+                                (key, row_id))
+                    moved += 1
+            conn.commit()
+    return moved
+
+
+def collect_garbage(conn, store, grace_seconds=24 * 3600, dry_run=False):
+    """Remove blobs que nenhuma linha referencia.
+
+    Blobs mais novos que `grace_seconds` são preservados: podem pertencer a uma
+    gravação em andamento ou a uma questão da IA ainda pendente de confirmação.
+    Retorna o número de blobs removidos (ou que seriam removidos, com dry_run).
+    """
+    with conn.cursor() as cur:
+        keep = referenced_keys(cur)
+        if not dry_run:
+            cur.execute("""DELETE FROM midia_variantes v
+                           WHERE NOT EXISTS (SELECT 1 FROM questoes q WHERE q.imagem_hash = v.original_hash)
+                             AND NOT EXISTS (SELECT 1 FROM opcoes o WHERE o.imagem_hash = v.original_hash)
+                             AND v.criada_em < NOW() - make_interval(secs => %s)""", (grace_seconds,))
+    conn.commit()
+    cutoff = time.time() - grace_seconds
+    removed = 0
+    for key, modified in list(store.iter_blobs()):
+        if key in keep or modified > cutoff:
+            continue
+        if not dry_run:
+            store.delete(key)
+        removed += 1
+    return removed
+
+
+def main(argv):
+    import argparse
+    from dotenv import load_dotenv
+    import db
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description='Manutenção do media store.')
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('migrate', help='Move as imagens BYTEA para o store.')
+    sub.add_parser('variantes', help='Gera as variantes que faltam para as imagens referenciadas.')
+    gc_parser = sub.add_parser('gc', help='Remove blobs não referenciados.')
+    gc_parser.add_argument('--dry-run', action='store_true')
+    gc_parser.add_argument('--grace-hours', type=float, default=24.0)
+    args = parser.parse_args(argv)
+
+    store = get_store()
+    with db.get_pool().connection() as conn:
+        if args.command == 'migrate':
+            print(f"{migrate_legacy_blobs(conn, store)} imagens movidas para o store.")
+        elif args.command == 'variantes':
+            with conn.cursor() as cur:
+                keys = original_keys(cur)
+            conn.rollback()
+            created = 0
+            for key in keys:
+                try:
+                    created += save_variants(conn, store, key, store.get(key))
+                except (BlobNotFound, ValueError) as e:
+                    conn.rollback()
+                    print(f"Não foi possível gerar variantes de {key}: {e}")
+            print(f"{created} variantes geradas.")
+        else:
+            removed = collect_garbage(conn, store, args.grace_hours * 3600, args.dry_run)
+            verb = 'seriam removidos' if args.dry_run else 'removidos'
+            print(f"{removed} blobs não referenciados {verb}.")
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,65 @@
+# migrate.py
+"""Aplica, em ordem, os scripts de migrations/*.sql ainda não aplicados.
+
+Uso: python migrate.py            (aplica as pendentes)
+     python migrate.py --list     (mostra o estado de cada migração)
+"""
+import os
+import sys
+import psycopg2
+from dotenv import load_dotenv
+
+import db
+
+load_dotenv()
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+
+
+def available_migrations():
+    """Lista os arquivos .sql da pasta migrations, em ordem de nome."""
+    return sorted(f for f in os.listdir(MIGRATIONS_DIR) if f.endswith('.sql'))
+
+
+def applied_migrations(cursor):
+    cursor.execute("""CREATE TABLE IF NOT EXISTS schema_migrations (
+                          nome       TEXT PRIMARY KEY,
+                          aplicada_em TIMESTAMPTZ NOT NULL DEFAULT NOW()
+                      )""")
+    cursor.execute("SELECT nome FROM schema_migrations")
+    return {row[0] for row in cursor.fetchall()}
+
+
+def migrate(list_only=False):
+    """Aplica cada migração pendente na sua própria transação."""
+    with db.get_pool().connection() as conn:
+        cursor = conn.cursor()
+        try:
+            done = applied_migrations(cursor)
+            conn.commit()
+            for nome in available_migrations():
+                if nome in done:
+                    print(f"  [aplicada] {nome}")
+                    continue
+                if list_only:
+                    print(f"  [pendente] {nome}")
+                    continue
+                with open(os.path.join(MIGRATIONS_DIR, nome), encoding='utf-8') as f:
+                    sql = f.read()
+                try:
+                    cursor.execute(sql)
+                    cursor.execute("INSERT INTO schema_migrations (nome) VALUES (%s)", (nome,))
+                    conn.commit()
+                    print(f"  [ok]       {nome}")
+                except psycopg2.Error as e:
+                    conn.rollback()
+                    print(f"Erro ao aplicar {nome}: {e}")
+                    return False
+            return True
+        finally:
+            cursor.close()
+
+
+if __name__ == '__main__':
+    ok = migrate(list_only='--list' in sys.argv[1:])
+    sys.exit(0 if ok else 1)
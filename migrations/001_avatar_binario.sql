@@ -0,0 +1,31 @@
+-- 001_avatar_binario.sql
+-- Guarda a foto de perfil em binário (com tipo MIME, hash e data de alteração) em vez da
+-- data URL base64 em usuarios.foto_perfil, para que /avatar/<id> possa servi-la com cache HTTP.
+
+ALTER TABLE usuarios
+    ADD COLUMN IF NOT EXISTS foto_dados         BYTEA,
+    ADD COLUMN IF NOT EXISTS foto_mime          TEXT,
+    ADD COLUMN IF NOT EXISTS foto_hash          TEXT,
+    ADD COLUMN IF NOT EXISTS foto_atualizada_em TIMESTAMPTZ;
+
+-- Converte as data URLs existentes ("data:<mime>;base64,<dados>"). foto_perfil pode ser TEXT
+-- ou BYTEA conforme a instalação; o cast para bytea + encode 'escape' devolve o texto nos dois casos.
+WITH legado AS (
+    SELECT id, encode(foto_perfil::bytea, 'escape') AS data_url
+    FROM usuarios
+    WHERE foto_perfil IS NOT NULL
+      AND foto_dados IS NULL
+)
+UPDATE usuarios u
+SET foto_dados         = decode(split_part(legado.data_url, ',', 2), 'base64'),
+    foto_mime          = substring(legado.data_url FROM '^data:([^;,]+)'),
+    foto_atualizada_em = NOW()
+FROM legado
+WHERE u.id = legado.id
+  AND legado.data_url LIKE 'data:%;base64,%';
+
+UPDATE usuarios
+SET foto_hash   = encode(sha256(foto_dados), 'hex'),
+    foto_perfil = NULL
+WHERE foto_dados IS NOT NULL
+  AND foto_hash IS NULL;
@@ -0,0 +1,38 @@
+-- 002_midia_questoes.sql
+-- Tipo MIME e hash SHA-256 das imagens de questões e opções, gravados no momento da escrita,
+-- para que /media/questao/<id> e /media/opcao/<id> não precisem inspecionar os bytes a cada leitura.
+
+ALTER TABLE questoes
+    ADD COLUMN IF NOT EXISTS imagem_mime TEXT,
+    ADD COLUMN IF NOT EXISTS imagem_hash TEXT;
+
+ALTER TABLE opcoes
+    ADD COLUMN IF NOT EXISTS imagem_mime TEXT,
+    ADD COLUMN IF NOT EXISTS imagem_hash TEXT;
+
+-- Preenche as imagens já existentes. O tipo é deduzido pela assinatura dos primeiros bytes.
+UPDATE questoes
+SET imagem_hash = encode(sha256(imagem_url), 'hex'),
+    imagem_mime = CASE
+        WHEN substring(imagem_url FROM 1 FOR 8) = '\x89504e470d0a1a0a'::bytea THEN 'image/png'
+        WHEN substring(imagem_url FROM 1 FOR 3) = '\xffd8ff'::bytea THEN 'image/jpeg'
+        WHEN substring(imagem_url FROM 1 FOR 4) = '\x47494638'::bytea THEN 'image/gif'
+        WHEN substring(imagem_url FROM 1 FOR 4) = '\x52494646'::bytea
+             AND substring(imagem_url FROM 9 FOR 4) = '\x57454250'::bytea THEN 'image/webp'
+        ELSE 'application/octet-stream'
+    END
+WHERE imagem_url IS NOT NULL
+  AND imagem_hash IS NULL;
+
+UPDATE opcoes
+SET imagem_hash = encode(sha256(imagem_url), 'hex'),
+    imagem_mime = CASE
+        WHEN substring(imagem_url FROM 1 FOR 8) = '\x89504e470d0a1a0a'::bytea THEN 'image/png'
+        WHEN substring(imagem_url FROM 1 FOR 3) = '\xffd8ff'::bytea THEN 'image/jpeg'
+        WHEN substring(imagem_url FROM 1 FOR 4) = '\x47494638'::bytea THEN 'image/gif'
+        WHEN substring(imagem_url FROM 1 FOR 4) = '\x52494646'::bytea
+             AND substring(imagem_url FROM 9 FOR 4) = '\x57454250'::bytea THEN 'image/webp'
+        ELSE 'application/octet-stream'
+    END
+WHERE imagem_url IS NOT NULL
+  AND imagem_hash IS NULL;
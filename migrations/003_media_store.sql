@@ -0,0 +1,7 @@
+-- 003_media_store.sql
+-- As imagens de questões e opções passam a ficar no media store (media_store.py), endereçadas
+-- pelo SHA-256 em imagem_hash; imagem_url (BYTEA) fica apenas para linhas ainda não migradas.
+-- Depois de aplicar, rode `python media_store.py migrate` para mover os BYTEA existentes.
+
+CREATE INDEX IF NOT EXISTS idx_questoes_imagem_hash ON questoes (imagem_hash) WHERE imagem_hash IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_opcoes_imagem_hash ON opcoes (imagem_hash) WHERE imagem_hash IS NOT NULL;
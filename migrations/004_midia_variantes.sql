@@ -0,0 +1,14 @@
+-- 004_midia_variantes.sql
+-- Variantes de tamanho fixo (miniatura, exportacao) geradas pelo image_pipeline.py para cada
+-- imagem do media store. Ambos os hashes apontam para blobs do store.
+
+CREATE TABLE IF NOT EXISTS midia_variantes (
+    original_hash TEXT        NOT NULL,
+    variante      TEXT        NOT NULL,
+    variante_hash TEXT        NOT NULL,
+    mime          TEXT        NOT NULL,
+    largura       INTEGER     NOT NULL,
+    altura        INTEGER     NOT NULL,
+    criada_em     TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (original_hash, variante)
+);
@@ -0,0 +1,42 @@
+-- 005_busca_textual.sql
+-- Busca full-text em português (sem acentos) para questoes, usada por question_search.py:
+-- coluna tsvector gerada + índice GIN, e índice de trigramas para buscas aproximadas.
+
+CREATE EXTENSION IF NOT EXISTS unaccent;
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+-- unaccent() não é IMMUTABLE; esta versão com dicionário fixo pode ser usada em índices.
+CREATE OR REPLACE FUNCTION f_unaccent(text) RETURNS text
+    LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT
+AS $$ SELECT public.unaccent('public.unaccent'::regdictionary, $1) $$;
+
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_ts_config WHERE cfgname = 'portugues_unaccent') THEN
+        CREATE TEXT SEARCH CONFIGURATION portugues_unaccent (COPY = pg_catalog.portuguese);
+        ALTER TEXT SEARCH CONFIGURATION portugues_unaccent
+            ALTER MAPPING FOR hword, hword_part, word WITH unaccent, portuguese_stem;
+    END IF;
+END
+$$;
+
+-- Enunciado com peso A; área e grau com peso B; nível com peso C.
+-- O cast enum -> text não é IMMUTABLE e não pode entrar numa coluna gerada:
+-- o nível vira texto por um CASE com os valores do enum.
+ALTER TABLE questoes
+    ADD COLUMN IF NOT EXISTS busca tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('portugues_unaccent'::regconfig, coalesce(enunciado, '')), 'A') ||
+        setweight(to_tsvector('portugues_unaccent'::regconfig,
+                              coalesce(area_conhecimento, '') || ' ' || coalesce(grau_ensino, '')), 'B') ||
+        setweight(to_tsvector('portugues_unaccent'::regconfig, CASE nivel_dificuldade
+                                  WHEN 'Fácil' THEN 'Fácil'
+                                  WHEN 'Médio' THEN 'Médio'
+                                  WHEN 'Difícil' THEN 'Difícil'
+                                  WHEN 'Muito Difícil' THEN 'Muito Difícil'
+                                  ELSE ''
+                              END), 'C')
+    ) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_questoes_busca ON questoes USING gin (busca);
+CREATE INDEX IF NOT EXISTS idx_questoes_enunciado_trgm
+    ON questoes USING gin (f_unaccent(lower(enunciado)) gin_trgm_ops);
@@ -0,0 +1,9 @@
+-- 006_paginacao.sql
+-- Índice para a paginação por keyset do banco de questões e da lixeira
+-- (WHERE is_active = ? AND id < cursor ORDER BY id DESC LIMIT n): cada página
+-- é uma leitura curta do índice, sem ordenar nem percorrer as linhas da outra listagem.
+
+CREATE INDEX IF NOT EXISTS idx_questoes_ativas_id ON questoes (is_active, id DESC);
+
+-- A contagem aproximada (question_search.estimate_count) usa as estatísticas do planejador.
+ANALYZE questoes;
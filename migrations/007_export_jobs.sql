@@ -0,0 +1,25 @@
+-- 007_export_jobs.sql
+-- Fila de exportações assíncronas (export_jobs.py). O app insere o pedido e avisa
+-- os workers com NOTIFY export_jobs; o worker gera o arquivo no diretório de spool
+-- (EXPORT_SPOOL_DIR) e atualiza o progresso na própria linha.
+
+CREATE TABLE IF NOT EXISTS export_jobs (
+    id TEXT PRIMARY KEY,
+    usuario_id INTEGER NOT NULL REFERENCES usuarios(id) ON DELETE CASCADE,
+    formato TEXT NOT NULL,
+    questao_ids INTEGER[] NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pendente'
+        CHECK (status IN ('pendente', 'processando', 'concluido', 'erro', 'expirado')),
+    processadas INTEGER NOT NULL DEFAULT 0,
+    total INTEGER NOT NULL DEFAULT 0,
+    arquivo TEXT,
+    nome_arquivo TEXT,
+    erro TEXT,
+    criado_em TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    iniciado_em TIMESTAMPTZ,
+    concluido_em TIMESTAMPTZ,
+    expira_em TIMESTAMPTZ
+);
+
+CREATE INDEX IF NOT EXISTS idx_export_jobs_fila ON export_jobs (criado_em) WHERE status = 'pendente';
+CREATE INDEX IF NOT EXISTS idx_export_jobs_usuario ON export_jobs (usuario_id, status);
@@ -0,0 +1,4 @@
+-- 008_export_opcoes.sql
+-- Opções do renderer de cada exportação (exporters.clean_options): gabarito, colunas...
+
+ALTER TABLE export_jobs ADD COLUMN IF NOT EXISTS opcoes JSONB NOT NULL DEFAULT '{}';
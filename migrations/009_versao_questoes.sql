@@ -0,0 +1,56 @@
+-- 009_versao_questoes.sql
+-- Versão do conteúdo de cada questão, usada na chave do cache de exportações (export_cache.py).
+-- Qualquer UPDATE em questoes (edição, lixeira/restauração...) e qualquer escrita em opcoes
+-- incrementa a versão; assim nenhum caminho de escrita precisa lembrar de fazê-lo.
+
+ALTER TABLE questoes ADD COLUMN IF NOT EXISTS versao INTEGER NOT NULL DEFAULT 1;
+
+CREATE OR REPLACE FUNCTION questoes_incrementa_versao() RETURNS trigger
+    LANGUAGE plpgsql
+AS $$
+BEGIN
+    IF NEW.versao = OLD.versao THEN
+        NEW.versao := OLD.versao + 1;
+    END IF;
+    RETURN NEW;
+END
+$$;
+
+DROP TRIGGER IF EXISTS trg_questoes_versao ON questoes;
+CREATE TRIGGER trg_questoes_versao
+    BEFORE UPDATE ON questoes
+    FOR EACH ROW EXECUTE FUNCTION questoes_incrementa_versao();
+
+-- Triggers por comando (com tabelas de transição): regravar as N opções de uma
+-- questão custa um único UPDATE na questão, não N.
+CREATE OR REPLACE FUNCTION opcoes_incrementa_versao_questao() RETURNS trigger
+    LANGUAGE plpgsql
+AS $$
+BEGIN
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        UPDATE questoes SET versao = versao + 1 WHERE id IN (SELECT questao_id FROM novas);
+    END IF;
+    IF TG_OP IN ('DELETE', 'UPDATE') THEN
+        UPDATE questoes SET versao = versao + 1 WHERE id IN (SELECT questao_id FROM antigas);
+    END IF;
+    RETURN NULL;
+END
+$$;
+
+DROP TRIGGER IF EXISTS trg_opcoes_versao_insert ON opcoes;
+CREATE TRIGGER trg_opcoes_versao_insert
+    AFTER INSERT ON opcoes REFERENCING NEW TABLE AS novas
+    FOR EACH STATEMENT EXECUTE FUNCTION opcoes_incrementa_versao_questao();
+
+DROP TRIGGER IF EXISTS trg_opcoes_versao_update ON opcoes;
+CREATE TRIGGER trg_opcoes_versao_update
+    AFTER UPDATE ON opcoes REFERENCING OLD TABLE AS antigas NEW TABLE AS novas
+    FOR EACH STATEMENT EXECUTE FUNCTION opcoes_incrementa_versao_questao();
+
+DROP TRIGGER IF EXISTS trg_opcoes_versao_delete ON opcoes;
+CREATE TRIGGER trg_opcoes_versao_delete
+    AFTER DELETE ON opcoes REFERENCING OLD TABLE AS antigas
+    FOR EACH STATEMENT EXECUTE FUNCTION opcoes_incrementa_versao_questao();
+
+-- O job registra a chave do artefato, usada como ETag no download.
+ALTER TABLE export_jobs ADD COLUMN IF NOT EXISTS chave_cache TEXT;
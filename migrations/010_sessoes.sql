@@ -0,0 +1,11 @@
+-- 010_sessoes.sql
+-- Sessões do app guardadas no servidor (session_store.py, SESSION_BACKEND=postgres).
+-- O cookie leva só o id; os dados são a sessão serializada pelo Flask (JSON com tags).
+
+CREATE TABLE IF NOT EXISTS sessoes (
+    id TEXT PRIMARY KEY,
+    dados TEXT NOT NULL,
+    expira_em TIMESTAMPTZ NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_sessoes_expira_em ON sessoes (expira_em);
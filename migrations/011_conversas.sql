@@ -0,0 +1,26 @@
+-- 011_conversas.sql
+-- Conversas do chat com a IA (conversations.py). Cada conversa guarda um resumo
+-- acumulado das mensagens antigas (até resumo_ate); o prompt leva esse resumo e
+-- as últimas mensagens, então o tamanho dele não cresce com a conversa.
+
+CREATE TABLE IF NOT EXISTS conversas (
+    id SERIAL PRIMARY KEY,
+    usuario_id INTEGER NOT NULL REFERENCES usuarios(id) ON DELETE CASCADE,
+    titulo TEXT,
+    resumo TEXT NOT NULL DEFAULT '',
+    resumo_ate BIGINT NOT NULL DEFAULT 0,
+    criado_em TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    atualizado_em TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE TABLE IF NOT EXISTS conversa_mensagens (
+    id BIGSERIAL PRIMARY KEY,
+    conversa_id INTEGER NOT NULL REFERENCES conversas(id) ON DELETE CASCADE,
+    papel TEXT NOT NULL CHECK (papel IN ('usuario', 'assistente')),
+    conteudo TEXT NOT NULL,
+    criado_em TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+-- listagem por keyset (id decrescente) das conversas de um usuário e das mensagens de uma conversa
+CREATE INDEX IF NOT EXISTS idx_conversas_usuario ON conversas (usuario_id, id DESC);
+CREATE INDEX IF NOT EXISTS idx_conversa_mensagens_conversa ON conversa_mensagens (conversa_id, id DESC);
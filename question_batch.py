@@ -0,0 +1,207 @@
+# question_batch.py
+"""Validação das questões vindas da IA e geração/gravação em lote.
+
+normalize_question() concentra as regras que valem para qualquer questão
+gerada pelo modelo — a do chat (insert_question_in_db) e as do lote — e
+corrige o que dá para corrigir (nível com ou sem acento, tipo fora da lista,
+opções como texto simples, mais de uma correta numa questão de escolha única).
+Também é o validador da importação em massa (import_questoes.py).
+
+Na geração em lote, cada chamada ao modelo pede um array JSON com até
+BATCH_SIZE questões; os itens são validados à medida que chegam
+(ai_json.iter_array_items, que corrige vírgulas, aspas e itens truncados)
+e podem ser gravados de uma vez com bulk_insert(), numa única transação.
+"""
+import os
+import unicodedata
+
+from psycopg2.extras import execute_values
+
+import ai_json
+import llm
+
+BATCH_SIZE = int(os.environ.get('GENERATION_BATCH_SIZE', 10))
+MAX_COUNT = int(os.environ.get('GENERATION_MAX_COUNT', 50))
+
+VALID_TYPES = ('ESCOLHA_UNICA', 'MULTIPLA_ESCOLHA', 'DISCURSIVA')
+DIFICULDADE_MAP = {'FACIL': 'Fácil', 'MEDIO': 'Médio', 'DIFICIL': 'Difícil', 'MUITO_DIFICIL': 'Muito Difícil'}
+_TRUE_STRINGS = {'true', 'sim', 'verdadeiro', 'correta', 'correto', '1', 'yes'}
+
+
+def _token(value):
+    """'Muito difícil' -> 'MUITO_DIFICIL' (sem acentos, maiúsculas, espaços e hífens como _)."""
+    text = unicodedata.normalize('NFKD', str(value or '')).encode('ascii', 'ignore').decode('ascii')
+    return '_'.join(text.upper().replace('-', ' ').split())
+
+
+def _text(value):
+    return ' '.join(str(value).split()) if value is not None else ''
+
+
+def _is_true(value):
+    if isinstance(value, str):
+        return value.strip().lower() in _TRUE_STRINGS
+    return bool(value)
+
+
+def normalize_question(data, defaults=None):
+    """Questão validada e corrigida (novo dict); levanta ValueError se não houver como aproveitá-la.
+
+    `defaults` (tipo_questao, nivel_dificuldade, grau_ensino, area_conhecimento)
+    preenche o que o modelo deixou de fora.
+    """
+    if not isinstance(data, dict):
+        raise ValueError("A questão não é um objeto JSON.")
+    defaults = defaults or {}
+    enunciado = str(data.get('enunciado') or '').strip()
+    if not enunciado:
+        raise ValueError("Questão sem enunciado.")
+
+    tipo = _token(data.get('tipo_questao'))
+    if tipo not in VALID_TYPES:
+        tipo = _token(defaults.get('tipo_questao'))
+    if tipo not in VALID_TYPES:
+        tipo = 'ESCOLHA_UNICA'
+    nivel = DIFICULDADE_MAP.get(_token(data.get('nivel_dificuldade') or defaults.get('nivel_dificuldade')), 'Médio')
+
+    opcoes = []
+    if tipo != 'DISCURSIVA':
+        for opcao in data.get('opcoes') or []:
+            if isinstance(opcao, str):
+                opcao = {'texto_opcao': opcao, 'is_correta': False}
+            if not isinstance(opcao, dict):
+                continue
+            texto = _text(opcao.get('texto_opcao') or opcao.get('texto'))
+            if texto or opcao.get('imagem_hash'):
+                op = {'texto_opcao': texto, 'is_correta': _is_true(opcao.get('is_correta'))}
+                for key in ('imagem_hash', 'imagem_mime'):
+                    if opcao.get(key):
+                        op[key] = opcao[key]
+                opcoes.append(op)
+        if len(opcoes) < 2:
+            raise ValueError("Questão objetiva com menos de duas opções.")
+        corretas = [op for op in opcoes if op['is_correta']]
+        if not corretas:
+            raise ValueError("Questão objetiva sem opção correta.")
+        if tipo == 'ESCOLHA_UNICA' and len(corretas) > 1:
+            # mantém só a primeira marcada como correta
+            for op in corretas[1:]:
+                op['is_correta'] = False
+
+    questao = {
+        'enunciado': enunciado,
+        'tipo_questao': tipo,
+        'nivel_dificuldade': nivel,
+        'grau_ensino': _text(data.get('grau_ensino') or defaults.get('grau_ensino')) or None,
+        'area_conhecimento': _text(data.get('area_conhecimento') or defaults.get('area_conhecimento')) or None,
+        'opcoes': opcoes,
+    }
+    for key in ('imagem_hash', 'imagem_mime'):
+        if data.get(key):
+            questao[key] = data[key]
+    return questao
+
+
+def parse_question(item, repairs, defaults=None):
+    """normalize_question() sobre um valor vindo de ai_json, registrando se o reparo evitou uma nova chamada."""
+    if item is None:
+        ai_json.record_outcome(repairs, valid=False)
+        raise ValueError("O modelo não retornou um JSON aproveitável.")
+    try:
+        questao = normalize_question(item, defaults)
+    except ValueError:
+        ai_json.record_outcome(repairs, valid=False)
+        raise
+    ai_json.record_outcome(repairs, valid=True)
+    return questao
+
+
+def expand_mix(count, mix):
+    """Lista com `count` especificações (dicts de defaults), distribuindo `mix` em rodízio.
+
+    Cada item de `mix` pode trazer 'quantidade' (limitada ao que falta para `count`);
+    o que sobrar é completado em rodízio. Valores que não são texto são convertidos.
+    """
+    mix = [m for m in (mix or []) if isinstance(m, dict)] or [{}]
+    specs = []
+    for m in mix:
+        quantidade = m.get('quantidade')
+        if isinstance(quantidade, int) and quantidade > 0:
+            specs.extend([m] * min(quantidade, count - len(specs)))
+    i = 0
+    while len(specs) < count:
+        specs.append(mix[i % len(mix)])
+        i += 1
+    return [{
+        'tipo_questao': _token(m.get('tipo') or m.get('tipo_questao') or 'ESCOLHA_UNICA'),
+        'nivel_dificuldade': _text(m.get('nivel') or m.get('nivel_dificuldade')) or 'Fácil',
+        'grau_ensino': _text(m.get('grau') or m.get('grau_ensino')) or 'Ensino Fundamental',
+        'area_conhecimento': _text(m.get('area') or m.get('area_conhecimento')) or 'Conhecimentos Gerais',
+    } for m in specs[:count]]
+
+
+def batch_prompt(specs):
+    linhas = [f"{i}. {s['tipo_questao'].replace('_', ' ').lower()}, dificuldade {s['nivel_dificuldade'].lower()}, "
+              f"{s['grau_ensino']}, área {s['area_conhecimento']}"
+              for i, s in enumerate(specs, start=1)]
+    return (f"Gere {len(specs)} questões, uma para cada especificação abaixo, na mesma ordem:\n"
+            + '\n'.join(linhas) + "\n"
+            "O enunciado deve ser claro. Questões de escolha única ou múltipla têm 4 opções, com uma ou mais corretas; "
+            "questões discursivas não têm opções. "
+            "Formate a resposta como um array JSON em que cada item tem as chaves "
+            "'enunciado', 'tipo_questao', 'nivel_dificuldade', 'grau_ensino', 'area_conhecimento', 'opcoes'. "
+            "A chave 'opcoes' deve ser uma lista de objetos, cada um com as chaves 'texto_opcao' e 'is_correta' (booleano). "
+            "Responda APENAS com o array JSON.")
+
+
+def generate(specs):
+    """Gera as questões de `specs` em chamadas de até BATCH_SIZE itens.
+
+    Gera tuplas (indice, questao, erro) à medida que cada item do array chega:
+    `questao` validada ou `erro` (texto). Itens que o modelo não entregou saem
+    no fim de cada chamada como erro.
+    """
+    for start in range(0, len(specs), BATCH_SIZE):
+        chunk = specs[start:start + BATCH_SIZE]
+        entregues = 0
+        stream = llm.stream(batch_prompt(chunk))
+        try:
+            for item, repairs in ai_json.iter_array_items(stream):
+                if entregues >= len(chunk):
+                    break
+                indice = start + entregues
+                entregues += 1
+                try:
+                    questao = parse_question(item, repairs, chunk[entregues - 1])
+                except ValueError as e:
+                    yield indice, None, str(e)
+                else:
+                    yield indice, questao, None
+        finally:
+            stream.close()
+        for falta in range(entregues, len(chunk)):
+            yield start + falta, None, "O modelo não retornou esta questão."
+
+
+def bulk_insert(cursor, questoes, autor_id):
+    """Insere as questões (já normalizadas) e as opções com dois INSERTs; retorna os ids na mesma ordem.
+    Não faz commit: o chamador decide a transação.
+    """
+    if not questoes:
+        return []
+    rows = execute_values(
+        cursor,
+        """INSERT INTO questoes (enunciado, tipo_questao, autor_id, nivel_dificuldade, grau_ensino,
+                                 area_conhecimento, imagem_mime, imagem_hash)
+           VALUES %s RETURNING id""",
+        [(q['enunciado'], q['tipo_questao'], autor_id, q['nivel_dificuldade'], q['grau_ensino'],
+          q['area_conhecimento'], q.get('imagem_mime'), q.get('imagem_hash')) for q in questoes],
+        fetch=True)
+    # o RETURNING de um INSERT ... VALUES devolve as linhas na ordem dos VALUES
+    ids = [row[0] for row in rows]
+    opcoes = [(questao_id, op['texto_opcao'], op['is_correta'], op.get('imagem_mime'), op.get('imagem_hash'))
+              for questao_id, q in zip(ids, questoes) for op in q['opcoes']]
+    if opcoes:
+        execute_values(cursor, """INSERT INTO opcoes (questao_id, texto_opcao, is_correta, imagem_mime, imagem_hash)
+                                  VALUES %s""", opcoes)
+    return ids
@@ -0,0 +1,118 @@
+# question_loader.py
+"""Carregamento em lote de questões com as suas opções.
+
+Qualquer tela que mostre várias questões (exportação, modal, listagens
+futuras) usa load_questions(): são sempre duas consultas — uma para as
+questões, outra para as opções de todas elas — independentemente de quantas
+questões forem pedidas, e as opções são agrupadas em memória.
+
+Para exportações grandes, iter_questions() faz as mesmas duas consultas em
+cursores do lado do servidor (nomeados) e entrega uma questão por vez, de modo
+que a memória do processo não depende de quantas questões foram selecionadas.
+"""
+import uuid
+from psycopg2.extras import DictCursor
+
+# Linhas trazidas do servidor por ida ao banco nos cursores nomeados
+ITERSIZE = 200
+
+QUESTION_COLUMNS = ('id', 'enunciado', 'tipo_questao', 'autor_id', 'nivel_dificuldade',
+                    'grau_ensino', 'area_conhecimento', 'imagem_hash', 'versao')
+OPTION_COLUMNS = ('id', 'questao_id', 'texto_opcao', 'is_correta', 'imagem_hash')
+
+
+def _select(table, alias, columns, variante, legacy_bytes):
+    cols = [f"{alias}.{c}" for c in columns]
+    join = ''
+    params = []
+    if legacy_bytes:
+        cols.append(f"{alias}.imagem_url")
+    if variante:
+        # hash da variante pedida (ex.: 'exportacao'), ou o original quando ela não existe
+        cols.append(f"COALESCE(v.variante_hash, {alias}.imagem_hash) AS variante_hash")
+        join = f" LEFT JOIN midia_variantes v ON v.original_hash = {alias}.imagem_hash AND v.variante = %s"
+        params.append(variante)
+    return f"SELECT {', '.join(cols)} FROM {table} {alias}{join}", params
+
+
+def load_questions(cursor, ids, variante=None, legacy_bytes=False):
+    """Retorna as questões de `ids` (ordenadas por id) como dicts com a chave 'opcoes'.
+
+    - variante: nome de uma variante de imagem (image_pipeline.VARIANTS); cada
+      questão/opção ganha 'variante_hash' com o hash dela ou, na falta, o do original;
+    - legacy_bytes: inclui a coluna BYTEA legada imagem_url (linhas ainda não
+      migradas para o media store).
+    Questões discursivas recebem uma lista de opções vazia.
+    """
+    ids = sorted({int(i) for i in ids})
+    if not ids:
+        return []
+    sql, params = _select('questoes', 'q', QUESTION_COLUMNS, variante, legacy_bytes)
+    cursor.execute(f"{sql} WHERE q.id = ANY(%s) ORDER BY q.id", (*params, ids))
+    questoes = [dict(row) for row in cursor.fetchall()]
+
+    by_id = {}
+    for questao in questoes:
+        questao['opcoes'] = []
+        if questao['tipo_questao'] != 'DISCURSIVA':
+            by_id[questao['id']] = questao
+    if by_id:
+        sql, params = _select('opcoes', 'o', OPTION_COLUMNS, variante, legacy_bytes)
+        cursor.execute(f"{sql} WHERE o.questao_id = ANY(%s) ORDER BY o.questao_id, o.id",
+                       (*params, list(by_id)))
+        for row in cursor.fetchall():
+            by_id[row['questao_id']]['opcoes'].append(dict(row))
+    return questoes
+
+
+def load_versions(cursor, ids):
+    """[{'id', 'versao'}] das questões de `ids` que existem, ordenadas por id (consulta leve)."""
+    ids = sorted({int(i) for i in ids})
+    if not ids:
+        return []
+    cursor.execute("SELECT id, versao FROM questoes WHERE id = ANY(%s) ORDER BY id", (ids,))
+    return [{'id': row[0], 'versao': row[1]} for row in cursor.fetchall()]
+
+
+def iter_questions(conn, ids, variante=None, legacy_bytes=False, itersize=ITERSIZE):
+    """Gerador com as mesmas questões de load_questions(), uma de cada vez.
+
+    As questões e as opções vêm de dois cursores nomeados na conexão `conn`,
+    ambos ordenados por id da questão, e são combinadas em sequência (merge).
+    Os cursores só existem dentro da transação: não faça commit/rollback em
+    `conn` enquanto o gerador estiver em uso.
+    """
+    ids = sorted({int(i) for i in ids})
+    if not ids:
+        return
+    sufixo = uuid.uuid4().hex[:12]
+    q_cur = conn.cursor(name=f'iter_questoes_{sufixo}', cursor_factory=DictCursor)
+    o_cur = conn.cursor(name=f'iter_opcoes_{sufixo}', cursor_factory=DictCursor)
+    q_cur.itersize = o_cur.itersize = itersize
+    try:
+        sql, params = _select('questoes', 'q', QUESTION_COLUMNS, variante, legacy_bytes)
+        q_cur.execute(f"{sql} WHERE q.id = ANY(%s) ORDER BY q.id", (*params, ids))
+        sql, params = _select('opcoes', 'o', OPTION_COLUMNS, variante, legacy_bytes)
+        o_cur.execute(f"{sql} WHERE o.questao_id = ANY(%s) ORDER BY o.questao_id, o.id", (*params, ids))
+
+        opcoes = iter(o_cur)
+        pendente = next(opcoes, None)
+        for row in q_cur:
+            questao = dict(row)
+            questao['opcoes'] = []
+            while pendente is not None and pendente['questao_id'] < questao['id']:
+                pendente = next(opcoes, None)
+            while pendente is not None and pendente['questao_id'] == questao['id']:
+                if questao['tipo_questao'] != 'DISCURSIVA':
+                    questao['opcoes'].append(dict(pendente))
+                pendente = next(opcoes, None)
+            yield questao
+    finally:
+        q_cur.close()
+        o_cur.close()
+
+
+def load_question(cursor, questao_id, **kwargs):
+    """Uma única questão com as suas opções, ou None se não existir."""
+    questoes = load_questions(cursor, [questao_id], **kwargs)
+    return questoes[0] if questoes else None
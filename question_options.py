@@ -0,0 +1,93 @@
+# question_options.py
+"""Sincronização das opções de uma questão na edição.
+
+Em vez de apagar todas as opções e inseri-las de novo (o que descartava as
+imagens não reenviadas e reescrevia todas as linhas), sync_options() compara
+o formulário com o que está no banco, pelo id de cada opção:
+- opções sem mudança não são tocadas;
+- texto ou "correta" alterados viram um UPDATE só dessas colunas; a imagem só
+  muda quando uma nova é enviada;
+- opções novas são inseridas e as removidas no formulário são apagadas.
+Cada grupo é um único comando (execute_values / ANY), qualquer que seja o
+número de opções. A leitura inicial traz só ids, textos, hashes e se há imagem
+legada — nenhum byte de imagem.
+"""
+from psycopg2.extras import execute_values
+
+
+def form_options(form, files):
+    """Opções enviadas pelo formulário de edição, na ordem da tela.
+
+    Cada uma é um dict com 'id' (None para opções novas), 'texto_opcao',
+    'is_correta' e 'imagem' (bytes de uma imagem nova, ou None).
+    Os campos vêm em listas paralelas: opcoes_id[], opcoes_texto[], opcoes_imagem[];
+    respostas_corretas[] traz as posições das corretas.
+    """
+    ids = form.getlist('opcoes_id[]')
+    textos = form.getlist('opcoes_texto[]')
+    imagens = files.getlist('opcoes_imagem[]')
+    corretas = set(form.getlist('respostas_corretas[]'))
+    opcoes = []
+    for i, texto in enumerate(textos):
+        try:
+            opcao_id = int(ids[i]) if i < len(ids) and ids[i] else None
+        except ValueError:
+            opcao_id = None
+        imagem = imagens[i].read() if i < len(imagens) and imagens[i].filename else None
+        opcoes.append({'id': opcao_id, 'texto_opcao': texto, 'is_correta': str(i) in corretas, 'imagem': imagem})
+    return opcoes
+
+
+def sync_options(cursor, questao_id, opcoes, store_image):
+    """Aplica `opcoes` (ver form_options) às opções gravadas da questão, sem commit.
+
+    `store_image(bytes)` grava uma imagem nova e retorna (mime, hash).
+    Retorna as contagens {'inseridas', 'atualizadas', 'removidas', 'inalteradas'}.
+    """
+    cursor.execute("""SELECT id, texto_opcao, is_correta, imagem_hash, imagem_url IS NOT NULL
+                      FROM opcoes WHERE questao_id = %s""", (questao_id,))
+    atuais = {row[0]: row for row in cursor.fetchall()}
+
+    inserir, atualizar, mantidas = [], [], set()
+    inalteradas = 0
+    for opcao in opcoes:
+        atual = atuais.get(opcao['id'])
+        if atual is not None and atual[0] in mantidas:
+            atual = None  # id repetido no formulário: trata como opção nova
+        # a imagem atual pode estar só no BYTEA legado (imagem_url), ainda não migrado
+        tem_imagem = bool(opcao['imagem']) or (atual is not None and (atual[3] is not None or atual[4]))
+        if not opcao['texto_opcao'] and not tem_imagem:
+            continue  # opção vazia: se existia, é removida
+        imagem_mime, imagem_hash = store_image(opcao['imagem'])
+        if atual is None:
+            inserir.append((questao_id, opcao['texto_opcao'], opcao['is_correta'], imagem_mime, imagem_hash))
+            continue
+        mantidas.add(atual[0])
+        if (opcao['texto_opcao'] == atual[1] and opcao['is_correta'] == atual[2]
+                and (imagem_hash is None or imagem_hash == atual[3])):
+            inalteradas += 1
+            continue
+        atualizar.append((atual[0], questao_id, opcao['texto_opcao'], opcao['is_correta'], imagem_mime, imagem_hash))
+    remover = [opcao_id for opcao_id in atuais if opcao_id not in mantidas]
+
+    if remover:
+        cursor.execute("DELETE FROM opcoes WHERE questao_id = %s AND id = ANY(%s)", (questao_id, remover))
+    if atualizar:
+        # imagem nula no VALUES = manter a atual; imagem nova descarta também o BYTEA legado
+        execute_values(
+            cursor,
+            """UPDATE opcoes AS o
+               SET texto_opcao = v.texto_opcao,
+                   is_correta  = v.is_correta,
+                   imagem_mime = COALESCE(v.imagem_mime, o.imagem_mime),
+                   imagem_hash = COALESCE(v.imagem_hash, o.imagem_hash),
+                   imagem_url  = CASE WHEN v.imagem_hash IS NULL THEN o.imagem_url END
+               FROM (VALUES %s) AS v (id, questao_id, texto_opcao, is_correta, imagem_mime, imagem_hash)
+               WHERE o.id = v.id AND o.questao_id = v.questao_id""",
+            atualizar, template="(%s::int, %s::int, %s::text, %s::boolean, %s::text, %s::text)")
+    if inserir:
+        execute_values(cursor,
+                       "INSERT INTO opcoes (questao_id, texto_opcao, is_correta, imagem_mime, imagem_hash) VALUES %s",
+                       inserir)
+    return {'inseridas': len(inserir), 'atualizadas': len(atualizar), 'removidas': len(remover),
+            'inalteradas': inalteradas}
@@ -0,0 +1,132 @@
+# question_search.py
+"""Serviço de busca de questões (full-text em português, com fallback por trigramas).
+
+Usa a coluna questoes.busca e os índices criados em migrations/005_busca_textual.sql,
+de modo que a latência não cresce com o tamanho do banco (nada de ILIKE '%termo%').
+Cada palavra digitada vira um prefixo (`fraç` encontra `frações`), o que atende a
+caixa de busca ao vivo.
+"""
+import os
+import re
+import json
+
+FTS_CONFIG = 'portugues_unaccent'
+FUZZY_ENABLED = os.environ.get('SEARCH_FUZZY', '1') != '0'
+
+DEFAULT_COLUMNS = ('id', 'enunciado', 'tipo_questao', 'nivel_dificuldade', 'grau_ensino', 'area_conhecimento')
+
+_WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def to_prefix_tsquery(term):
+    """Converte o texto digitado numa expressão to_tsquery segura: 'a & b:*'.
+
+    Só letras/dígitos passam, então operadores do tsquery digitados pelo usuário
+    não quebram a consulta. Retorna None se não sobrar nenhuma palavra.
+    """
+    words = _WORD_RE.findall(term or '')
+    words = [w for w in words if w != '_']
+    if not words:
+        return None
+    return ' & '.join(f"{w}:*" for w in words)
+
+
+def match_clause(term, alias='questoes'):
+    """Fragmento WHERE (sql, params) que filtra questões pelo termo, para compor com outros filtros."""
+    tsquery = to_prefix_tsquery(term)
+    if tsquery is None:
+        return 'TRUE', []
+    return f"{alias}.busca @@ to_tsquery('{FTS_CONFIG}', %s)", [tsquery]
+
+
+def search(cursor, term, limit=10, columns=DEFAULT_COLUMNS, active=True, fuzzy=FUZZY_ENABLED):
+    """Retorna até `limit` questões que casam com `term`, ordenadas por relevância (ts_rank).
+
+    Se a busca textual não encontrar nada e `fuzzy` estiver ativo, recorre à
+    similaridade de trigramas sobre o enunciado (tolera erros de digitação).
+    """
+    tsquery = to_prefix_tsquery(term)
+    if tsquery is None:
+        return []
+    cols = ', '.join(f"q.{c}" for c in columns)
+    cursor.execute(f"""SELECT {cols}
+                       FROM questoes q, to_tsquery('{FTS_CONFIG}', %s) query
+                       WHERE q.is_active = %s AND q.busca @@ query
+                       ORDER BY ts_rank(q.busca, query) DESC, q.id DESC
+                       LIMIT %s""", (tsquery, active, limit))
+    rows = cursor.fetchall()
+    if rows or not fuzzy:
+        return rows
+    cursor.execute(f"""SELECT {cols}
+                       FROM questoes q
+                       WHERE q.is_active = %s AND f_unaccent(lower(%s)) <%% f_unaccent(lower(q.enunciado))
+                       ORDER BY word_similarity(f_unaccent(lower(%s)), f_unaccent(lower(q.enunciado))) DESC, q.id DESC
+                       LIMIT %s""", (active, term, term, limit))
+    return cursor.fetchall()
+
+
+# --- LISTAGEM PAGINADA (keyset) ---
+
+PAGE_SIZE = int(os.environ.get('QUESTOES_PAGE_SIZE', 50))
+MAX_PAGE_SIZE = 200
+
+LIST_COLUMNS = DEFAULT_COLUMNS
+TRASH_COLUMNS = ('id', 'enunciado', 'tipo_questao')
+
+
+def filter_clause(active=True, term='', nivel='', grau='', area=''):
+    """Fragmento WHERE (sql, params) com os filtros da listagem do banco de questões."""
+    clauses = ['questoes.is_active = %s']
+    params = [active]
+    if term:
+        match_sql, match_params = match_clause(term)
+        clauses.append(match_sql)
+        params.extend(match_params)
+    if nivel:
+        clauses.append('questoes.nivel_dificuldade = %s')
+        params.append(nivel)
+    if grau:
+        clauses.append('questoes.grau_ensino = %s')
+        params.append(grau)
+    if area:
+        clauses.append('questoes.area_conhecimento ILIKE %s')
+        params.append(f"%{area}%")
+    return ' AND '.join(clauses), params
+
+
+def page(cursor, where_sql, params, after_id=None, page_size=PAGE_SIZE, columns=LIST_COLUMNS):
+    """Retorna (linhas, próximo_cursor) de uma página ordenada por id decrescente.
+
+    Paginação por keyset: em vez de OFFSET, a página seguinte começa em
+    `id < after_id`, o que usa a chave primária e custa o mesmo em qualquer
+    ponto da lista. Uma linha a mais é lida para saber se há próxima página;
+    próximo_cursor é None na última.
+    """
+    page_size = max(1, min(int(page_size), MAX_PAGE_SIZE))
+    sql = f"SELECT {', '.join(columns)} FROM questoes WHERE {where_sql}"
+    params = list(params)
+    if after_id is not None:
+        sql += " AND questoes.id < %s"
+        params.append(after_id)
+    sql += " ORDER BY questoes.id DESC LIMIT %s"
+    params.append(page_size + 1)
+    cursor.execute(sql, tuple(params))
+    rows = cursor.fetchall()
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        return rows, rows[-1]['id']
+    return rows, None
+
+
+def estimate_count(cursor, where_sql, params):
+    """Total aproximado de linhas que satisfazem o filtro, sem COUNT(*).
+
+    Usa a estimativa do planejador (EXPLAIN), baseada nas estatísticas do
+    ANALYZE/autovacuum: custa o mesmo que planejar a consulta, qualquer que
+    seja o tamanho da tabela.
+    """
+    cursor.execute(f"EXPLAIN (FORMAT JSON) SELECT 1 FROM questoes WHERE {where_sql}", tuple(params))
+    plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
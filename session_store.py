@@ -0,0 +1,307 @@
+# session_store.py
+"""Sessões guardadas no servidor; o cookie leva só um id opaco.
+
+A sessão padrão do Flask serializa tudo no cookie — inclusive a questão
+pendente do chat (enunciado, opções, imagem) —, que vai e volta em todo
+request e some sem aviso ao passar de ~4 KB. Aqui o cookie tem apenas um id
+aleatório e os dados ficam num SessionStore escolhido por SESSION_BACKEND:
+- 'sqlite' (padrão): arquivo local (SESSION_SQLITE_PATH), compartilhado pelos
+  processos de uma mesma máquina;
+- 'postgres': tabela sessoes (migrations/010_sessoes.sql), para vários workers
+  ou máquinas, com um pool de conexões próprio (SESSION_DB_POOL_MAX);
+- 'cookie': a sessão assinada padrão do Flask (comportamento anterior).
+
+As sessões expiram após SESSION_TTL segundos sem uso. A expiração gravada só é
+renovada quando passou da metade do TTL, então requests que apenas leem a
+sessão não escrevem no store; arquivos estáticos nem chegam a consultá-lo. Uma
+thread em segundo plano apaga as vencidas a cada SESSION_SWEEP_INTERVAL segundos.
+session.clear() (login/logout) troca o id da sessão.
+"""
+import os
+import re
+import time
+import secrets
+import sqlite3
+import threading
+from datetime import datetime, timezone
+
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+
+TTL = float(os.environ.get('SESSION_TTL', 7 * 24 * 3600))
+SWEEP_INTERVAL = float(os.environ.get('SESSION_SWEEP_INTERVAL', 600))
+DB_POOL_MAX = int(os.environ.get('SESSION_DB_POOL_MAX', 2))
+DB_POOL_TIMEOUT = float(os.environ.get('SESSION_DB_POOL_TIMEOUT', 5))
+DEFAULT_SQLITE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sessoes', 'sessoes.sqlite3')
+
+_SID_RE = re.compile(r'^[A-Za-z0-9_-]{43}$')
+
+
+def new_sid():
+    return secrets.token_urlsafe(32)
+
+
+class ServerSession(CallbackDict, SessionMixin):
+    """Dados da sessão de um request; `sid` é None enquanto nada foi gravado."""
+
+    def __init__(self, initial=None, sid=None, expires_at=None):
+        def on_update(self):
+            self.modified = True
+            self.accessed = True
+
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.expires_at = expires_at
+        self.modified = False
+        self.accessed = False
+        self.regenerate = False
+        self.skip = False
+
+    def clear(self):
+        # login/logout: a sessão recomeça com outro id (evita fixação de sessão)
+        super().clear()
+        self.regenerate = True
+
+    def __getitem__(self, key):
+        self.accessed = True
+        return super().__getitem__(key)
+
+    def get(self, key, default=None):
+        self.accessed = True
+        return super().get(key, default)
+
+
+# --- BACKENDS ---
+
+class SQLiteSessionStore:
+    """Sessões num arquivo SQLite (modo WAL), com uma conexão por thread."""
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("""CREATE TABLE IF NOT EXISTS sessoes (
+                            id        TEXT PRIMARY KEY,
+                            dados     TEXT NOT NULL,
+                            expira_em REAL NOT NULL
+                        )""")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_sessoes_expira_em ON sessoes (expira_em)")
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def load(self, sid):
+        """(dados, expira_em) da sessão, ou None se não existir ou já tiver vencido."""
+        row = self._conn().execute("SELECT dados, expira_em FROM sessoes WHERE id = ? AND expira_em > ?",
+                                   (sid, time.time())).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def save(self, sid, dados, expira_em):
+        self._conn().execute("""INSERT INTO sessoes (id, dados, expira_em) VALUES (?, ?, ?)
+                                ON CONFLICT (id) DO UPDATE SET dados = excluded.dados, expira_em = excluded.expira_em""",
+                             (sid, dados, expira_em))
+
+    def touch(self, sid, expira_em):
+        self._conn().execute("UPDATE sessoes SET expira_em = ? WHERE id = ?", (expira_em, sid))
+
+    def delete(self, sid):
+        self._conn().execute("DELETE FROM sessoes WHERE id = ?", (sid,))
+
+    def sweep(self):
+        """Apaga as sessões vencidas; retorna quantas."""
+        return self._conn().execute("DELETE FROM sessoes WHERE expira_em <= ?", (time.time(),)).rowcount
+
+
+class PostgresSessionStore:
+    """Sessões na tabela sessoes do PostgreSQL.
+
+    As conexões vêm de um pool pequeno e só do store (SESSION_DB_POOL_MAX), não
+    do pool dos requests: save_session roda enquanto o request ainda segura a
+    conexão dele, e com o pool principal esgotado todos os requests esperariam
+    uns pelos outros até o timeout.
+    """
+
+    def __init__(self, pool=None):
+        self._pool = pool
+        self._own_pool = pool is None
+        self._pool_pid = None
+        self._pool_lock = threading.Lock()
+
+    @property
+    def pool(self):
+        # criado no primeiro uso de cada processo (workers com fork têm o seu)
+        if self._own_pool and (self._pool is None or self._pool_pid != os.getpid()):
+            with self._pool_lock:
+                if self._pool is None or self._pool_pid != os.getpid():
+                    import db
+                    self._pool = db.ConnectionPool(min_size=0, max_size=DB_POOL_MAX, timeout=DB_POOL_TIMEOUT)
+                    self._pool_pid = os.getpid()
+        return self._pool
+
+    def _execute(self, sql, params):
+        with self.pool.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(sql, params)
+                row = cur.fetchone() if cur.description else None
+                count = cur.rowcount
+            conn.commit()
+        return row, count
+
+    def load(self, sid):
+        row, _ = self._execute("""SELECT dados, EXTRACT(EPOCH FROM expira_em) FROM sessoes
+                                  WHERE id = %s AND expira_em > NOW()""", (sid,))
+        return (row[0], float(row[1])) if row else None
+
+    def save(self, sid, dados, expira_em):
+        self._execute("""INSERT INTO sessoes (id, dados, expira_em) VALUES (%s, %s, to_timestamp(%s))
+                         ON CONFLICT (id) DO UPDATE SET dados = EXCLUDED.dados, expira_em = EXCLUDED.expira_em""",
+                      (sid, dados, expira_em))
+
+    def touch(self, sid, expira_em):
+        self._execute("UPDATE sessoes SET expira_em = to_timestamp(%s) WHERE id = %s", (expira_em, sid))
+
+    def delete(self, sid):
+        self._execute("DELETE FROM sessoes WHERE id = %s", (sid,))
+
+    def sweep(self):
+        """Apaga as sessões vencidas; retorna quantas."""
+        return self._execute("DELETE FROM sessoes WHERE expira_em <= NOW()", ())[1]
+
+
+# --- INTEGRAÇÃO COM O FLASK ---
+
+class ServerSessionInterface(SessionInterface):
+    """SessionInterface do Flask sobre um SessionStore (ver o docstring do módulo)."""
+
+    serializer = TaggedJSONSerializer()
+    session_class = ServerSession
+
+    def __init__(self, store, ttl=TTL, sweep_interval=SWEEP_INTERVAL):
+        self.store = store
+        self.ttl = ttl
+        self.sweep_interval = sweep_interval
+        self._sweeper = None
+        self._sweeper_pid = None
+        self._sweeper_lock = threading.Lock()
+
+    def open_session(self, app, request):
+        if app.static_url_path and request.path.startswith(app.static_url_path + '/'):
+            session = self.session_class()
+            session.skip = True
+            return session
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid and _SID_RE.match(sid):
+            try:
+                found = self.store.load(sid)
+            except Exception as e:
+                print(f"Erro ao carregar a sessão: {e}")
+                found = None
+            if found:
+                dados, expira_em = found
+                try:
+                    return self.session_class(self.serializer.loads(dados), sid, expira_em)
+                except ValueError as e:
+                    print(f"Sessão {sid[:8]}... corrompida, descartada: {e}")
+        return self.session_class()
+
+    def save_session(self, app, session, response):
+        if session.skip:
+            return
+        self._ensure_sweeper()
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        if session.accessed or session.sid:
+            response.vary.add('Cookie')
+
+        if not session:
+            if session.sid and (session.modified or session.regenerate):
+                self._delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path,
+                                       secure=self.get_cookie_secure(app), httponly=self.get_cookie_httponly(app),
+                                       samesite=self.get_cookie_samesite(app))
+            return
+
+        now = time.time()
+        expira_em = now + self.ttl
+        if session.regenerate and session.sid:
+            self._delete(session.sid)
+            session.sid = None
+        if session.sid is None or session.modified:
+            sid = session.sid or new_sid()
+            try:
+                self.store.save(sid, self.serializer.dumps(dict(session)), expira_em)
+            except Exception as e:
+                # a resposta da view já está pronta: perde-se só a alteração da sessão
+                print(f"Erro ao gravar a sessão: {e}")
+                return
+            session.sid = sid
+        elif session.expires_at is None or session.expires_at - now < self.ttl / 2:
+            try:
+                self.store.touch(session.sid, expira_em)
+            except Exception as e:
+                print(f"Erro ao renovar a sessão: {e}")
+                return
+        else:
+            # nada mudou e a expiração ainda está longe: nenhuma escrita, nenhum Set-Cookie
+            return
+        session.expires_at = expira_em
+        response.set_cookie(name, session.sid,
+                            expires=datetime.fromtimestamp(expira_em, timezone.utc),
+                            httponly=self.get_cookie_httponly(app), domain=domain, path=path,
+                            secure=self.get_cookie_secure(app), samesite=self.get_cookie_samesite(app))
+
+    def _delete(self, sid):
+        try:
+            self.store.delete(sid)
+        except Exception as e:
+            print(f"Erro ao apagar a sessão: {e}")
+
+    def _ensure_sweeper(self):
+        # iniciada no primeiro request de cada processo (workers com fork têm a sua)
+        if self.sweep_interval <= 0:
+            return
+        if self._sweeper is not None and self._sweeper_pid == os.getpid() and self._sweeper.is_alive():
+            return
+        with self._sweeper_lock:
+            if self._sweeper is not None and self._sweeper_pid == os.getpid() and self._sweeper.is_alive():
+                return
+            self._sweeper = threading.Thread(target=self._sweep_loop, name='sessoes-sweeper', daemon=True)
+            self._sweeper_pid = os.getpid()
+            self._sweeper.start()
+
+    def _sweep_loop(self):
+        while True:
+            time.sleep(self.sweep_interval)
+            try:
+                removidas = self.store.sweep()
+                if removidas:
+                    print(f"{removidas} sessões vencidas removidas.")
+            except Exception as e:
+                print(f"Erro ao limpar sessões vencidas: {e}")
+
+
+def get_store():
+    """Cria o store configurado por SESSION_BACKEND ('sqlite' ou 'postgres'); None para 'cookie'."""
+    backend = os.environ.get('SESSION_BACKEND', 'sqlite')
+    if backend == 'cookie':
+        return None
+    if backend == 'postgres':
+        return PostgresSessionStore()
+    return SQLiteSessionStore(os.environ.get('SESSION_SQLITE_PATH', DEFAULT_SQLITE_PATH))
+
+
+def init_app(app):
+    """Troca a sessão por cookie do app pela sessão no servidor, se configurada."""
+    store = get_store()
+    if store is not None:
+        app.session_interface = ServerSessionInterface(store)
+    return store
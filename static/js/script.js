@@ -258,6 +258,7 @@ document.addEventListener('DOMContentLoaded', () => {
             newOption.innerHTML = `
                 <label for="opcao_texto_${optionCount}">Opção ${String.fromCharCode(64 + optionCount)}</label>
                 <div class="option-input-group">
+                    <input type="hidden" name="opcoes_id[]" value="">
                     <input type="text" name="opcoes_texto[]" id="opcao_texto_${optionCount}" placeholder="Texto da opção" value="${text}" required>
                     <label class="correct-answer-label">
                         <input type="${inputType}" name="respostas_corretas[]" value="${optionCount - 1}" ${isCorrect ? 'checked' : ''}>
@@ -361,22 +362,107 @@ document.addEventListener('DOMContentLoaded', () => {
             else { selectedIds.delete(id); questionItem?.classList.remove('selected'); }
             updateSelectionUI();
         });
+        // a exportação roda em segundo plano (export_jobs.py): cria o job, acompanha o progresso e baixa o arquivo
+        const waitForExportJob = async (statusUrl) => {
+            while (true) {
+                await new Promise(resolve => setTimeout(resolve, 1000));
+                const response = await fetch(statusUrl);
+                const job = await response.json();
+                if (!response.ok) throw new Error(job.error || 'Falha ao consultar a exportação');
+                if (job.status === 'concluido') return job;
+                if (job.status === 'erro' || job.status === 'expirado') throw new Error(job.erro || 'Falha na exportação');
+                exportBtn.textContent = `Exportando... ${job.progresso}%`;
+            }
+        };
         exportBtn?.addEventListener('click', async () => {
             if (selectedIds.size === 0) return alert('Selecione pelo menos uma questão para exportar.');
             const format = exportFormat.value, ids = Array.from(selectedIds);
+            const options = { gabarito: document.getElementById('exportGabarito')?.checked || false, colunas: Number(document.getElementById('exportColunas')?.value || 1) };
+            const originalLabel = exportBtn.textContent;
+            exportBtn.disabled = true;
+            exportBtn.textContent = 'Exportando...';
             try {
-                const response = await fetch('/export_questoes', { method: 'POST', headers: { 'Content-Type': 'application/json' }, body: JSON.stringify({ ids, format }) });
-                if (!response.ok) throw new Error((await response.json()).error || 'Falha na exportação');
-                const blob = await response.blob(), url = window.URL.createObjectURL(blob), a = document.createElement('a');
-                a.style.display = 'none'; a.href = url;
-                const disposition = response.headers.get('content-disposition');
-                let filename = `questoes.${format}`;
-                if (disposition) { const match = /filename[^;=\n]*=((['"]).*?\2|[^;\n]*)/.exec(disposition); if (match?.[1]) filename = match[1].replace(/['"]/g, ''); }
-                a.download = filename; document.body.appendChild(a); a.click(); window.URL.revokeObjectURL(url); a.remove();
+                const response = await fetch('/export_jobs', { method: 'POST', headers: { 'Content-Type': 'application/json' }, body: JSON.stringify({ ids, format, options }) });
+                const data = await response.json();
+                if (!response.ok) throw new Error(data.error || 'Falha na exportação');
+                await waitForExportJob(data.status_url);
+                const a = document.createElement('a');
+                a.style.display = 'none'; a.href = data.download_url;
+                document.body.appendChild(a); a.click(); a.remove();
             } catch (error) { showFlashMessage(`Erro ao exportar: ${error.message}`, 'error'); }
+            finally {
+                exportBtn.disabled = false;
+                exportBtn.textContent = originalLabel;
+            }
         });
     };
 
+    // ===================================
+    // MÓDULO: ROLAGEM INFINITA (BANCO DE QUESTÕES / LIXEIRA)
+    // ===================================
+    const setupInfiniteScroll = () => {
+        const list = document.getElementById('paginatedList'), sentinel = document.getElementById('listSentinel');
+        if (!list || !sentinel) return;
+        let nextCursor = list.dataset.nextCursor;
+        let loading = false;
+
+        const escapeHtml = (text) => String(text ?? '').replace(/[&<>"']/g, c => ({ '&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;' }[c]));
+        const trashIcon = '<svg xmlns="http://www.w3.org/2000/svg" width="20" height="20" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2" stroke-linecap="round" stroke-linejoin="round"><polyline points="3 6 5 6 21 6"></polyline><path d="M19 6v14a2 2 0 0 1-2 2H7a2 2 0 0 1-2-2V6m3 0V4a2 2 0 0 1 2-2h4a2 2 0 0 1 2 2v2"></path><line x1="10" y1="11" x2="10" y2="17"></line><line x1="14" y1="11" x2="14" y2="17"></line></svg>';
+
+        // mesmo markup dos itens renderizados em painel.html
+        const renderItem = (questao) => {
+            const id = escapeHtml(questao.id), enunciado = escapeHtml(questao.enunciado);
+            if (list.dataset.view === 'lixeira') {
+                return `<div class="question-item deleted-item"><div class="question-item-content"><p><strong>#${id}:</strong> ${enunciado}</p><small>Tipo: ${escapeHtml((questao.tipo_questao || '').replace('_', ' '))}</small></div>` +
+                       `<div class="action-buttons"><button class="restore-btn" data-id="${id}" title="Restaurar Questão">Restaurar</button><button class="perm-delete-btn" data-id="${id}" title="Excluir Permanentemente"><i class="fas fa-trash-alt"></i> Excluir</button></div></div>`;
+            }
+            const nivel = questao.nivel_dificuldade || '';
+            const tagsHTML = `<span class="tag tag-${escapeHtml(nivel.toLowerCase())}">${escapeHtml(nivel.replace('_', ' '))}</span>` +
+                             `${questao.grau_ensino ? `<span class="tag tag-grau">${escapeHtml(questao.grau_ensino)}</span>` : ''}` +
+                             `${questao.area_conhecimento ? `<span class="tag tag-area">${escapeHtml(questao.area_conhecimento)}</span>` : ''}`;
+            return `<div class="question-item" data-id="${id}" id="questao-${id}"><div class="selection-checkbox"><input type="checkbox" class="question-checkbox" data-id="${id}"></div>` +
+                   `<div class="question-item-content"><p><strong>#${id}:</strong> ${enunciado}</p><div class="question-tags">${tagsHTML}</div></div>` +
+                   `<button class="delete-btn" data-id="${id}" title="Mover para a Lixeira">${trashIcon}</button></div>`;
+        };
+
+        const loadNextPage = async () => {
+            if (loading || !nextCursor) return;
+            loading = true;
+            // os filtros q/nivel/grau/area vêm da própria URL da página (formulário GET)
+            const params = new URLSearchParams(window.location.search);
+            params.set('view', list.dataset.view);
+            params.set('cursor', nextCursor);
+            try {
+                const response = await fetch(`/api/questoes?${params}`);
+                if (!response.ok) throw new Error('Falha ao carregar mais questões.');
+                const data = await response.json();
+                list.insertAdjacentHTML('beforeend', data.items.map(renderItem).join(''));
+                nextCursor = data.next_cursor ? String(data.next_cursor) : '';
+            } catch (error) {
+                console.error('Erro na paginação:', error);
+                showFlashMessage(error.message, 'error');
+                nextCursor = '';
+            } finally {
+                loading = false;
+            }
+            if (!nextCursor) observer.disconnect();
+        };
+
+        const observer = new IntersectionObserver((entries) => {
+            if (entries.some(entry => entry.isIntersecting)) loadNextPage();
+        }, { rootMargin: '400px' });
+        if (nextCursor) observer.observe(sentinel);
+
+        // links como /banco_questoes#questao-123 podem apontar para uma página ainda não carregada
+        const targetId = window.location.hash.startsWith('#questao-') ? window.location.hash.slice(1) : null;
+        if (targetId && !document.getElementById(targetId)) {
+            (async () => {
+                for (let i = 0; i < 20 && nextCursor && !document.getElementById(targetId); i++) await loadNextPage();
+                document.getElementById(targetId)?.scrollIntoView({ block: 'center' });
+            })();
+        }
+    };
+
     // ===================================
     // MÓDULO: MODAL DE VISUALIZAÇÃO/EDIÇÃO
     // ===================================
@@ -429,7 +515,7 @@ document.addEventListener('DOMContentLoaded', () => {
                         currentQuestionData.opcoes.forEach(op => {
                             const li = document.createElement('li');
                             if (op.imagem_url) {
-                                li.innerHTML = `<img src="${op.imagem_url}" alt="Opção" style="max-width: 100px; max-height: 100px;">`;
+                                li.innerHTML = `<img src="${op.miniatura_url || op.imagem_url}" alt="Opção" style="max-width: 100px; max-height: 100px;">`;
                             }
                             if (op.texto_opcao) {
                                 li.innerHTML += `<p>${op.texto_opcao}</p>`;
@@ -475,6 +561,7 @@ document.addEventListener('DOMContentLoaded', () => {
                         <div class="form-group dynamic-option">
                             <label>Opção ${String.fromCharCode(64 + optionCount)}</label>
                             <div class="option-input-group">
+                                <input type="hidden" name="opcoes_id[]" value="${opcao.id || ''}">
                                 <input type="text" name="opcoes_texto[]" value="${optionText}" placeholder="Texto da opção">
                                 <label class="correct-answer-label">
                                     <input type="${inputType}" name="respostas_corretas[]" value="${index}" ${isChecked}>
@@ -530,6 +617,11 @@ document.addEventListener('DOMContentLoaded', () => {
             const editQuestionForm = document.getElementById('editQuestionForm');
             editQuestionForm?.addEventListener('submit', async (e) => {
                 e.preventDefault();
+                // "correta" é enviada pela posição da opção: renumera depois de remoções/inclusões
+                editQuestionForm.querySelectorAll('.dynamic-option').forEach((option, position) => {
+                    const correctInput = option.querySelector('input[name="respostas_corretas[]"]');
+                    if (correctInput) correctInput.value = position;
+                });
                 const formData = new FormData(editQuestionForm);
                 try {
                     const response = await fetch(editQuestionForm.action, {
@@ -639,19 +731,68 @@ document.addEventListener('DOMContentLoaded', () => {
         const chatMessages = document.getElementById('chat-messages');
         if (!chatForm || !chatInput || !chatMessages) return;
 
-        let conversationHistory = [];
+        // Conversa atual (guardada no servidor) e cursor da página de mensagens mais antigas
+        let conversaId = chatMessages.dataset.conversaId || null;
+        let olderCursor = null;
+        let loadingOlder = false;
+        const greeting = chatMessages.firstElementChild;
 
-        const addMessage = (sender, message) => {
+        const makeMessageElement = (sender, message) => {
             const messageElement = document.createElement('div');
             // ATUALIZAÇÃO: usa innerHTML para renderizar markdown como **negrito**
             messageElement.classList.add(sender === 'user' ? 'user-message' : 'ai-message');
             // Simples substituição de markdown para negrito
             const formattedMessage = message.replace(/\*\*(.*?)\*\*/g, '<strong>$1</strong>');
             messageElement.innerHTML = formattedMessage.replace(/\n/g, '<br>');
-            chatMessages.appendChild(messageElement);
+            return messageElement;
+        };
+
+        const addMessage = (sender, message) => {
+            chatMessages.appendChild(makeMessageElement(sender, message));
             chatMessages.scrollTop = chatMessages.scrollHeight;
         };
 
+        // Histórico paginado: a primeira página ao abrir, as anteriores ao rolar até o topo
+        const loadMessages = async (cursor) => {
+            if (!conversaId || loadingOlder) return;
+            loadingOlder = true;
+            try {
+                const params = new URLSearchParams();
+                if (cursor) params.set('cursor', cursor);
+                const response = await fetch(`/api/conversas/${conversaId}/mensagens?${params}`);
+                if (!response.ok) return;
+                const data = await response.json();
+                const previousHeight = chatMessages.scrollHeight;
+                const anchor = greeting ? greeting.nextSibling : chatMessages.firstChild;
+                // a página vem da mais recente para a mais antiga
+                data.items.slice().reverse().forEach(item => {
+                    chatMessages.insertBefore(makeMessageElement(item.papel === 'usuario' ? 'user' : 'ai', item.conteudo), anchor);
+                });
+                olderCursor = data.next_cursor;
+                chatMessages.scrollTop = cursor ? chatMessages.scrollHeight - previousHeight : chatMessages.scrollHeight;
+            } catch (error) {
+                console.error('Erro ao carregar o histórico do chat:', error);
+            } finally {
+                loadingOlder = false;
+            }
+        };
+
+        chatMessages.addEventListener('scroll', () => {
+            if (chatMessages.scrollTop === 0 && olderCursor) loadMessages(olderCursor);
+        });
+        loadMessages(null);
+
+        const newConversationButton = document.getElementById('chat-new-conversation');
+        if (newConversationButton) {
+            newConversationButton.addEventListener('click', async () => {
+                const response = await fetch('/api/conversas', { method: 'POST' });
+                if (!response.ok) return;
+                conversaId = (await response.json()).id;
+                olderCursor = null;
+                Array.from(chatMessages.children).forEach(child => { if (child !== greeting) child.remove(); });
+            });
+        }
+
         chatForm.addEventListener('submit', async (e) => {
             e.preventDefault();
             const userMessage = chatInput.value.trim();
@@ -667,20 +808,68 @@ document.addEventListener('DOMContentLoaded', () => {
             chatMessages.scrollTop = chatMessages.scrollHeight;
 
             try {
-                const response = await fetch('/api/chat', {
+                // Resposta em streaming (Server-Sent Events): os trechos do modelo aparecem à medida que chegam
+                const response = await fetch('/api/chat/stream', {
                     method: 'POST',
-                    headers: { 'Content-Type': 'application/json' },
-                    body: JSON.stringify({ message: userMessage }),
+                    headers: { 'Content-Type': 'application/json', 'Accept': 'text/event-stream' },
+                    body: JSON.stringify({ message: userMessage, conversa_id: conversaId }),
                 });
 
-                chatMessages.removeChild(typingIndicator);
-
-                if (!response.ok) {
-                    throw new Error('Erro na comunicação com a IA.');
+                const isStream = (response.headers.get('Content-Type') || '').startsWith('text/event-stream');
+                if (!isStream || !response.body) {
+                    chatMessages.removeChild(typingIndicator);
+                    const data = await response.json().catch(() => ({}));
+                    if (!response.ok && !data.message) throw new Error('Erro na comunicação com a IA.');
+                    if (data.conversa_id) conversaId = data.conversa_id;
+                    addMessage('ai', data.message);
+                    return;
                 }
 
-                const data = await response.json();
-                addMessage('ai', data.message);
+                let messageElement = null;
+                let text = '';
+                const render = () => {
+                    if (!messageElement) {
+                        chatMessages.removeChild(typingIndicator);
+                        messageElement = document.createElement('div');
+                        messageElement.classList.add('ai-message');
+                        chatMessages.appendChild(messageElement);
+                    }
+                    messageElement.innerHTML = text.replace(/\*\*(.*?)\*\*/g, '<strong>$1</strong>').replace(/\n/g, '<br>');
+                    chatMessages.scrollTop = chatMessages.scrollHeight;
+                };
+
+                const reader = response.body.getReader();
+                const decoder = new TextDecoder();
+                let buffer = '';
+                let finished = false;
+                while (!finished) {
+                    const { value, done } = await reader.read();
+                    if (done) break;
+                    buffer += decoder.decode(value, { stream: true });
+                    let boundary;
+                    while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                        const raw = buffer.slice(0, boundary);
+                        buffer = buffer.slice(boundary + 2);
+                        let event = 'message';
+                        let data = '';
+                        raw.split('\n').forEach(line => {
+                            if (line.startsWith('event:')) event = line.slice(6).trim();
+                            else if (line.startsWith('data:')) data += line.slice(5).trim();
+                        });
+                        const payload = data ? JSON.parse(data) : {};
+                        if (event === 'token') {
+                            text += payload.text;
+                            render();
+                        } else if (event === 'message' || event === 'error') {
+                            text = payload.message || '';
+                            render();
+                        } else if (event === 'done') {
+                            if (payload.conversa_id) conversaId = payload.conversa_id;
+                            finished = true;
+                        }
+                    }
+                }
+                if (!messageElement) throw new Error('Resposta vazia da IA.');
 
             } catch (error) {
                 console.error('Erro no chat com IA:', error);
@@ -798,6 +987,7 @@ document.addEventListener('DOMContentLoaded', () => {
     setupInteractiveSearch();
     setupQuestionForm();
     setupSelectionAndExport();
+    setupInfiniteScroll();
     setupQuestionModal();
     setupAIChat();
 });
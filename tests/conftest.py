@@ -0,0 +1,141 @@
+import os
+import sys
+
+import psycopg2
+import pytest
+from psycopg2 import extensions
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db  # noqa: E402
+
+
+class Row(dict):
+    """Linha que aceita índice e nome de coluna, como as do DictCursor."""
+
+    def __getitem__(self, key):
+        if isinstance(key, int):
+            return list(self.values())[key]
+        return dict.__getitem__(self, key)
+
+
+class FakeDB:
+    """Banco em memória com só as tabelas do chat (conversas e conversa_mensagens),
+    para usar como handler de FakeConn."""
+
+    def __init__(self):
+        self.conversas = {}
+        self.mensagens = []
+
+    def run(self, sql, params):
+        sql = ' '.join(sql.split())
+        if sql.startswith('INSERT INTO conversas '):
+            conversa_id = len(self.conversas) + 1
+            self.conversas[conversa_id] = {'id': conversa_id, 'usuario_id': params[0], 'titulo': params[1],
+                                           'resumo': None, 'resumo_ate': 0}
+            return [Row(id=conversa_id)]
+        if sql.startswith('SELECT id, titulo, resumo, resumo_ate FROM conversas'):
+            conversa = self.conversas.get(params[0])
+            if not conversa or conversa['usuario_id'] != params[1]:
+                return []
+            return [Row((k, conversa[k]) for k in ('id', 'titulo', 'resumo', 'resumo_ate'))]
+        if sql.startswith('INSERT INTO conversa_mensagens'):
+            self.mensagens.append({'id': len(self.mensagens) + 1, 'conversa_id': params[0],
+                                   'papel': params[1], 'conteudo': params[2]})
+            return [Row(id=len(self.mensagens))]
+        if sql.startswith('SELECT id, papel, conteudo FROM conversa_mensagens'):
+            rows = [m for m in reversed(self.mensagens) if m['conversa_id'] == params[0] and m['id'] > params[1]]
+            return [Row(id=m['id'], papel=m['papel'], conteudo=m['conteudo']) for m in rows[:params[2]]]
+        return []
+
+
+class FakeCursor:
+    """Cursor falso: grava cada consulta em `executed` (SQL com espaços normalizados, params)
+    e a responde com `handler(sql, params)` ou, sem handler, com o próximo resultado da fila.
+
+    FakeCursor([linha, ...], [...]) responde a primeira consulta com a primeira lista, a
+    segunda com a segunda e assim por diante; consultas além da fila não retornam linhas.
+    """
+
+    def __init__(self, *results, handler=None, connection=None):
+        self.results = list(results)
+        self.handler = handler
+        self.connection = connection
+        self.executed = []
+        self.rows = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def execute(self, sql, params=None):
+        if self.connection is not None and not self.connection.healthy:
+            raise psycopg2.OperationalError('conexão perdida')
+        sql = ' '.join(sql.split())
+        self.executed.append((sql, params))
+        if self.handler is not None:
+            rows = self.handler(sql, params)
+        else:
+            rows = self.results.pop(0) if self.results else []
+        self.rows = list(rows)
+
+    def fetchone(self):
+        return self.rows.pop(0) if self.rows else None
+
+    def fetchall(self):
+        rows, self.rows = self.rows, []
+        return rows
+
+    def close(self):
+        pass
+
+
+class FakeConn:
+    """Conexão falsa: os cursores compartilham a fila de resultados, o handler e `executed`.
+    Com `healthy` False, qualquer consulta falha como uma conexão perdida."""
+
+    def __init__(self, *results, handler=None):
+        self.results = list(results)
+        self.handler = handler
+        self.executed = []
+        self.healthy = True
+        self.closed = 0
+        self.commits = 0
+
+    def cursor(self, *args, **kwargs):
+        cursor = FakeCursor(handler=self.handler, connection=self)
+        cursor.results = self.results
+        cursor.executed = self.executed
+        return cursor
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.closed = 1
+
+    def get_transaction_status(self):
+        return extensions.TRANSACTION_STATUS_IDLE
+
+
+@pytest.fixture(scope='module')
+def appmod(tmp_path_factory):
+    base = tmp_path_factory.mktemp('app')
+    os.environ.setdefault('SESSION_SQLITE_PATH', str(base / 'sessoes.sqlite3'))
+    os.environ.setdefault('MEDIA_ROOT', str(base / 'midia'))
+    os.environ.setdefault('EXPORT_CACHE_DIR', str(base / 'exportacoes'))
+    fake = FakeDB()
+    pool = db.ConnectionPool(min_size=0, max_size=4, connect_fn=lambda: FakeConn(handler=fake.run))
+    get_pool = db.get_pool
+    db.get_pool = lambda: pool
+    import app
+    app.app.config['TESTING'] = True
+    app.fake_db = fake
+    yield app
+    db.get_pool = get_pool
+    pool.closeall()
@@ -0,0 +1,66 @@
+import pytest
+
+import ai_json
+
+
+def chunks(text, size=7):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+@pytest.mark.parametrize('text,value,repair', [
+    ('{"a": 1}', {'a': 1}, None),
+    ('```json\n{"a": 1}\n```', {'a': 1}, None),
+    ('Claro! {"a": 1} Espero ter ajudado.', {'a': 1}, 'texto_extra'),
+    ("{'a': 'b'}", {'a': 'b'}, 'aspas_simples'),
+    ('{"a": True, "b": None}', {'a': True, 'b': None}, 'literal_python'),
+    ('{"a": [1, 2,],}', {'a': [1, 2]}, 'virgula_final'),
+    ('{a: 1}', {'a': 1}, 'chave_sem_aspas'),
+    ('[1 2]', [1, 2], 'virgula_ausente'),
+    ('{"a": "b" "c": "d"}', {'a': 'b', 'c': 'd'}, 'virgula_ausente'),
+    ('[{"a": 1} {"b": 2}]', [{'a': 1}, {'b': 2}], 'virgula_ausente'),
+    ('[{"a": 1}]]', [{'a': 1}], None),
+    ('{"enunciado": "x", "opcoes": [{"texto_opcao": "a"}, {"texto_op', {'enunciado': 'x', 'opcoes': [{'texto_opcao': 'a'}]},
+     'truncado'),
+    ('Segue a questão {sobre frações}: {"enunciado": "x"}', {'enunciado': 'x'}, 'texto_extra'),
+    ('Veja {a seguir}: [1, 2]', [1, 2], 'texto_extra'),
+])
+def test_extract(text, value, repair):
+    resultado, repairs = ai_json.extract(text)
+    assert resultado == value
+    if repair:
+        assert repair in repairs
+
+
+def test_extract_without_json():
+    assert ai_json.extract('sem json aqui') == (None, set())
+
+
+def test_first_value_stops_at_the_first_object():
+    lidos = []
+
+    def stream():
+        for c in chunks('{"a": 1} e mais texto que não precisa ser lido'):
+            lidos.append(c)
+            yield c
+
+    assert ai_json.first_value(stream())[0] == {'a': 1}
+    assert len(lidos) < len(chunks('{"a": 1} e mais texto que não precisa ser lido'))
+
+
+def test_first_value_skips_braces_in_prose():
+    texto = 'Segue a questão {sobre frações}: {"enunciado": "Quanto é 1/2 + 1/4?"} Boa sorte!'
+    assert ai_json.first_value(chunks(texto))[0] == {'enunciado': 'Quanto é 1/2 + 1/4?'}
+
+
+def test_iter_array_items_streams_and_repairs_truncation():
+    texto = 'Aqui está [a lista]: [{"a": 1}, {"b": 2} {"c": 3}, {"d": [1, 2'
+    itens = [valor for valor, _ in ai_json.iter_array_items(chunks(texto))]
+    assert itens == [{'a': 1}, {'b': 2}, {'c': 3}, {'d': [1]}]
+
+
+def test_record_outcome_counts_avoided_retries():
+    antes = ai_json.stats()['retries_evitados']
+    _, repairs = ai_json.extract("{'a': 1}")
+    ai_json.record_outcome(repairs, valid=True)
+    ai_json.record_outcome(set(), valid=True)
+    assert ai_json.stats()['retries_evitados'] == antes + 1
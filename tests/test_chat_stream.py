@@ -0,0 +1,123 @@
+import json
+import re
+import threading
+import time
+
+import pytest
+
+import llm
+
+
+@pytest.fixture
+def client(appmod, monkeypatch):
+    monkeypatch.setattr(llm, '_backend', llm.FakeBackend(0))
+    client = appmod.app.test_client()
+    with client.session_transaction() as sess:
+        sess['user_id'] = 1
+        sess['user_nome'] = 'Ana'
+    return client
+
+
+def events(body):
+    """[(evento, dados)] de um corpo text/event-stream."""
+    found = re.findall(r'event: (\w+)\ndata: (.*)\n\n', body)
+    assert ''.join(f'event: {e}\ndata: {d}\n\n' for e, d in found) == body
+    return [(e, json.loads(d)) for e, d in found]
+
+
+def free_slots():
+    return llm._slots._value
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_tokens_then_done_and_reply_is_saved(client, appmod):
+    # "obrigado" é resolvido pelas regras locais: o único uso do modelo é o streaming
+    resp = client.post('/api/chat/stream', json={'message': 'obrigado!'})
+    assert resp.status_code == 200
+    assert resp.mimetype == 'text/event-stream'
+    recebidos = events(resp.get_data(as_text=True))
+    assert [e for e, _ in recebidos[:-1]] == ['token'] * (len(recebidos) - 1)
+    texto = ''.join(d['text'] for _, d in recebidos[:-1])
+    assert texto == 'Resposta de teste para: obrigado!'
+    evento, dados = recebidos[-1]
+    assert evento == 'done' and dados['conversa_id'] is not None
+    salvas = [(m['papel'], m['conteudo']) for m in appmod.fake_db.mensagens
+              if m['conversa_id'] == dados['conversa_id']]
+    assert salvas[-2:] == [('usuario', 'obrigado!'), ('assistente', texto)]
+
+
+def test_ready_answer_is_a_single_message_event(client):
+    # busca: a resposta sai do banco (vazio aqui), sem passar pelo modelo
+    resp = client.post('/api/chat/stream', json={'message': 'busque questões sobre fotossíntese'})
+    assert resp.status_code == 200
+    recebidos = events(resp.get_data(as_text=True))
+    assert [e for e, _ in recebidos] == ['message', 'done']
+    assert recebidos[0][1]['message'].startswith("Não encontrei nenhuma questão sobre 'fotossíntese'")
+
+
+def test_model_failure_mid_stream_is_an_error_event(client, monkeypatch):
+    class Falha(llm.FakeBackend):
+        def stream(self, prompt):
+            yield 'Começo '
+            raise RuntimeError('conexão perdida')
+
+    monkeypatch.setattr(llm, '_backend', Falha(0))
+    antes = free_slots()
+    recebidos = events(client.post('/api/chat/stream', json={'message': 'obrigado!'}).get_data(as_text=True))
+    assert [e for e, _ in recebidos] == ['token', 'error']
+    assert recebidos[0][1] == {'text': 'Começo '}
+    assert wait_for(lambda: free_slots() == antes)
+
+
+def test_full_pool_answers_503(client):
+    ocupadas = 0
+    while llm._slots.acquire(blocking=False):
+        ocupadas += 1
+    try:
+        resp = client.post('/api/chat/stream', json={'message': 'obrigado!'})
+    finally:
+        for _ in range(ocupadas):
+            llm._slots.release()
+    assert resp.status_code == 503
+    assert resp.get_json()['message'].startswith('O assistente está ocupado')
+
+
+class Lento(llm.FakeBackend):
+    """Gera trechos até alguém cancelar; conta quantos chegou a produzir."""
+
+    def __init__(self):
+        super().__init__(0)
+        self.produzidos = 0
+        self.fim = threading.Event()
+
+    def stream(self, prompt):
+        try:
+            for i in range(500):
+                self.produzidos += 1
+                time.sleep(0.01)
+                yield f'trecho {i} '
+        finally:
+            self.fim.set()
+
+
+@pytest.mark.parametrize('lidos', [0, 1])
+def test_disconnect_releases_the_slot(client, monkeypatch, lidos):
+    backend = Lento()
+    monkeypatch.setattr(llm, '_backend', backend)
+    antes = free_slots()
+    resp = client.post('/api/chat/stream', json={'message': 'obrigado!'}, buffered=False)
+    corpo = iter(resp.response)
+    for _ in range(lidos):
+        assert next(corpo).startswith(b'event: token')
+    assert free_slots() == antes - 1
+    # o cliente vai embora: o WSGI server fecha a resposta
+    resp.close()
+    assert wait_for(lambda: free_slots() == antes)
+    assert backend.fim.wait(2)
+    assert backend.produzidos < 500
@@ -0,0 +1,40 @@
+import conversations
+from conftest import FakeCursor
+
+
+def mensagens(*conteudos):
+    # da mais recente para a mais antiga, como a consulta de build_context
+    total = len(conteudos)
+    return [{'id': total - i, 'papel': 'usuario' if i % 2 else 'assistente', 'conteudo': c}
+            for i, c in enumerate(conteudos)]
+
+
+CONVERSA = {'id': 1, 'resumo': None, 'resumo_ate': 0}
+
+
+def test_context_keeps_recent_messages_in_order():
+    texto, resumir_ate = conversations.build_context(FakeCursor(mensagens('c', 'b', 'a')), CONVERSA)
+    assert texto == 'Mensagens recentes:\nAssistente: a\nUsuário: b\nAssistente: c'
+    assert resumir_ate is None
+
+
+def test_oversized_newest_message_uses_up_the_budget(monkeypatch):
+    monkeypatch.setattr(conversations, 'CONTEXT_TOKENS', 200)
+    rows = mensagens('x' * 4000, 'y' * 400, 'z' * 400)
+    texto, _ = conversations.build_context(FakeCursor(rows), CONVERSA)
+    assert 'y' not in texto and 'z' not in texto
+    assert conversations.estimate_tokens(texto) <= 200 + 10
+
+
+def test_prompt_size_is_bounded():
+    rows = mensagens(*['m' * 1000] * 30)
+    texto, resumir_ate = conversations.build_context(FakeCursor(rows), {'id': 1, 'resumo': 'r' * 5000,
+                                                                         'resumo_ate': 0})
+    assert conversations.estimate_tokens(texto) <= conversations.CONTEXT_TOKENS + 10
+    assert resumir_ate is not None
+
+
+def test_truncate_tokens():
+    assert conversations.truncate_tokens('abc', 10) == 'abc'
+    cortado = conversations.truncate_tokens('a' * 100, 5)
+    assert len(cortado) == 20 and cortado.endswith('…')
@@ -0,0 +1,42 @@
+import pytest
+from flask import session
+
+
+@pytest.fixture
+def carregados(appmod, monkeypatch):
+    lidos = []
+
+    def load_user(user_id):
+        lidos.append(user_id)
+        return {'id': user_id}
+
+    monkeypatch.setattr(appmod, '_load_user', load_user)
+    monkeypatch.setattr(appmod, 'USER_CACHE_MAX', 3)
+    monkeypatch.setattr(appmod, '_user_cache', type(appmod._user_cache)())
+    return lidos
+
+
+def current_user(appmod, user_id):
+    with appmod.app.test_request_context():
+        session['user_id'] = user_id
+        return appmod.get_current_user()
+
+
+def test_user_is_cached_between_requests(appmod, carregados):
+    assert current_user(appmod, 1) == {'id': 1}
+    assert current_user(appmod, 1) == {'id': 1}
+    assert carregados == [1]
+
+
+def test_cache_is_bounded_and_evicts_least_recently_used(appmod, carregados):
+    for user_id in (1, 2, 3):
+        current_user(appmod, user_id)
+    current_user(appmod, 1)  # 1 volta a ser o mais recente; 2 é o mais antigo
+    current_user(appmod, 4)
+    assert list(appmod._user_cache) == [3, 1, 4]
+    for user_id in range(5, 50):
+        current_user(appmod, user_id)
+    assert len(appmod._user_cache) == 3
+    carregados.clear()
+    current_user(appmod, 2)
+    assert carregados == [2]
@@ -0,0 +1,117 @@
+import threading
+import time
+
+import pytest
+
+import db
+from conftest import FakeConn
+
+
+def make_pool(**kwargs):
+    kwargs.setdefault('min_size', 0)
+    kwargs.setdefault('max_size', 2)
+    kwargs.setdefault('timeout', 1.0)
+    return db.ConnectionPool(connect_fn=FakeConn, **kwargs)
+
+
+def test_reuses_idle_connections():
+    pool = make_pool()
+    conn = pool.getconn()
+    pool.putconn(conn)
+    assert pool.getconn() is conn
+    assert pool.stats()['created'] == 1
+
+
+def test_times_out_when_exhausted():
+    pool = make_pool(max_size=1, timeout=0.05)
+    pool.getconn()
+    with pytest.raises(db.PoolTimeout):
+        pool.getconn()
+    assert pool.stats()['timeouts'] == 1
+
+
+def test_stale_connection_is_replaced_without_exceeding_max_size():
+    abrindo = threading.Event()
+    liberar = threading.Event()
+    abertas = []
+
+    def slow_connect():
+        conn = FakeConn()
+        abertas.append(conn)
+        if len(abertas) == 2:
+            # a reconexão da entrada inválida demora: ninguém pode ocupar o lugar dela
+            abrindo.set()
+            liberar.wait(5)
+        return conn
+
+    pool = db.ConnectionPool(min_size=0, max_size=1, timeout=0.2, healthcheck_interval=0,
+                             connect_fn=slow_connect)
+    stale = pool.getconn()
+    stale.healthy = False
+    pool.putconn(stale)
+
+    resultado = {}
+    t = threading.Thread(target=lambda: resultado.setdefault('conn', pool.getconn()))
+    t.start()
+    assert abrindo.wait(5)
+    with pytest.raises(db.PoolTimeout):
+        pool.getconn()
+    liberar.set()
+    t.join(5)
+
+    assert stale.closed
+    assert resultado['conn'] is abertas[1]
+    stats = pool.stats()
+    assert (stats['created'], stats['discarded_stale'], stats['in_use']) == (2, 1, 1)
+
+
+def test_failed_connect_releases_the_slot():
+    falhas = [True]
+
+    def connect():
+        if falhas.pop() if falhas else False:
+            raise db.psycopg2.OperationalError('sem banco')
+        return FakeConn()
+
+    pool = db.ConnectionPool(min_size=0, max_size=1, timeout=0.05, connect_fn=connect)
+    with pytest.raises(db.psycopg2.OperationalError):
+        pool.getconn()
+    assert pool.getconn() is not None
+
+
+def test_schema_registry_survives_concurrent_invalidate(monkeypatch):
+    registry = db.SchemaRegistry()
+    leituras = []
+
+    def refresh():
+        leituras.append(1)
+        snapshot = {'usuarios': frozenset({'id', 'email'})}
+        with registry._lock:
+            registry._columns = snapshot
+            registry._loaded_at = time.monotonic()
+        # outra thread invalida logo depois da recarga
+        registry.invalidate()
+        return snapshot
+
+    monkeypatch.setattr(registry, 'refresh', refresh)
+    assert registry.columns('usuarios') == {'id', 'email'}
+    assert registry.columns('usuarios') == {'id', 'email'}
+    assert registry.columns('inexistente') == frozenset()
+    assert len(leituras) == 3
+
+
+def test_schema_registry_caches_until_ttl(monkeypatch):
+    registry = db.SchemaRegistry(ttl=60)
+    leituras = []
+
+    def refresh():
+        leituras.append(1)
+        with registry._lock:
+            registry._columns = {'t': frozenset({'a'})}
+            registry._loaded_at = time.monotonic()
+        return registry._columns
+
+    monkeypatch.setattr(registry, 'refresh', refresh)
+    for _ in range(3):
+        assert registry.has('t', 'a')
+    assert len(leituras) == 1
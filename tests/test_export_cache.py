@@ -0,0 +1,50 @@
+import os
+import time
+
+import export_cache
+
+
+def test_key_ignores_order_but_not_versions():
+    a = export_cache.cache_key('docx', {}, [{'id': 1, 'versao': 1}, {'id': 2, 'versao': 1}])
+    b = export_cache.cache_key('docx', {}, [{'id': 2, 'versao': 1}, {'id': 1, 'versao': 1}])
+    assert a == b
+    assert a != export_cache.cache_key('docx', {}, [{'id': 1, 'versao': 2}, {'id': 2, 'versao': 1}])
+    assert a != export_cache.cache_key('pdf', {}, [{'id': 1, 'versao': 1}, {'id': 2, 'versao': 1}])
+
+
+def test_add_and_open(tmp_path):
+    cache = export_cache.ExportCache(str(tmp_path / 'cache'), 1000)
+    src = tmp_path / 'prova.docx'
+    src.write_bytes(b'conteudo')
+    assert cache.open('k', 'docx') is None
+    cache.add('k', 'docx', str(src))
+    assert src.exists()
+    with cache.open('k', 'docx') as f:
+        assert f.read() == b'conteudo'
+    assert [n for n in os.listdir(cache.root) if n.startswith('.tmp-')] == []
+
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = export_cache.ExportCache(str(tmp_path), 250)
+    antigo = time.time() - 100
+    for i, nome in enumerate(('a', 'b')):
+        tmp = cache.temp_path()
+        with open(tmp, 'wb') as f:
+            f.write(b'x' * 100)
+        cache.put_file(nome, 'pdf', tmp)
+        os.utime(cache.path(nome, 'pdf'), (antigo + i, antigo + i))
+    # acesso renova o mtime de "a": "b" passa a ser o menos usado
+    cache.open('a', 'pdf').close()
+    tmp = cache.temp_path()
+    with open(tmp, 'wb') as f:
+        f.write(b'x' * 100)
+    cache.put_file('c', 'pdf', tmp)
+    assert sorted(os.listdir(tmp_path)) == ['a.pdf', 'c.pdf']
+
+
+def test_clear_stale_temp(tmp_path):
+    cache = export_cache.ExportCache(str(tmp_path), 1000)
+    velho, novo = cache.temp_path(), cache.temp_path()
+    os.utime(velho, (time.time() - 7200, time.time() - 7200))
+    cache.clear_stale_temp(max_age=3600)
+    assert not os.path.exists(velho) and os.path.exists(novo)
@@ -0,0 +1,51 @@
+import os
+import subprocess
+import sys
+
+import export_jobs
+
+
+class FakePopen:
+    def __init__(self, args):
+        self.args = args
+        self.returncode = None
+
+    def poll(self):
+        return self.returncode
+
+    def terminate(self):
+        self.returncode = -15
+
+    def kill(self):
+        self.returncode = -9
+
+    def wait(self, timeout=None):
+        return self.returncode
+
+
+def test_embedded_workers_get_parent_pid_and_are_stopped(monkeypatch):
+    monkeypatch.setattr(export_jobs, 'EMBEDDED_WORKERS', 2)
+    monkeypatch.setattr(export_jobs.subprocess, 'Popen', FakePopen)
+    monkeypatch.setattr(export_jobs.atexit, 'register', lambda fn: None)
+
+    export_jobs.ensure_workers()
+    export_jobs.ensure_workers()
+    workers = list(export_jobs._workers)
+
+    assert len(workers) == 2
+    assert all(w.args[-2:] == ['--parent-pid', str(os.getpid())] for w in workers)
+    export_jobs.stop_workers()
+    assert [w.returncode for w in workers] == [-15, -15]
+    assert export_jobs._workers == []
+
+
+def test_orphaned_worker_exits(tmp_path):
+    # pai "inexistente": o worker sai antes de abrir conexões com o banco
+    code = ("import export_jobs, export_cache\n"
+            "export_cache.get_cache = lambda: type('C', (), {'clear_stale_temp': lambda self: None})()\n"
+            "export_jobs.run_worker(parent_pid=-1)\n")
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, timeout=30,
+                            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                            env=dict(os.environ, MEDIA_BACKEND='local', MEDIA_ROOT=str(tmp_path)))
+    assert result.returncode == 0, result.stderr
+    assert 'encerrado' in result.stdout
@@ -0,0 +1,144 @@
+import io
+import re
+import zipfile
+from xml.etree import ElementTree
+
+import pytest
+from PIL import Image
+
+import exporters
+
+
+def png(color, size=(40, 30)):
+    out = io.BytesIO()
+    Image.new('RGB', size, color).save(out, 'PNG')
+    return out.getvalue()
+
+
+IMAGENS = {'azul': png('blue'), 'verde': png('green')}
+
+
+def load_image(hash_, legado):
+    return IMAGENS[hash_]
+
+
+def questao(id_, tipo='ESCOLHA_UNICA', corretas=(0,), n_opcoes=4, enunciado=None, imagem=None,
+            imagens_opcoes=()):
+    return {
+        'id': id_, 'enunciado': enunciado or f'Enunciado da questão {id_}', 'tipo_questao': tipo,
+        'nivel_dificuldade': 'Fácil', 'grau_ensino': 'Ensino Médio', 'area_conhecimento': 'Matemática',
+        'variante_hash': imagem, 'imagem_url': None,
+        'opcoes': [] if tipo == 'DISCURSIVA' else [
+            {'texto_opcao': f'Opção {i + 1}', 'is_correta': i in corretas,
+             'variante_hash': imagens_opcoes[i] if i < len(imagens_opcoes) else None, 'imagem_url': None}
+            for i in range(n_opcoes)],
+    }
+
+
+# --- PDF ---
+
+def test_pdf_xref_points_at_every_object():
+    questoes = [questao(i, imagem='azul' if i % 3 == 0 else None,
+                        imagens_opcoes=('verde',) if i % 5 == 0 else ())
+                for i in range(1, 41)]
+    out = io.BytesIO()
+    exporters.build_pdf(questoes, load_image, out, gabarito=True, colunas=2)
+    data = out.getvalue()
+    assert data.startswith(b'%PDF-') and data.rstrip().endswith(b'%%EOF')
+
+    xref = int(re.search(rb'startxref\n(\d+)\n%%EOF', data).group(1))
+    assert data[xref:].startswith(b'xref\n')
+    total = int(re.match(rb'xref\n0 (\d+)\n', data[xref:]).group(1))
+    entradas = re.findall(rb'(\d{10}) 00000 n ', data[xref:])
+    assert len(entradas) == total - 1
+    for numero, offset in enumerate(entradas, start=1):
+        assert data[int(offset):].startswith(f'{numero} 0 obj'.encode()), numero
+
+    paginas = re.findall(rb'<</Type /Page\n', data)
+    count = int(re.search(rb'/Count (\d+)', data).group(1))
+    kids = re.search(rb'/Kids \[([^\]]*)\]', data).group(1).split(b' 0 R')
+    assert count == len(paginas) == len([k for k in kids if k.strip()])
+    assert count >= 3
+    # cada imagem vira um único XObject, mesmo usada em várias questões
+    assert len(re.findall(rb'/Subtype /Image', data)) == 2
+
+
+def test_pdf_without_questions_is_still_valid():
+    out = io.BytesIO()
+    exporters.build_pdf([], load_image, out)
+    data = out.getvalue()
+    assert int(re.search(rb'/Count (\d+)', data).group(1)) == 1
+    xref = int(re.search(rb'startxref\n(\d+)', data).group(1))
+    assert data[xref:].startswith(b'xref\n')
+
+
+# --- MOODLE, GIFT, QTI ---
+
+def test_fractions():
+    assert [exporters._fraction(f) for f in exporters._fractions(
+        questao(1, 'MULTIPLA_ESCOLHA', corretas=(0, 1), n_opcoes=4))] == ['50', '50', '-50', '-50']
+    assert [exporters._fraction(f) for f in exporters._fractions(
+        questao(1, 'MULTIPLA_ESCOLHA', corretas=(0, 1, 2), n_opcoes=4))] == ['33.33333'] * 3 + ['-100']
+    assert [exporters._fraction(f) for f in exporters._fractions(
+        questao(1, 'MULTIPLA_ESCOLHA', corretas=(0,), n_opcoes=4))] == ['100'] + ['-33.33333'] * 3
+    assert [exporters._fraction(f) for f in exporters._fractions(
+        questao(1, 'ESCOLHA_UNICA', corretas=(2,), n_opcoes=3))] == ['0', '0', '100']
+    assert exporters._fraction(100 / 3) == '33.33333'
+
+
+QUESTOES = [
+    questao(1, imagem='azul', imagens_opcoes=('verde', 'azul')),
+    questao(2, 'MULTIPLA_ESCOLHA', corretas=(0, 1), imagem='azul'),
+    questao(3, 'DISCURSIVA', enunciado='Explique <a> & "b"'),
+]
+
+
+def build(formato, questoes=QUESTOES):
+    out = io.BytesIO()
+    exporters.get_renderer(formato).build(questoes, load_image, out)
+    return zipfile.ZipFile(io.BytesIO(out.getvalue()))
+
+
+@pytest.mark.parametrize('formato', ['moodle', 'gift', 'qti'])
+def test_images_are_stored_once(formato):
+    nomes = build(formato).namelist()
+    assert len(nomes) == len(set(nomes))
+    assert len([n for n in nomes if n.startswith('imagens/')]) == 2
+
+
+def test_gift_escapes_special_characters():
+    pacote = build('gift', [questao(7, enunciado='a~b=c#d{e}f:g', n_opcoes=2)])
+    gift = pacote.read('questoes.gift').decode('utf-8')
+    assert r'[html]a\~b\=c\#d\{e\}f\:g {' in gift
+    assert '\t=Opção 1\n\t~Opção 2\n}' in gift
+
+
+def test_gift_multiple_choice_uses_percentages():
+    gift = build('gift').read('questoes.gift').decode('utf-8')
+    assert '\t~%50%Opção 1\n\t~%50%Opção 2\n\t~%-50%Opção 3\n\t~%-50%Opção 4\n}' in gift
+
+
+def test_moodle_xml_is_well_formed():
+    raiz = ElementTree.fromstring(build('moodle').read('questoes.xml'))
+    questoes = raiz.findall('question')
+    assert [q.get('type') for q in questoes] == ['multichoice', 'multichoice', 'essay']
+    assert [a.get('fraction') for a in questoes[1].findall('answer')] == ['50', '50', '-50', '-50']
+    assert questoes[2].find('questiontext/text').text == 'Explique &lt;a&gt; &amp; "b"'
+    assert 'imagens/' in questoes[0].find('questiontext/text').text
+
+
+def test_qti_items_and_manifest_are_well_formed():
+    pacote = build('qti')
+    ns = {'cp': 'http://www.imsglobal.org/xsd/imscp_v1p1', 'qti': exporters._QTI_NS}
+    manifesto = ElementTree.fromstring(pacote.read('imsmanifest.xml'))
+    recursos = manifesto.findall('cp:resources/cp:resource', ns)
+    assert [r.get('href') for r in recursos] == ['itens/Q1.xml', 'itens/Q2.xml', 'itens/Q3.xml']
+    for recurso in recursos:
+        for arquivo in recurso.findall('cp:file', ns):
+            assert arquivo.get('href') in pacote.namelist()
+        item = ElementTree.fromstring(pacote.read(recurso.get('href')))
+        assert item.tag == f"{{{exporters._QTI_NS}}}assessmentItem"
+    item = ElementTree.fromstring(pacote.read('itens/Q2.xml'))
+    declaracao = item.find('qti:responseDeclaration', ns)
+    assert declaracao.get('cardinality') == 'multiple'
+    assert [v.text for v in declaracao.findall('qti:correctResponse/qti:value', ns)] == ['C1', 'C2']
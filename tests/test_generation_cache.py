@@ -0,0 +1,87 @@
+import threading
+import time
+
+import generation_cache
+import llm
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+class Produce:
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return {'enunciado': f'questão {self.calls}'}
+
+
+def test_hit_consumes_a_variant_and_refills():
+    cache = generation_cache.GenerationCache(variants=2)
+    produce = Produce()
+    assert cache.get(('k',), produce) == {'enunciado': 'questão 1'}
+    assert wait_for(lambda: cache.stats()['ready_variants'] == 2)
+    assert cache.get(('k',), produce)['enunciado'] == 'questão 2'
+    assert cache.stats()['hits'] == 1
+
+
+def test_identical_requests_share_one_call():
+    cache = generation_cache.GenerationCache(variants=0)
+    liberar = threading.Event()
+    chamadas = []
+
+    def produce():
+        chamadas.append(1)
+        liberar.wait(2)
+        return {'enunciado': 'única'}
+
+    resultados = []
+    threads = [threading.Thread(target=lambda: resultados.append(cache.get(('k',), produce))) for _ in range(3)]
+    for t in threads:
+        t.start()
+    assert wait_for(lambda: cache.stats()['coalesced'] == 2)
+    liberar.set()
+    for t in threads:
+        t.join()
+    assert len(chamadas) == 1
+    assert resultados == [{'enunciado': 'única'}] * 3
+    resultados[0]['enunciado'] = 'alterada'
+    assert resultados[1]['enunciado'] == 'única'
+
+
+def test_refill_backs_off_when_the_model_pool_is_loaded(monkeypatch):
+    carga = [3]
+    monkeypatch.setattr(llm, 'in_flight', lambda: carga[0])
+    cache = generation_cache.GenerationCache(variants=2, refill_max_load=2)
+    produce = Produce()
+    cache.get(('k',), produce)
+    assert wait_for(lambda: cache.stats()['refills_skipped'] == 1)
+    assert produce.calls == 1 and cache.stats()['ready_variants'] == 0
+
+    # com o pool folgado, o próximo pedido volta a repor as variantes
+    carga[0] = 1
+    cache.get(('k',), produce)
+    assert wait_for(lambda: cache.stats()['ready_variants'] == 2)
+    assert produce.calls == 4
+
+
+def test_in_flight_counts_calls_holding_a_slot(monkeypatch):
+    class Lento(llm.FakeBackend):
+        def generate(self, prompt):
+            liberar.wait(2)
+            return 'ok'
+
+    liberar = threading.Event()
+    monkeypatch.setattr(llm, '_backend', Lento(0))
+    antes = llm.in_flight()
+    t = threading.Thread(target=llm.generate, args=('oi',))
+    t.start()
+    assert wait_for(lambda: llm.in_flight() == antes + 1)
+    liberar.set()
+    t.join()
+    assert wait_for(lambda: llm.in_flight() == antes)
@@ -0,0 +1,127 @@
+import io
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from PIL import Image
+
+import image_fetch
+
+
+def _png(color):
+    out = io.BytesIO()
+    Image.new('RGB', (8, 8), color).save(out, 'PNG')
+    return out.getvalue()
+
+
+PNG_RED = _png('red')
+PNG_BLUE = _png('blue')
+
+
+class Handler(BaseHTTPRequestHandler):
+    """Stand-in local dos sites de imagens: cada caminho simula um caso."""
+
+    state = {}
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, body, content_type='image/png', length=True):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        if length:
+            self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == '/ok.png':
+            self._send(PNG_RED)
+        elif self.path == '/atrasada.png':
+            time.sleep(0.3)
+            self._send(PNG_BLUE)
+        elif self.path == '/pagina.html':
+            self._send(b'<html></html>', 'text/html')
+        elif self.path == '/grande.png':
+            self._send(PNG_RED + b'\0' * 5000)
+        elif self.path == '/grande-sem-tamanho.png':
+            self._send(PNG_RED + b'\0' * 5000, length=False)
+        elif self.path == '/texto-como-imagem.png':
+            self._send(b'isto nao e uma imagem')
+        elif self.path == '/trava.png':
+            time.sleep(2)
+            self._send(PNG_RED)
+        elif self.path == '/lenta.png':
+            # imagem válida enviada aos poucos; registra se chegou a ir inteira
+            self.send_response(200)
+            self.send_header('Content-Type', 'image/png')
+            self.end_headers()
+            self.state['lenta_completa'] = False
+            try:
+                self.wfile.write(PNG_BLUE)
+                for _ in range(100):
+                    time.sleep(0.02)
+                    self.wfile.write(b'\0' * 64 * 1024)
+                    self.wfile.flush()
+                self.state['lenta_completa'] = True
+            except (BrokenPipeError, ConnectionResetError):
+                self.state['lenta_interrompida'] = True
+        else:
+            self.send_error(404)
+
+
+@pytest.fixture
+def server(monkeypatch):
+    monkeypatch.setattr(image_fetch, 'MAX_BYTES', 1000)
+    Handler.state = {}
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    httpd.daemon_threads = True
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    base = f'http://127.0.0.1:{httpd.server_address[1]}'
+    yield base
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_first_valid_image_wins(server):
+    resultado = image_fetch.fetch_first([f'{server}/atrasada.png', f'{server}/ok.png'])
+    assert resultado.url == f'{server}/ok.png'
+    assert resultado.data == PNG_RED and resultado.mime == 'image/png'
+
+
+@pytest.mark.parametrize('caminho', ['/pagina.html', '/grande.png', '/grande-sem-tamanho.png',
+                                     '/texto-como-imagem.png', '/nao-existe.png'])
+def test_invalid_candidates_are_rejected(server, caminho):
+    assert image_fetch.fetch_first([f'{server}{caminho}']) is None
+    resultado = image_fetch.fetch_first([f'{server}{caminho}', f'{server}/atrasada.png'])
+    assert resultado.url == f'{server}/atrasada.png'
+
+
+def test_accept_can_reject_an_image(server):
+    def accept(dados):
+        if dados == PNG_RED:
+            raise ValueError('vermelha não')
+        return 'aceita'
+
+    resultado = image_fetch.fetch_first([f'{server}/ok.png', f'{server}/atrasada.png'], accept=accept)
+    assert (resultado.url, resultado.result) == (f'{server}/atrasada.png', 'aceita')
+
+
+def test_deadline_is_honoured(server):
+    inicio = time.monotonic()
+    assert image_fetch.fetch_first([f'{server}/trava.png'], deadline=0.3) is None
+    assert time.monotonic() - inicio < 1.0
+
+
+def test_other_downloads_are_cancelled(server, monkeypatch):
+    monkeypatch.setattr(image_fetch, 'MAX_BYTES', 50 * 1024 * 1024)
+    inicio = time.monotonic()
+    resultado = image_fetch.fetch_first([f'{server}/lenta.png', f'{server}/atrasada.png'])
+    assert resultado.url == f'{server}/atrasada.png'
+    assert time.monotonic() - inicio < 1.5
+    # a lenta levaria ~2s para terminar; cancelada, o servidor vê a conexão fechada
+    time.sleep(2.5)
+    assert Handler.state.get('lenta_completa') is False
+    assert Handler.state.get('lenta_interrompida')
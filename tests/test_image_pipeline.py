@@ -0,0 +1,28 @@
+import io
+import time
+
+import pytest
+from PIL import Image
+
+import image_pipeline
+
+
+def _png(size=(20, 10), mode='RGBA'):
+    out = io.BytesIO()
+    Image.new(mode, size).save(out, 'PNG')
+    return out.getvalue()
+
+
+def test_normalize_keeps_transparency_as_png():
+    imagem = image_pipeline.run(image_pipeline.normalize, _png())
+    assert (imagem.mime, imagem.width, imagem.height) == ('image/png', 20, 10)
+
+
+def test_normalize_rejects_non_images():
+    with pytest.raises(image_pipeline.InvalidImage):
+        image_pipeline.run(image_pipeline.normalize, b'isto nao e uma imagem')
+
+
+def test_timeout_becomes_invalid_image():
+    with pytest.raises(ValueError, match='demorou'):
+        image_pipeline.run(time.sleep, 0.5, timeout=0.01)
@@ -0,0 +1,64 @@
+import io
+
+import exporters
+import import_questoes
+
+
+def _records(reader, data):
+    return list(reader(io.BytesIO(data)))
+
+
+def test_csv_utf8_with_semicolons():
+    data = ('enunciado;tipo;opcao_a;opcao_b;corretas\n'
+            'Quanto é 2+2?;escolha única;3;4;B\n').encode('utf-8-sig')
+    [(linha, dados, erro)] = _records(import_questoes.read_csv, data)
+    assert erro is None and linha == 2
+    assert dados['enunciado'] == 'Quanto é 2+2?'
+    assert [op['is_correta'] for op in dados['opcoes']] == [False, True]
+
+
+def test_csv_cp1252_from_excel():
+    data = 'enunciado;opcao_a;opcao_b;corretas\nQual é a função?;ação;reação;A\n'.encode('cp1252')
+    [(_, dados, erro)] = _records(import_questoes.read_csv, data)
+    assert erro is None
+    assert dados['enunciado'] == 'Qual é a função?'
+    assert dados['opcoes'][0]['texto_opcao'] == 'ação'
+
+
+def test_csv_mixed_encodings_far_into_the_file():
+    linhas = ['enunciado,opcao_a,opcao_b,corretas'] + [f'Questão {i},a,b,A' for i in range(5000)]
+    data = '\n'.join(linhas).encode('utf-8') + '\nLinha em cp1252: ação,a,b,A\n'.encode('cp1252')
+    records = _records(import_questoes.read_csv, data)
+    assert len(records) == 5001
+    assert all(erro is None for _, _, erro in records)
+    assert records[-1][1]['enunciado'] == 'Linha em cp1252: ação'
+
+
+def test_jsonl_reports_bad_lines():
+    data = b'{"enunciado": "A", "opcoes": ["x", "y"], "corretas": "1"}\n\nnao json\n[1]\n'
+    records = _records(import_questoes.read_jsonl, data)
+    assert [(linha, erro is None) for linha, _, erro in records] == [(1, True), (3, False), (4, False)]
+    assert records[0][1]['opcoes'][0]['is_correta'] is True
+
+
+def test_docx_round_trip_keeps_line_breaks_and_answers():
+    questoes = [
+        {'id': 1, 'enunciado': 'Considere:\nI. x\nII. y\nQual está correta?', 'tipo_questao': 'ESCOLHA_UNICA',
+         'opcoes': [{'texto_opcao': 'Só I', 'is_correta': False}, {'texto_opcao': 'Só II', 'is_correta': True}]},
+        {'id': 2, 'enunciado': 'Marque os primos', 'tipo_questao': 'MULTIPLA_ESCOLHA',
+         'opcoes': [{'texto_opcao': '2', 'is_correta': True}, {'texto_opcao': '3', 'is_correta': True},
+                    {'texto_opcao': '4', 'is_correta': False}]},
+        {'id': 3, 'enunciado': 'Explique a fotossíntese.', 'tipo_questao': 'DISCURSIVA', 'opcoes': []},
+    ]
+    out = io.BytesIO()
+    exporters.build_docx(questoes, lambda *_: b'', out, gabarito=True)
+    out.seek(0)
+
+    records = list(import_questoes.read_docx(out))
+
+    assert [erro for _, _, erro in records] == [None, None, None]
+    lidas = [dados for _, dados, _ in records]
+    assert lidas[0]['enunciado'] == 'Considere:\nI. x\nII. y\nQual está correta?'
+    assert [(op['texto_opcao'], op['is_correta']) for op in lidas[0]['opcoes']] == [('Só I', False), ('Só II', True)]
+    assert [op['is_correta'] for op in lidas[1]['opcoes']] == [True, True, False]
+    assert lidas[2]['tipo_questao'] == 'DISCURSIVA'
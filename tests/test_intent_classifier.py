@@ -0,0 +1,53 @@
+import pytest
+
+import intent_classifier
+
+# (mensagem, questão pendente, intenção resolvida localmente ou None, tópico)
+CASES = [
+    ("crie uma questão sobre o sistema solar", False, 'CREATE', 'sistema solar'),
+    ("Gere 3 questões sobre frações", False, 'CREATE', 'frações'),
+    ("elabore um exercício sobre fotossíntese", False, 'CREATE', 'fotossíntese'),
+    ("crie uma questão sobre como buscar raízes de equações", False, 'CREATE', 'como buscar raízes de equações'),
+    ("buscar questões de frações", False, 'SEARCH', 'frações'),
+    ("busque questões de geografia", False, 'SEARCH', 'geografia'),
+    ("liste as questões sobre a Segunda Guerra", False, 'SEARCH', 'Segunda Guerra'),
+    ("pesquise fotossíntese", False, 'SEARCH', 'fotossíntese'),
+    ("sim", True, 'INSERT', None),
+    ("pode cadastrar essa questão", True, 'INSERT', None),
+    # com questão pendente, pedir outra não é confirmar a atual
+    ("pode gerar outra?", True, None, None),
+    ("ok, gere outra", True, None, None),
+    ("oi", False, 'CHAT', None),
+    # palavras comuns que começam como os verbos não são pedidos
+    ("acho que a questão de frações está errada", False, None, None),
+    ("qual o critério da questão sobre ecologia?", False, None, None),
+    ("tenho uma dúvida na questão sobre geração espontânea", False, None, None),
+    ("me manda uma lista de questões de história", False, None, None),
+    # substantivo antes do verbo: fica para o modelo
+    ("a questão de frações, pode gerar outra parecida?", False, None, None),
+    ("sim", False, None, None),
+]
+
+
+@pytest.mark.parametrize('message,pending,intent,topic', CASES)
+def test_resolve(message, pending, intent, topic):
+    result = intent_classifier.resolve(message, pending)
+    if intent is None:
+        assert result is None
+    else:
+        assert result is not None
+        assert (result.intent, result.topic) == (intent, topic)
+
+
+def test_noun_before_verb_has_low_confidence():
+    result = intent_classifier.classify("a questão de frações, pode gerar outra parecida?")
+    assert result is not None and result.confidence < intent_classifier.THRESHOLD
+
+
+def test_stats_count_local_and_model():
+    antes = intent_classifier.stats()
+    intent_classifier.resolve("crie uma questão sobre vulcões")
+    intent_classifier.resolve("qual o critério da questão sobre ecologia?")
+    depois = intent_classifier.stats()
+    assert depois['locais'] - antes['locais'] == 1
+    assert depois['modelo'] - antes['modelo'] == 1
@@ -0,0 +1,70 @@
+import os
+import time
+
+import media_store
+from conftest import FakeConn
+
+
+def test_local_put_deduplicates(tmp_path):
+    store = media_store.LocalBlobStore(str(tmp_path))
+    key = store.put(b'imagem')
+    assert store.put(b'imagem') == key
+    assert store.get(key) == b'imagem'
+    assert [k for k, _ in store.iter_blobs()] == [key]
+
+
+def test_local_put_hit_refreshes_mtime(tmp_path):
+    store = media_store.LocalBlobStore(str(tmp_path))
+    key = store.put(b'antiga')
+    old = time.time() - 3 * 24 * 3600
+    os.utime(store.path(key), (old, old))
+
+    store.put(b'antiga')
+
+    assert os.path.getmtime(store.path(key)) > time.time() - 60
+    # reenviada agora: ainda dentro da carência, mesmo sem nenhuma linha referenciando
+    assert media_store.collect_garbage(FakeConn(), store) == 0
+    assert store.exists(key)
+
+
+def test_collect_garbage_removes_old_unreferenced(tmp_path):
+    store = media_store.LocalBlobStore(str(tmp_path))
+    usada = store.put(b'usada')
+    solta = store.put(b'solta')
+    old = time.time() - 3 * 24 * 3600
+    for key in (usada, solta):
+        os.utime(store.path(key), (old, old))
+    conn = FakeConn(handler=lambda sql, params: [(usada,)] if 'FROM questoes' in sql else [])
+
+    assert media_store.collect_garbage(conn, store) == 1
+    assert store.exists(usada)
+    assert not store.exists(solta)
+
+
+class FakeS3:
+    def __init__(self):
+        self.objects = {}
+        self.copies = 0
+
+    def head_object(self, Bucket, Key):
+        if Key not in self.objects:
+            error = Exception('not found')
+            error.response = {'Error': {'Code': '404'}}
+            raise error
+
+    def put_object(self, Bucket, Key, Body):
+        self.objects[Key] = Body
+
+    def copy_object(self, Bucket, Key, CopySource, MetadataDirective):
+        assert CopySource == {'Bucket': Bucket, 'Key': Key}
+        self.copies += 1
+
+
+def test_object_store_put_hit_copies_onto_itself():
+    client = FakeS3()
+    store = media_store.ObjectStoreBlobStore(client, 'bucket')
+    key = store.put(b'x')
+    assert client.copies == 0
+    assert store.put(b'x') == key
+    assert client.copies == 1
+    assert len(client.objects) == 1
@@ -0,0 +1,43 @@
+import pytest
+
+import question_batch
+
+
+def test_expand_mix_distributes_quantities_and_round_robin():
+    specs = question_batch.expand_mix(5, [{'tipo': 'discursiva', 'quantidade': 2}, {'tipo': 'multipla escolha'}])
+    assert [s['tipo_questao'] for s in specs] == ['DISCURSIVA', 'DISCURSIVA', 'DISCURSIVA',
+                                                  'MULTIPLA_ESCOLHA', 'DISCURSIVA']
+
+
+def test_expand_mix_caps_quantidade_at_count():
+    specs = question_batch.expand_mix(1, [{'quantidade': 1000000000}, {'quantidade': 1000000000}])
+    assert len(specs) == 1
+
+
+def test_expand_mix_coerces_non_string_values():
+    [spec] = question_batch.expand_mix(1, [{'nivel': 3, 'grau': 9, 'area': ['x'], 'tipo': 7}])
+    assert isinstance(spec['tipo_questao'], str)
+    assert spec['nivel_dificuldade'] == '3' and spec['grau_ensino'] == '9'
+    # o prompt precisa conseguir formatar qualquer especificação
+    assert "9" in question_batch.batch_prompt([spec])
+
+
+@pytest.mark.parametrize('data,erro', [
+    ({'opcoes': ['a', 'b']}, 'enunciado'),
+    ({'enunciado': 'x', 'opcoes': ['a']}, 'duas opções'),
+    ({'enunciado': 'x', 'opcoes': ['a', 'b']}, 'correta'),
+])
+def test_normalize_question_rejects(data, erro):
+    with pytest.raises(ValueError, match=erro):
+        question_batch.normalize_question(data)
+
+
+def test_normalize_question_fixes_common_mistakes():
+    q = question_batch.normalize_question({
+        'enunciado': ' Qual? ', 'tipo_questao': 'escolha única', 'nivel_dificuldade': 'muito dificil',
+        'opcoes': [{'texto_opcao': 'a', 'is_correta': 'sim'}, {'texto': 'b', 'is_correta': True}, 'c'],
+    })
+    assert q['enunciado'] == 'Qual?'
+    assert q['tipo_questao'] == 'ESCOLHA_UNICA'
+    assert q['nivel_dificuldade'] == 'Muito Difícil'
+    assert [op['is_correta'] for op in q['opcoes']] == [True, False, False]
@@ -0,0 +1,49 @@
+from werkzeug.datastructures import FileStorage, MultiDict
+
+import question_options
+from conftest import FakeCursor
+
+
+def sync(rows, opcoes, monkeypatch):
+    chamadas = []
+    monkeypatch.setattr(question_options, 'execute_values',
+                        lambda cursor, sql, valores, template=None: chamadas.append((sql.split()[0], valores)))
+    cursor = FakeCursor(rows)
+    contagens = question_options.sync_options(cursor, 7, opcoes, lambda dados: ('image/png', 'h') if dados
+                                              else (None, None))
+    return contagens, cursor.executed, chamadas
+
+
+def opcao(id, texto, correta=False, imagem=None):
+    return {'id': id, 'texto_opcao': texto, 'is_correta': correta, 'imagem': imagem}
+
+
+def test_only_changed_options_are_written(monkeypatch):
+    rows = [(1, 'a', True, None, False), (2, 'b', False, None, False), (3, 'c', False, None, False)]
+    contagens, executed, chamadas = sync(rows, [opcao(1, 'a', True), opcao(2, 'B'), opcao(None, 'd')], monkeypatch)
+    assert contagens == {'inseridas': 1, 'atualizadas': 1, 'removidas': 1, 'inalteradas': 1}
+    assert executed[-1][1] == (7, [3])
+    assert [tipo for tipo, _ in chamadas] == ['UPDATE', 'INSERT']
+
+
+def test_option_with_only_a_legacy_image_is_kept(monkeypatch):
+    # sem texto e com a imagem só no BYTEA legado: não pode ser tratada como vazia
+    rows = [(1, '', True, None, True), (2, 'b', False, None, False)]
+    contagens, executed, _ = sync(rows, [opcao(1, '', True), opcao(2, 'b')], monkeypatch)
+    assert contagens == {'inseridas': 0, 'atualizadas': 0, 'removidas': 0, 'inalteradas': 2}
+    assert not any(sql.startswith('DELETE') for sql, _ in executed)
+
+
+def test_empty_option_without_image_is_removed(monkeypatch):
+    rows = [(1, 'a', True, None, False), (2, 'b', False, None, False)]
+    contagens, _, _ = sync(rows, [opcao(1, 'a', True), opcao(2, '')], monkeypatch)
+    assert contagens['removidas'] == 1
+
+
+def test_form_options_reads_parallel_lists():
+    import io
+    form = MultiDict([('opcoes_id[]', '5'), ('opcoes_id[]', ''), ('opcoes_texto[]', 'a'),
+                      ('opcoes_texto[]', 'b'), ('respostas_corretas[]', '1')])
+    files = MultiDict([('opcoes_imagem[]', FileStorage(io.BytesIO(b''), filename='')),
+                       ('opcoes_imagem[]', FileStorage(io.BytesIO(b'png'), filename='b.png'))])
+    assert question_options.form_options(form, files) == [opcao(5, 'a'), opcao(None, 'b', True, b'png')]
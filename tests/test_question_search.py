@@ -0,0 +1,37 @@
+import question_search
+from conftest import FakeCursor
+
+
+def test_prefix_tsquery():
+    assert question_search.to_prefix_tsquery('fraç equivalentes') == 'fraç:* & equivalentes:*'
+    assert question_search.to_prefix_tsquery("a|b & !c:*") == 'a:* & b:* & c:*'
+    assert question_search.to_prefix_tsquery('  ?! ') is None
+    assert question_search.to_prefix_tsquery(None) is None
+
+
+def test_match_clause_without_words_matches_everything():
+    assert question_search.match_clause('') == ('TRUE', [])
+    sql, params = question_search.match_clause('células', alias='q')
+    assert sql.startswith('q.busca @@ to_tsquery(') and params == ['células:*']
+
+
+def test_search_uses_full_text_first():
+    cur = FakeCursor([{'id': 3}])
+    assert question_search.search(cur, 'células') == [{'id': 3}]
+    assert len(cur.executed) == 1
+    assert 'ts_rank' in cur.executed[0][0]
+    assert cur.executed[0][1] == ('células:*', True, 10)
+
+
+def test_search_falls_back_to_trigrams():
+    cur = FakeCursor([], [{'id': 7}])
+    assert question_search.search(cur, 'celulas', fuzzy=True) == [{'id': 7}]
+    assert 'word_similarity' in cur.executed[1][0]
+    assert cur.executed[1][1] == (True, 'celulas', 'celulas', 10)
+
+
+def test_search_without_fuzzy_or_words():
+    cur = FakeCursor([])
+    assert question_search.search(cur, 'celulas', fuzzy=False) == []
+    assert len(cur.executed) == 1
+    assert question_search.search(FakeCursor(), '!!') == []
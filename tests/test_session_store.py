@@ -0,0 +1,100 @@
+import time
+
+import pytest
+from flask import Flask, session
+
+import session_store
+
+
+@pytest.fixture
+def store(tmp_path):
+    return session_store.SQLiteSessionStore(str(tmp_path / 'sessoes.sqlite3'))
+
+
+def make_app(store):
+    app = Flask(__name__)
+    app.secret_key = 'teste'
+    app.session_interface = session_store.ServerSessionInterface(store, ttl=3600, sweep_interval=0)
+
+    @app.route('/set/<valor>')
+    def set_value(valor):
+        session['valor'] = valor
+        return 'ok'
+
+    @app.route('/get')
+    def get_value():
+        return session.get('valor', '')
+
+    @app.route('/logout')
+    def logout():
+        session.clear()
+        return 'ok'
+
+    return app
+
+
+def test_cookie_carries_only_the_id(store):
+    client = make_app(store).test_client()
+    response = client.get('/set/' + 'x' * 5000)
+    cookie = response.headers['Set-Cookie'].split(';')[0].split('=', 1)[1]
+    assert len(cookie) == 43
+    assert client.get('/get').get_data(as_text=True) == 'x' * 5000
+
+
+def test_read_only_requests_do_not_write(store):
+    client = make_app(store).test_client()
+    client.get('/set/a')
+    response = client.get('/get')
+    assert response.get_data(as_text=True) == 'a'
+    assert 'Set-Cookie' not in response.headers
+
+
+def test_clear_rotates_the_session_id(store):
+    client = make_app(store).test_client()
+    first = client.get('/set/a').headers['Set-Cookie']
+    sid = first.split(';')[0].split('=', 1)[1]
+    client.get('/logout')
+    assert store.load(sid) is None
+    assert client.get('/get').get_data(as_text=True) == ''
+
+
+def test_sweep_removes_expired(store):
+    store.save('a' * 43, '{}', time.time() - 1)
+    store.save('b' * 43, '{}', time.time() + 60)
+    assert store.sweep() == 1
+    assert store.load('b' * 43) is not None
+
+
+class BrokenStore:
+    def load(self, sid):
+        return None
+
+    def save(self, sid, dados, expira_em):
+        raise RuntimeError('banco fora do ar')
+
+    def delete(self, sid):
+        raise RuntimeError('banco fora do ar')
+
+
+def test_store_errors_do_not_break_the_response():
+    client = make_app(BrokenStore()).test_client()
+    response = client.get('/set/a')
+    assert response.status_code == 200
+    assert 'Set-Cookie' not in response.headers
+
+
+def test_postgres_store_uses_its_own_pool(monkeypatch):
+    import db
+
+    criados = []
+
+    class FakePool:
+        def __init__(self, **kwargs):
+            criados.append(kwargs)
+
+    monkeypatch.setattr(db, 'ConnectionPool', FakePool)
+    monkeypatch.setattr(db, 'get_pool', lambda: pytest.fail('usou o pool dos requests'))
+    store = session_store.PostgresSessionStore()
+    assert store.pool is store.pool
+    assert criados == [{'min_size': 0, 'max_size': session_store.DB_POOL_MAX,
+                        'timeout': session_store.DB_POOL_TIMEOUT}]